@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Agendador das requisicoes REST pelo peso da API (X-MBX-USED-WEIGHT-1M).
+# Todas as requisicoes do processo reservam o seu peso antes de sair; a fila
+# e ordenada por prioridade (ordens, marcacao de posicoes, historico) e cada
+# prioridade so pode usar uma fracao do limite por minuto, de modo que
+# backfill e historico esperam a proxima janela antes de faltar peso para as
+# ordens. O peso usado e corrigido pelo cabecalho de cada resposta, que ja
+# inclui o consumo dos outros processos com o mesmo IP.
+
+ORDEM, MARCACAO, HISTORICO = 0, 1, 2
+NOMES_PRIORIDADE = {ORDEM: "ordem", MARCACAO: "marcacao", HISTORICO: "historico"}
+
+LIMITE_PESO = int(os.getenv("API_LIMITE_PESO", 2400))  # peso por minuto do IP
+FRACAO_PRIORIDADE = {ORDEM: 1.0, MARCACAO: 0.85, HISTORICO: 0.6}
+JANELA = 60  # segundos; a Binance zera o contador a cada minuto
+
+
+def peso_rota(path, params=None):
+    params = params or {}
+    if path == "/fapi/v1/ticker/price":
+        return 1 if "symbol" in params else 2
+    if path in ("/fapi/v1/klines", "/fapi/v1/continuousKlines"):
+        limite = int(params.get("limit", 500))
+        return 1 if limite < 100 else 2 if limite < 500 else 5 if limite < 1000 else 10
+    if path in ("/fapi/v2/account", "/fapi/v2/balance"):
+        return 5
+    if path == "/fapi/v1/depth":
+        limite = int(params.get("limit", 500))
+        return 2 if limite <= 50 else 5 if limite <= 100 else 10 if limite <= 500 else 20
+    return 1
+
+
+def prioridade_rota(metodo, path):
+    if metodo.upper() in ("POST", "DELETE", "PUT"):
+        return ORDEM
+    if path.endswith(("/fundingRate", "/klines", "/continuousKlines", "/exchangeInfo")):
+        return HISTORICO
+    return MARCACAO
+
+
+class AgendadorPeso:
+    def __init__(self, limite=LIMITE_PESO, fracoes=FRACAO_PRIORIDADE):
+        self.limite = limite
+        self.fracoes = dict(fracoes)
+        self._cond = threading.Condition()
+        self._fila = []
+        self._seq = itertools.count()
+        self._janela = self._janela_atual()
+        self._usado = 0
+        self._bloqueado_ate = 0.0
+        self.atendidas = {p: 0 for p in NOMES_PRIORIDADE}
+        self.esperas = {p: 0.0 for p in NOMES_PRIORIDADE}
+
+    def _janela_atual(self):
+        return int(time.time() // JANELA)
+
+    def _renovar(self):
+        janela = self._janela_atual()
+        if janela != self._janela:
+            self._janela, self._usado = janela, 0
+
+    def _pode(self, peso, prioridade):
+        if time.time() < self._bloqueado_ate:
+            return False
+        return self._usado + peso <= self.limite * self.fracoes[prioridade]
+
+    def _espera(self):
+        # ate a proxima janela ou o fim do bloqueio (429/418)
+        fim_janela = (self._janela + 1) * JANELA
+        return max(min(fim_janela, max(self._bloqueado_ate, time.time())) - time.time(), 0.05)
+
+    @contextmanager
+    def reservar(self, peso, prioridade=MARCACAO):
+        item = (prioridade, next(self._seq))
+        inicio = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._fila, item)
+            try:
+                while True:
+                    self._renovar()
+                    if self._fila[0] == item and self._pode(peso, prioridade):
+                        break
+                    self._cond.wait(self._espera() if self._fila[0] == item else None)
+            finally:
+                self._fila.remove(item)
+                heapq.heapify(self._fila)
+                self._cond.notify_all()
+            self._usado += peso
+            self.atendidas[prioridade] += 1
+            self.esperas[prioridade] += time.monotonic() - inicio
+        yield
+
+    def registrar_resposta(self, resposta, *args, **kwargs):
+        # hook de resposta do requests: usa o peso informado pela exchange
+        usado = resposta.headers.get("X-MBX-USED-WEIGHT-1M")
+        with self._cond:
+            self._renovar()
+            if usado is not None:
+                self._usado = max(self._usado, int(usado))
+            if resposta.status_code in (418, 429):
+                espera = float(resposta.headers.get("Retry-After") or JANELA)
+                self._bloqueado_ate = max(self._bloqueado_ate, time.time() + espera)
+            self._cond.notify_all()
+        return resposta
+
+    def orcamento(self):
+        with self._cond:
+            self._renovar()
+            return {
+                "limite": self.limite,
+                "usado": self._usado,
+                "restante": max(self.limite - self._usado, 0),
+                "reinicia_em": round((self._janela + 1) * JANELA - time.time(), 1),
+                "bloqueado_por": round(max(self._bloqueado_ate - time.time(), 0), 1),
+                "fila": {NOMES_PRIORIDADE[p]: sum(1 for f in self._fila if f[0] == p) for p in NOMES_PRIORIDADE},
+                "atendidas": {NOMES_PRIORIDADE[p]: n for p, n in self.atendidas.items()},
+                "espera_total_s": {NOMES_PRIORIDADE[p]: round(s, 3) for p, s in self.esperas.items()},
+            }
+
+
+agendador = AgendadorPeso()
+
+
+def orcamento():
+    return agendador.orcamento()
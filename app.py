@@ -1,65 +1,46 @@
-import streamlit as st
-import requests
 import os
-import json
+import streamlit as st
 import time
 from datetime import datetime, timezone
-from binance.client import Client
-from dotenv import load_dotenv
+from agendador import orcamento
+import metricas
+from metricas import instrumentar
+from metadados import registro
+from precos import get_snapshot
+from market_data import get_motor
+from operacoes_store import enviar_comando, ler_estado
+from operacoes import abrir_operacao, fechar_operacao, fechar_operacoes
+from compensacao import exposicao_liquida
+from scanner import gatilho_entrada
+from trader_daemon import daemon_ativo, ler_config, salvar_config
+from pnl_engine import totais
+from serie_basis import ler_basis
+from estatisticas_funding import resumo_funding
+from nucleo import get_client, operacoes, pnl_operacoes, funding_diario, scanner
+
+_inicio_rerun = time.perf_counter()
 
 # Configuracao da pagina
 st.set_page_config(page_title="Análise BTC e ETH", layout="wide")
 
-# Carregar variaveis de ambiente
-load_dotenv()
-API_KEY = os.getenv("BINANCE_API_KEY")
-API_SECRET = os.getenv("BINANCE_API_SECRET")
-client = Client(API_KEY, API_SECRET)
+# Client unico por processo, criado na primeira chamada a API (ver nucleo.py)
+client = get_client()
 
-ARQUIVO_OPERACOES = "operacoes_reais.json"
+INTERVALO_PAINEL = 5  # segundos entre atualizacoes do painel do daemon
+JANELA_GRAFICO_BASIS = 3600  # segundos da serie gravada (serie_basis.py) mostrados por ativo
 
-# Funcoes auxiliares
+metricas.iniciar_servidor()
 
-def get_funding_history(symbol, start_time):
-    url = "https://fapi.binance.com/fapi/v1/fundingRate"
-    params = {"symbol": symbol, "limit": 1000, "startTime": start_time}
-    data = requests.get(url, params=params).json()
-    return [float(e["fundingRate"]) for e in data]
-
-def calcular_apr(funding_rates):
-    if not funding_rates:
-        return 0.0
-    media = sum(funding_rates) / len(funding_rates)
-    return ((1 + media) ** (3 * 365)) - 1  # 3 períodos por dia
+# Funcoes auxiliares
 
 # (todas as funções auxiliares anteriores mantidas aqui)
-def salvar_operacoes(ops):
-    with open(ARQUIVO_OPERACOES, "w") as f:
-        json.dump(ops, f, indent=2)
-
-def carregar_operacoes():
-    if os.path.exists(ARQUIVO_OPERACOES):
-        with open(ARQUIVO_OPERACOES, "r") as f:
-            return json.load(f)
-    return []
-
 def get_symbol_info(symbol_prefix):
-    info = requests.get("https://fapi.binance.com/fapi/v1/exchangeInfo").json()
-    for s in info["symbols"]:
-        if s["symbol"].startswith(symbol_prefix) and s["contractType"] == "CURRENT_QUARTER":
-            return s["symbol"]
-    return None
-
-def get_prices(symbol_spot, symbol_future):
-    perp_price = float(client.futures_symbol_ticker(symbol=symbol_spot)["price"])
-    fut_price = float(requests.get(f"https://fapi.binance.com/fapi/v1/ticker/price?symbol={symbol_future}").json()["price"])
-    return perp_price, fut_price
-
-def get_recent_funding(symbol, limit=3):
-    url = "https://fapi.binance.com/fapi/v1/fundingRate"
-    params = {"symbol": symbol, "limit": limit}
-    data = requests.get(url, params=params).json()
-    return sum([float(i["fundingRate"]) for i in data]) if data else 0.0
+    return registro.contrato(symbol_prefix, "CURRENT_QUARTER")
+
+@instrumentar("get_prices")
+def get_prices(symbol_spot, symbol_future, snapshot=None):
+    snapshot = snapshot or get_snapshot()
+    return snapshot.par(symbol_spot, symbol_future)
 
 def estimate_days_to_expiry(symbol_future):
     try:
@@ -69,54 +50,32 @@ def estimate_days_to_expiry(symbol_future):
     except:
         return 90
 
-def calcular_qty(volume_usd, preco, symbol):
-    qty = volume_usd / preco
-    info = client.futures_exchange_info()
-    step = 0.001
-    for s in info['symbols']:
-        if s['symbol'] == symbol:
-            for f in s['filters']:
-                if f['filterType'] == 'LOT_SIZE':
-                    step = float(f['stepSize'])
-    qty = qty - (qty % step)
-    return round(qty, 8)
-
-def executar_ordem(symbol_spot, symbol_future, volume):
-    preco_perp, preco_fut = get_prices(symbol_spot, symbol_future)
-    qty_perp = calcular_qty(volume, preco_perp, symbol_spot)
-    qty_fut = calcular_qty(volume, preco_fut, symbol_future)
-
-    client.futures_create_order(symbol=symbol_spot, side="SELL", type="MARKET", quantity=qty_perp)
-    client.futures_create_order(symbol=symbol_future, side="BUY", type="MARKET", quantity=qty_fut)
-
-    nova_ordem = {
-        "data_entrada": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
-        "symbol_perpetuo": symbol_spot,
-        "symbol_futuro": symbol_future,
-        "preco_entrada_perp": preco_perp,
-        "preco_entrada_futuro": preco_fut,
-        "volume_usd": volume,
-        "funding_rate_entrada_diario": get_recent_funding(symbol_spot),
-        "status": "aberta"
-    }
-    operacoes = carregar_operacoes()
-    operacoes.append(nova_ordem)
-    salvar_operacoes(operacoes)
+def executar_ordem(symbol_spot, symbol_future, volume, snapshot=None):
+    return abrir_operacao(client, symbol_spot, symbol_future, volume, snapshot or get_snapshot())
 
 # Função para desenhar o quadro de um ativo
-def mostrar_analise_ativo(nome, symbol_spot, symbol_prefix, volume, modo_auto):
+def mostrar_analise_ativo(nome, symbol_spot, symbol_prefix, volume, modo_auto, snapshot):
     symbol_future = get_symbol_info(symbol_prefix)
     if not symbol_future:
         st.error(f"Não encontrado contrato futuro para {nome}")
         return
 
-    preco_perp, preco_fut = get_prices(symbol_spot, symbol_future)
+    motor = get_motor([(symbol_spot, symbol_future)])
+    leitura = motor.leitura(symbol_spot, symbol_future) if motor else None
+    if leitura:
+        preco_perp, preco_fut = leitura["preco_perp"], leitura["preco_futuro"]
+        fonte = f"WebSocket (há {time.time() - leitura['atualizado_em']:.0f}s)"
+    else:
+        preco_perp, preco_fut = get_prices(symbol_spot, symbol_future, snapshot)
+        fonte = "REST"
     dias_venc = estimate_days_to_expiry(symbol_future)
     basis_pct = (preco_fut - preco_perp) / preco_perp
     basis_dia = basis_pct / dias_venc
-    funding_diario = get_recent_funding(symbol_spot)
-    relacao_fb = funding_diario / basis_dia if basis_dia else 0
-    gatilho = (funding_diario > 0.0003) or (funding_diario > 1.5 * basis_dia)
+    funding_dia = funding_diario(symbol_spot)
+    regime = resumo_funding(symbol_spot)
+    pct = lambda v: "N/A" if v is None else f"{v:.4%}"
+    relacao_fb = funding_dia / basis_dia if basis_dia else 0
+    gatilho = gatilho_entrada(funding_dia, basis_dia)
 
     st.subheader(f"{nome}")
     st.markdown(f"""
@@ -124,74 +83,112 @@ def mostrar_analise_ativo(nome, symbol_spot, symbol_prefix, volume, modo_auto):
     - **Preço Futuro Trimestral:** `${preco_fut:,.2f}`  
     - **Dias até o vencimento:** `{dias_venc}`  
     - **Basis Total:** `{basis_pct:.4%}` → Diário `{basis_dia:.4%}`  
-    - **Funding Rate Diário (3 períodos):** `{funding_diario:.4%}`  
+    - **Funding Rate Diário (últimas 24h):** `{funding_dia:.4%}` → EWMA diária `{pct(regime["ewma_dia"])}`  
+    - **Funding 7d (por período):** média `{pct(regime["7d"]["media"])}` ± desvio `{pct(regime["7d"]["desvio"])}`  
+    - **APR Composto do Funding:** 7d `{pct(regime["7d"]["apr_composto"])}` · 30d `{pct(regime["30d"]["apr_composto"])}`  
+    - **Funding Previsto (próx. período):** `{f"{leitura['funding_previsto']:.4%}" if leitura and leitura['funding_previsto'] is not None else "N/A"}`  
     - **Relação Funding/Basis:** `{relacao_fb:.2f}`  
-    - **{'🟢 Gatilho de Entrada Ativado' if gatilho else '🔴 Sem Gatilho'}**
+    - **{'🟢 Gatilho de Entrada Ativado' if gatilho else '🔴 Sem Gatilho'}**  
+    - **Fonte dos preços:** `{fonte}`
     """)
 
+    # historico por segundo do gravador de basis, quando ele esta rodando
+    historico = ler_basis(symbol_future, time.time() - JANELA_GRAFICO_BASIS, time.time(),
+                          ["basis_dia", "funding_previsto"])
+    if len(historico["tempo_ms"]):
+        st.caption(f"Basis/dia e funding previsto (%) — última hora, {len(historico['tempo_ms'])} amostras")
+        st.line_chart({
+            "basis/dia": historico["basis_dia"] * 100,
+            "funding previsto": historico["funding_previsto"] * 100,
+        })
+
     if st.button(f"🚀 Executar Arbitragem Manual - {nome}"):
-        executar_ordem(symbol_spot, symbol_future, volume)
-        st.success("✅ Ordem manual executada!")
+        if daemon_ativo():
+            cmd = enviar_comando("abrir", {"symbol_perpetuo": symbol_spot, "symbol_futuro": symbol_future, "volume": volume})
+            st.success(f"✅ Ordem manual enviada ao daemon (comando #{cmd})")
+        else:
+            nova_ordem = executar_ordem(symbol_spot, symbol_future, volume, snapshot)
+            st.success(f"✅ Ordem manual executada! (skew entre pernas: {nova_ordem['execucao_entrada']['skew_ack_ms']:.0f} ms)")
+
+# Estado publicado pelo daemon de trading (atualiza sozinho, sem rerun da pagina)
+@st.fragment(run_every=INTERVALO_PAINEL)
+def painel_daemon(modo_auto):
+    heartbeat, _ = ler_estado("heartbeat")
+    if daemon_ativo():
+        st.success(f"🤖 Daemon ativo — última avaliação há {time.time() - heartbeat['ultima_avaliacao']:.0f}s")
+    elif modo_auto:
+        st.warning("⚠️ Modo automático ligado, mas o daemon está parado. Inicie `python trader_daemon.py`.")
+    else:
+        st.info("⏸️ Modo automático desativado.")
+    api = orcamento()
+    st.caption(f"Peso da API: {api['usado']}/{api['limite']} no minuto (reinicia em {api['reinicia_em']:.0f}s)"
+               + (f" — bloqueado por {api['bloqueado_por']:.0f}s" if api["bloqueado_por"] else ""))
+    acoes, atualizado_em = ler_estado("ultimas_acoes", [])
+    if acoes:
+        quando = datetime.fromtimestamp(atualizado_em, tz=timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+        st.caption(f"Últimas ações automáticas ({quando}):")
+        st.dataframe(acoes, use_container_width=True, hide_index=True)
 
 # Interface
 st.title("🔹 Análise Simultânea BTC e ETH com Execução")
-volume = st.number_input("Volume (USD) por operação", min_value=50.0, value=100.0, step=50.0)
-modo_auto = st.toggle("🚀 Modo Automático de Trade")
+config = ler_config()
+volume = st.number_input("Volume (USD) por operação", min_value=50.0, value=float(config["volume"]), step=50.0)
+modo_auto = st.toggle("🚀 Modo Automático de Trade", value=config["modo_auto"])
+if (volume, modo_auto) != (config["volume"], config["modo_auto"]):
+    salvar_config(volume=volume, modo_auto=modo_auto)
+painel_daemon(modo_auto)
 filtro_ativo = st.selectbox("Filtrar ativo:", ["Todos", "BTC", "ETH"])
 col_btc, col_eth = st.columns(2)
 
+# Um unico snapshot de precos compartilhado por todo o refresh
+snapshot = get_snapshot()
+
 if filtro_ativo in ["Todos", "BTC"]:
     with col_btc:
-        mostrar_analise_ativo("Bitcoin (BTC)", "BTCUSDT", "BTCUSDT", volume, modo_auto)
+        mostrar_analise_ativo("Bitcoin (BTC)", "BTCUSDT", "BTCUSDT", volume, modo_auto, snapshot)
 
 if filtro_ativo in ["Todos", "ETH"]:
     with col_eth:
-        mostrar_analise_ativo("Ethereum (ETH)", "ETHUSDT", "ETHUSDT", volume, modo_auto)
+        mostrar_analise_ativo("Ethereum (ETH)", "ETHUSDT", "ETHUSDT", volume, modo_auto, snapshot)
 
-# Autorefresh com contador
-if modo_auto:
-    countdown_placeholder = st.empty()
-    for i in range(600, 0, -1):
-        mins, secs = divmod(i, 60)
-        countdown_placeholder.info(f"🔄 Próxima atualização automática em {mins}m {secs}s")
-        time.sleep(1)
-
-    st.experimental_rerun()
+# Scanner de todos os ativos com contrato trimestral
+st.divider()
+st.subheader("🔎 Scanner Basis/Funding — Todos os Ativos com Trimestral")
+df_scanner = scanner(snapshot)
+if not df_scanner.empty:
+    df_exibir = df_scanner.copy()
+    for col in ["basis_pct", "basis_dia", "funding_diario", "excesso_dia", "desvio_funding_7d", "apr_funding_30d"]:
+        df_exibir[col] = df_exibir[col] * 100
+    df_exibir["gatilho"] = df_exibir["gatilho"].map({True: "🟢", False: "🔴"})
+    st.dataframe(df_exibir.rename(columns={
+        "basis_pct": "basis (%)", "basis_dia": "basis/dia (%)",
+        "funding_diario": "funding/dia (%)", "excesso_dia": "funding - basis/dia (%)",
+        "desvio_funding_7d": "desvio funding 7d (%)", "apr_funding_30d": "APR funding 30d (%)",
+    }), use_container_width=True, hide_index=True)
 else:
-    st.info("⏸️ Atualização automática desativada.")
-
+    st.info("Nenhum par perpétuo/trimestral encontrado.")
 
 # ========== OPERACOES ABERTAS ==========
 st.divider()
 st.subheader("📂 Operações Abertas")
 
-operacoes = carregar_operacoes()
-abertas = [op for op in operacoes if op.get("status") == "aberta"]
+abertas = operacoes(status="aberta")
 
 if abertas:
-    total_funding = total_basis = total_taxa = total_total = 0.0
-
-    for idx, ordem in enumerate(abertas):
-        try:
-            preco_atual_perp = float(client.futures_symbol_ticker(symbol=ordem["symbol_perpetuo"])["price"])
-            preco_atual_fut = float(requests.get(f"https://fapi.binance.com/fapi/v1/ticker/price?symbol={ordem['symbol_futuro']}").json()["price"])
-            data_ts = int(datetime.strptime(ordem["data_entrada"], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp() * 1000)
-            taxas = get_funding_history(ordem["symbol_perpetuo"], start_time=data_ts)
-            pnl_funding = sum(taxas) * ordem["volume_usd"]
-            apr = calcular_apr(taxas)
-            pnl_futuro = (preco_atual_fut - ordem["preco_entrada_futuro"]) * (ordem["volume_usd"] / ordem["preco_entrada_perp"])
-            pnl_perp = (ordem["preco_entrada_perp"] - preco_atual_perp) * (ordem["volume_usd"] / ordem["preco_entrada_perp"])
-            pnl_basis = pnl_futuro + pnl_perp
-            taxa_abertura = ordem.get("taxa_abertura", round(ordem["volume_usd"] * 2 * 0.0004, 2))
-            pnl_total = pnl_funding + pnl_basis - taxa_abertura
-
-            total_funding += pnl_funding
-            total_basis += pnl_basis
-            total_taxa += taxa_abertura
-            total_total += pnl_total
-        except Exception as e:
-            st.warning(f"Erro ao calcular PnL: {str(e)}")
+    # PnL de todas as operacoes abertas em uma unica passada
+    df_pnl = pnl_operacoes("aberta", snapshot)
+    total_funding, total_basis, total_taxa, total_total = totais(df_pnl)
+    # linhas casadas pelo id: a lista e o PnL podem vir de versoes diferentes do
+    # banco; operacao sem linha fica com NaN e cai no aviso abaixo
+    pnl_por_ordem = df_pnl.set_index("id").reindex([ordem["id"] for ordem in abertas])
+
+    for idx, (ordem, pnl) in enumerate(zip(abertas, pnl_por_ordem.itertuples())):
+        if pnl.pnl_total != pnl.pnl_total:  # NaN: contrato sem preco no snapshot
+            st.warning(f"Erro ao calcular PnL: sem preço para {ordem['symbol_perpetuo']} / {ordem['symbol_futuro']}")
             pnl_funding = pnl_basis = apr = pnl_futuro = pnl_perp = pnl_total = taxa_abertura = 0.0
+        else:
+            pnl_funding, pnl_futuro, pnl_perp = pnl.pnl_funding, pnl.pnl_futuro, pnl.pnl_perp
+            pnl_basis, taxa_abertura, pnl_total, apr = pnl.pnl_basis, pnl.taxa_abertura, pnl.pnl_total, pnl.apr
 
         with st.container():
             st.markdown(f"### Ordem #{idx+1} — {ordem['symbol_perpetuo']}")
@@ -209,23 +206,20 @@ if abertas:
                 st.metric("PnL Perp", f"${pnl_perp:.2f}")
                 st.metric("PnL Basis", f"${pnl_basis:.2f}")
                 st.metric("Taxa Abertura", f"-${taxa_abertura:.2f}")
+                if ordem.get("data_rolagem"):
+                    st.metric("Rolagem (PnL - Taxa)", f"${pnl.pnl_rolagem - pnl.taxa_rolagem:.2f}")
                 st.metric("PnL Total", f"${pnl_total:.2f}")
                 st.metric("APR Est.", f"{apr*100:.2f}%")
 
         st.divider()
         if st.button(f"❌ Fechar Ordem #{idx+1}", key=f"fechar_{idx}"):
             try:
-                preco_atual_perp = float(client.futures_symbol_ticker(symbol=ordem["symbol_perpetuo"])["price"])
-                preco_atual_fut = float(requests.get(f"https://fapi.binance.com/fapi/v1/ticker/price?symbol={ordem['symbol_futuro']}").json()["price"])
-                qty_perp = calcular_qty(ordem["volume_usd"], ordem["preco_entrada_perp"], ordem["symbol_perpetuo"])
-                qty_fut = calcular_qty(ordem["volume_usd"], ordem["preco_entrada_futuro"], ordem["symbol_futuro"])
-                client.futures_create_order(symbol=ordem["symbol_perpetuo"], side="BUY", type="MARKET", quantity=qty_perp)
-                client.futures_create_order(symbol=ordem["symbol_futuro"], side="SELL", type="MARKET", quantity=qty_fut)
-                ordem["status"] = "fechada"
-                ordem["preco_saida_perp"] = preco_atual_perp
-                ordem["preco_saida_futuro"] = preco_atual_fut
-                salvar_operacoes(operacoes)
-                st.success(f"✅ Ordem #{idx+1} fechada com sucesso!")
+                if daemon_ativo():
+                    cmd = enviar_comando("fechar", {"id": ordem["id"]})
+                    st.success(f"✅ Fechamento da ordem #{idx+1} enviado ao daemon (comando #{cmd})")
+                else:
+                    fechada = fechar_operacao(client, ordem, snapshot)
+                    st.success(f"✅ Ordem #{idx+1} fechada com sucesso! (skew entre pernas: {fechada['execucao_saida']['skew_ack_ms']:.0f} ms)")
             except Exception as e:
                 st.error(f"Erro ao fechar a ordem: {e}")
 
@@ -235,5 +229,34 @@ if abertas:
     col_f2.metric("Total PnL Basis", f"${total_basis:.2f}")
     col_f3.metric("Total Taxas", f"-${total_taxa:.2f}")
     col_f4.metric("Total PnL Geral", f"${total_total:.2f}")
+
+    # Fechamento em lote: uma ordem por simbolo com a exposicao liquida de cada par
+    st.subheader("🧮 Exposição Líquida por Par")
+    exposicao = exposicao_liquida(abertas)
+    st.dataframe([{**linha, "operacoes": len(linha["operacoes"])} for linha in exposicao],
+                 use_container_width=True, hide_index=True)
+    n_ordens = len({linha["perpetuo"] for linha in exposicao if linha["qty_perpetuo"]}
+                   | {linha["futuro"] for linha in exposicao if linha["qty_futuro"]})
+    if st.button(f"❌ Fechar todas ({len(abertas)} operações em {n_ordens} ordens)", key="fechar_todas"):
+        try:
+            if daemon_ativo():
+                cmd = enviar_comando("fechar_lote", {"ids": [op["id"] for op in abertas]})
+                st.success(f"✅ Fechamento em lote enviado ao daemon (comando #{cmd})")
+            else:
+                fechadas, falhas = fechar_operacoes(client, abertas, snapshot)
+                if fechadas:
+                    st.success(f"✅ {len(fechadas)} operação(ões) fechada(s) com {n_ordens} ordens")
+                for _, erro in falhas[:1]:
+                    st.error(f"Erro no fechamento em lote: {erro}")
+        except Exception as e:
+            st.error(f"Erro ao fechar as operações: {e}")
 else:
     st.info("Nenhuma operação aberta.")
+
+# ========== DIAGNOSTICO ==========
+if metricas.ATIVO:
+    # rotulo pelo nome do arquivo: app.py e app2.py sao a mesma pagina servida por arquivos diferentes
+    metricas.registro.observar(f"rerun {os.path.basename(__file__)}", time.perf_counter() - _inicio_rerun)
+    with st.expander("🩺 Diagnóstico (tempo por operação)"):
+        st.dataframe(metricas.registro.resumo(), use_container_width=True, hide_index=True)
+        st.caption(f"Prometheus: http://127.0.0.1:{metricas.PORTA}/metrics")
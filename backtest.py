@@ -0,0 +1,241 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from binance_rest import get_json
+from funding_store import store as funding_store
+from metadados import registro
+from scanner import gatilho_entrada, LIMIAR_FUNDING_DIARIO, MULTIPLICADOR_BASIS
+
+# Backtest vetorizado do gatilho de entrada (funding/basis). Funding e klines
+# do perpetuo e do trimestral continuo (CURRENT_QUARTER) sao carregados em
+# arrays NumPy alinhados nos horarios de funding e guardados em .npz. Cada
+# simulacao calcula posicao, rolagens no vencimento, taxas e PnL sem loops
+# em Python; a grade de parametros roda em um pool de processos.
+
+TAXA_PERNA = 0.0004
+PERIODOS_FUNDING_DIA = 3
+PERIODOS_FUNDING_ANO = 3 * 365
+INTERVALO_KLINES = "1h"
+LIMITE_KLINES = 1500
+DIR_CACHE = os.getenv("BACKTEST_CACHE", "backtest_cache")
+TAMANHO_LOTE = 200  # combinacoes de parametros por tarefa do pool
+MESES_VENCIMENTO = (3, 6, 9, 12)
+HORA_MS = 3600 * 1000
+
+
+# Dados historicos
+
+def _ultima_sexta(ano, mes):
+    proximo = datetime(ano + mes // 12, mes % 12 + 1, 1, 8, tzinfo=timezone.utc)
+    ultimo = proximo - timedelta(days=1)
+    return ultimo - timedelta(days=(ultimo.weekday() - 4) % 7)
+
+
+def vencimentos_trimestrais(inicio_ms, fim_ms):
+    # Entregas dos trimestrais: ultima sexta de mar/jun/set/dez as 08:00 UTC
+    ano_inicio = datetime.fromtimestamp(inicio_ms / 1000, tz=timezone.utc).year
+    ano_fim = datetime.fromtimestamp(fim_ms / 1000, tz=timezone.utc).year + 1
+    return np.array([
+        int(_ultima_sexta(ano, mes).timestamp() * 1000)
+        for ano in range(ano_inicio, ano_fim + 1) for mes in MESES_VENCIMENTO
+    ])
+
+
+def _baixar_klines(path, params, inicio_ms, fim_ms):
+    # (horario de fechamento, preco de fechamento) de todas as velas do periodo
+    fechamentos, precos = [], []
+    while inicio_ms < fim_ms:
+        data = get_json(path, {**params, "interval": INTERVALO_KLINES, "startTime": inicio_ms,
+                               "endTime": fim_ms, "limit": LIMITE_KLINES})
+        if not data:
+            break
+        fechamentos += [int(k[6]) for k in data]
+        precos += [float(k[4]) for k in data]
+        if len(data) < LIMITE_KLINES:
+            break
+        inicio_ms = int(data[-1][0]) + 1
+    return np.array(fechamentos, dtype=np.int64), np.array(precos)
+
+
+def _preco_em(tempos, fechamentos, precos):
+    # Ultimo fechamento ate cada horario (NaN antes da primeira vela)
+    idx = np.searchsorted(fechamentos, tempos, side="right") - 1
+    return np.where(idx >= 0, precos[np.maximum(idx, 0)], np.nan)
+
+
+def arquivo_cache(symbol, inicio_ms, fim_ms):
+    return os.path.join(DIR_CACHE, f"{symbol}_{inicio_ms}_{fim_ms}_{INTERVALO_KLINES}.npz")
+
+
+def carregar_dados(symbol, inicio_ms, fim_ms, atualizar=False):
+    arquivo = arquivo_cache(symbol, inicio_ms, fim_ms)
+    if os.path.exists(arquivo) and not atualizar:
+        return arquivo
+
+    tempos, taxas = funding_store.serie(symbol, inicio_ms, fim_ms)
+    tempos = np.round(np.asarray(tempos, dtype=np.int64) / HORA_MS).astype(np.int64) * HORA_MS
+    perp = _baixar_klines("/fapi/v1/klines", {"symbol": symbol}, inicio_ms, fim_ms)
+    trimestral = _baixar_klines("/fapi/v1/continuousKlines", {"pair": symbol, "contractType": "CURRENT_QUARTER"},
+                                inicio_ms, fim_ms)
+    preco_perp = _preco_em(tempos, *perp)
+    preco_futuro = _preco_em(tempos, *trimestral)
+
+    # Descarta horarios sem preco de alguma das pernas (antes do inicio das series)
+    validos = ~np.isnan(preco_perp) & ~np.isnan(preco_futuro)
+    tempos = tempos[validos]
+    entregas = vencimentos_trimestrais(inicio_ms, fim_ms)
+    vencimento = entregas[np.searchsorted(entregas, tempos, side="left")]
+
+    os.makedirs(DIR_CACHE, exist_ok=True)
+    np.savez(
+        arquivo,
+        tempo=tempos,
+        funding=np.asarray(taxas)[validos],
+        preco_perp=preco_perp[validos],
+        preco_futuro=preco_futuro[validos],
+        vencimento=vencimento,
+        step=registro.step_lote(symbol),
+    )
+    return arquivo
+
+
+def ler_dados(arquivo):
+    with np.load(arquivo) as npz:
+        return {k: npz[k] for k in npz.files}
+
+
+# Simulacao
+
+def _preencher(valores):
+    # forward fill de NaN em um array 1D
+    idx = np.where(np.isnan(valores), 0, np.arange(len(valores)))
+    np.maximum.accumulate(idx, out=idx)
+    return valores[idx]
+
+
+def simular(dados, limiar=LIMIAR_FUNDING_DIARIO, multiplicador=MULTIPLICADOR_BASIS, limiar_saida=None, volume=100.0):
+    # limiar_saida=None: segura ate o vencimento e rola se o gatilho continuar
+    # ativo; caso contrario sai quando o funding diario cai abaixo do limiar.
+    t, r = dados["tempo"], dados["funding"]
+    p, q, venc = dados["preco_perp"], dados["preco_futuro"], dados["vencimento"]
+    n = len(t)
+    if n < 2:
+        return {}
+
+    acumulado = np.concatenate(([0.0], np.cumsum(r)))
+    funding_diario = acumulado[1:] - acumulado[np.maximum(np.arange(1, n + 1) - PERIODOS_FUNDING_DIA, 0)]
+    dias = np.maximum(np.floor((venc - t) / 86400000), 1)
+    basis_dia = (q - p) / p / dias
+    gatilho = gatilho_entrada(funding_diario, basis_dia, limiar, multiplicador)
+
+    troca = np.r_[venc[1:] != venc[:-1], False]  # ultimo ponto antes do vencimento
+    if limiar_saida is None:
+        sair = troca & ~gatilho
+    else:
+        sair = funding_diario < limiar_saida
+    posicao = np.nan_to_num(_preencher(np.where(gatilho, 1.0, np.where(sair, 0.0, np.nan))))
+    anterior = np.r_[0.0, posicao[:-1]]
+    entradas = (posicao == 1) & (anterior == 0)
+    saidas = (posicao == 0) & (anterior == 1)
+    rolagens = (posicao == 1) & troca
+
+    # Notional travado na entrada com a quantidade arredondada ao LOT_SIZE
+    step = float(dados["step"])
+    qty = np.floor(volume / p / step) * step
+    nocional = np.nan_to_num(_preencher(np.where(entradas, qty * p, np.nan))) * posicao
+    nocional_anterior = np.r_[0.0, nocional[:-1]]
+
+    # Retornos por periodo; no vencimento o futuro converge para o perpetuo
+    ret_perp = p[1:] / p[:-1] - 1
+    ret_futuro = np.where(troca[:-1], p[1:], q[1:]) / q[:-1] - 1
+    pnl_basis = nocional[:-1] * (ret_futuro - ret_perp)
+    pnl_funding = nocional[:-1] * r[1:]
+    taxas = 2 * TAXA_PERNA * (nocional * (entradas | rolagens) + nocional_anterior * saidas)
+
+    resultado = np.r_[0.0, pnl_basis + pnl_funding] - taxas
+    patrimonio = np.cumsum(resultado)
+    pnl_total = patrimonio[-1]
+    dias_posicionado = np.sum(posicao[:-1] * np.diff(t)) / 86400000
+    periodos = posicao[:-1] == 1
+    media_funding = r[1:][periodos].mean() if periodos.any() else 0.0
+    return {
+        "n_operacoes": int(entradas.sum()),
+        "n_rolagens": int(rolagens.sum()),
+        "dias_posicionado": dias_posicionado,
+        "pnl_funding": pnl_funding.sum(),
+        "pnl_basis": pnl_basis.sum(),
+        "taxas": taxas.sum(),
+        "pnl_total": pnl_total,
+        "max_drawdown": np.max(np.maximum.accumulate(patrimonio) - patrimonio),
+        "apr_realizado": pnl_total / volume * 365 / dias_posicionado if dias_posicionado else 0.0,
+        # modelo composto usado nas paginas de PnL, para comparacao
+        "apr_modelo": (1 + media_funding) ** PERIODOS_FUNDING_ANO - 1,
+    }
+
+
+# Varredura de parametros
+
+_dados_worker = {}
+
+
+def _iniciar_worker(arquivos):
+    for symbol, arquivo in arquivos.items():
+        _dados_worker[symbol] = ler_dados(arquivo)
+
+
+def _rodar_lote(symbol, combinacoes):
+    dados = _dados_worker[symbol]
+    return [{"symbol": symbol, **params, **simular(dados, **params)} for params in combinacoes]
+
+
+def varrer(simbolos, inicio_ms, fim_ms, grade, processos=None, atualizar=False):
+    # grade: {"limiar": [...], "multiplicador": [...], "limiar_saida": [...], "volume": [...]}
+    arquivos = {s: carregar_dados(s, inicio_ms, fim_ms, atualizar) for s in simbolos}
+    combinacoes = [dict(zip(grade, valores)) for valores in itertools.product(*grade.values())]
+    lotes = [(s, combinacoes[i:i + TAMANHO_LOTE]) for s in simbolos for i in range(0, len(combinacoes), TAMANHO_LOTE)]
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker, initargs=(arquivos,)) as pool:
+        futuros = [pool.submit(_rodar_lote, s, lote) for s, lote in lotes]
+        linhas = [linha for f in futuros for linha in f.result()]
+    return pd.DataFrame(linhas).sort_values("pnl_total", ascending=False).reset_index(drop=True)
+
+
+def _data_ms(texto):
+    return int(datetime.strptime(texto, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _limiar_saida(texto):
+    return None if texto == "venc" else float(texto)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest do gatilho funding/basis")
+    parser.add_argument("--simbolos", nargs="+", default=["BTCUSDT", "ETHUSDT"])
+    parser.add_argument("--inicio", default="2022-01-01", help="YYYY-MM-DD (UTC)")
+    parser.add_argument("--fim", default=datetime.now(timezone.utc).strftime("%Y-%m-%d"), help="YYYY-MM-DD (UTC)")
+    parser.add_argument("--limiares", nargs="+", type=float, default=[0.0001, 0.0002, 0.0003, 0.0005])
+    parser.add_argument("--multiplicadores", nargs="+", type=float, default=[1.0, 1.5, 2.0, 3.0])
+    parser.add_argument("--saidas", nargs="+", type=_limiar_saida, default=[None, 0.0, 0.0001],
+                        help="limiar de saida do funding diario ou 'venc' para segurar ate o vencimento")
+    parser.add_argument("--volumes", nargs="+", type=float, default=[100.0, 1000.0])
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--atualizar", action="store_true", help="baixa os dados novamente em vez de usar o cache")
+    parser.add_argument("--saida", default="backtest_resultado.csv")
+    args = parser.parse_args()
+
+    inicio = time.time()
+    df = varrer(
+        args.simbolos, _data_ms(args.inicio), _data_ms(args.fim),
+        {"limiar": args.limiares, "multiplicador": args.multiplicadores,
+         "limiar_saida": args.saidas, "volume": args.volumes},
+        processos=args.processos, atualizar=args.atualizar,
+    )
+    df.to_csv(args.saida, index=False)
+    print(df.head(20).to_string())
+    print(f"{len(df)} simulações em {time.time() - inicio:.1f}s -> {args.saida}")
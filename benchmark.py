@@ -0,0 +1,422 @@
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from multiprocessing import get_context
+
+# Benchmarks de ponta a ponta contra a API fake (fake_binance.py). Cada caso
+# roda em um processo novo, com banco, caches e servidor fake proprios, e
+# reporta tempo, chamadas HTTP por rota e pico de memoria. Os modulos do
+# repositorio so sao importados depois que as URLs apontam para o fake.
+
+DIR_REPO = os.path.dirname(os.path.abspath(__file__))
+CASOS = ("render_app", "pnl_historico", "fluxo_operacoes", "gravador_saldo", "execucao_fatiada", "fluxo_lote",
+         "partida_fria", "serie_basis", "estatisticas_funding")
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+TOLERANCIA_PADRAO = 0.2  # piora relativa que conta como regressao
+MODULOS_PESADOS = ("pandas", "numpy", "requests", "binance.client", "websocket")
+# Orcamento de partida a frio por pagina: segundos do primeiro rerun num
+# processo novo com o streamlit ja importado (como no servidor) e modulos
+# pesados que a pagina nao deve carregar
+ORCAMENTO_PARTIDA = {
+    "grafico_saldo_app.py": (0.3, ("pandas", "numpy", "requests", "binance.client")),
+    "rolagem_futuro_app.py": (0.6, ("pandas", "numpy", "binance.client")),
+    "historico_consolidado_todas_operacoes_v2.py": (1.5, ("binance.client",)),
+    "historico_pnl_app5.py": (2.0, ()),
+    "app.py": (2.0, ("binance.client",)),
+}
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _Medidor:
+    def __init__(self, fake):
+        self.fake = fake
+        self.fases = []
+
+    @contextmanager
+    def medir(self, fase):
+        self.fake.zerar_contagem()
+        inicio = time.perf_counter()
+        extra = {}
+        yield extra
+        self.fases.append({
+            "fase": fase,
+            "tempo_s": round(time.perf_counter() - inicio, 4),
+            "chamadas_http": self.fake.total_chamadas(),
+            "chamadas_por_rota": dict(self.fake.chamadas),
+            "memoria_pico_mb": round(_rss_mb(), 1),
+            **extra,
+        })
+
+
+def _semear_operacoes(fake, n_operacoes, arquivo):
+    # Historico legado em JSON: o OperacoesStore importa tudo na primeira abertura
+    perps = [s["symbol"] for s in fake.simbolos if s["contractType"] == "PERPETUAL"]
+    futuros = {s["pair"]: s["symbol"] for s in fake.simbolos if s["contractType"] == "CURRENT_QUARTER"}
+    agora = datetime.now(timezone.utc)
+    rng = random.Random(42)
+    ops = []
+    for i in range(n_operacoes):
+        perp = perps[i % len(perps)]
+        entrada = agora - timedelta(days=rng.uniform(1, 60))
+        op = {
+            "data_entrada": entrada.strftime(FORMATO_DATA),
+            "symbol_perpetuo": perp,
+            "symbol_futuro": futuros[perp],
+            "preco_entrada_perp": fake.precos[perp] * rng.uniform(0.95, 1.05),
+            "preco_entrada_futuro": fake.precos[futuros[perp]] * rng.uniform(0.95, 1.05),
+            "volume_usd": 100.0,
+            "funding_rate_entrada_diario": 0.0003,
+            "status": "aberta" if i % 3 == 0 else "fechada",
+        }
+        if op["status"] == "fechada":
+            saida = entrada + (agora - entrada) * rng.uniform(0.1, 0.9)
+            op.update({
+                "data_saida": saida.strftime(FORMATO_DATA),
+                "preco_saida_perp": fake.precos[perp],
+                "preco_saida_futuro": fake.precos[futuros[perp]],
+            })
+        ops.append(op)
+    with open(arquivo, "w") as f:
+        json.dump(ops, f)
+
+
+def _preparar(n_simbolos, n_operacoes, latencia):
+    from fake_binance import FakeBinance
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_"))
+    fake = FakeBinance(n_ativos=n_simbolos, latencia=latencia).iniciar()
+    os.environ.update({
+        "BINANCE_FAPI_URL": fake.url,
+        "BINANCE_WS_URL": fake.ws.url,
+        "OPERACOES_DB": os.path.abspath("operacoes.db"),
+    })
+    _semear_operacoes(fake, n_operacoes, "operacoes_reais.json")
+
+    # Todo Client criado pelos apps passa a apontar para o fake
+    _apontar_client(fake.url)
+    import binance.client
+
+    class ClienteFake(binance.client.Client):
+        def __init__(self, api_key=None, api_secret=None, **kwargs):
+            super().__init__(api_key or "fake", api_secret or "fake", ping=False)
+            self.FUTURES_URL = f"{fake.url}/fapi"
+
+    binance.client.Client = ClienteFake
+    return fake
+
+
+def _apontar_client(url):
+    # Clients criados pelo binance_rest (ClienteTardio das paginas) usam o fake,
+    # sem importar a python-binance antes da hora
+    import binance_rest
+
+    original = binance_rest.criar_client
+
+    def criar_client(api_key=None, api_secret=None):
+        client = original(api_key or "fake", api_secret or "fake")
+        client.FUTURES_URL = f"{url}/fapi"
+        return client
+
+    binance_rest.criar_client = criar_client
+
+
+# Casos
+
+def _caso_render_app(medidor, n_operacoes):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(DIR_REPO, "app.py"), default_timeout=3600)
+    with medidor.medir("frio"):
+        at.run()
+    with medidor.medir("quente"):
+        at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+
+def _caso_pnl_historico(medidor, n_operacoes):
+    from streamlit.testing.v1 import AppTest
+    from pnl_engine import calcular_pnl_operacoes
+    from operacoes_store import carregar_operacoes
+    from precos import get_snapshot
+
+    at = AppTest.from_file(os.path.join(DIR_REPO, "historico_pnl_app5.py"), default_timeout=3600)
+    with medidor.medir("pagina_fria"):
+        at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    with medidor.medir("motor_pnl"):
+        calcular_pnl_operacoes(carregar_operacoes(), get_snapshot())
+
+
+def _caso_fluxo_operacoes(medidor, n_operacoes):
+    from binance.client import Client
+    from operacoes import abrir_operacao, fechar_operacao, rolar_operacao, get_next_quarter_symbol
+    from metadados import registro
+    from precos import get_snapshot
+
+    client = Client()
+    perps = [s for s in registro.contratos("PERPETUAL")]
+    ops = []
+    with medidor.medir("abrir"):
+        for i in range(n_operacoes):
+            perp = perps[i % len(perps)]["symbol"]
+            ops.append(abrir_operacao(client, perp, registro.contrato(perp, "CURRENT_QUARTER"), 100.0, get_snapshot()))
+    with medidor.medir("rolar"):
+        ops = [rolar_operacao(client, op, get_next_quarter_symbol(op["symbol_perpetuo"]), get_snapshot()) for op in ops]
+    with medidor.medir("fechar"):
+        for op in ops:
+            fechar_operacao(client, op, get_snapshot())
+
+
+def _caso_fluxo_lote(medidor, n_operacoes):
+    # mesmo fluxo de fluxo_operacoes com rolagem e fechamento compensados
+    # (uma ordem por simbolo); chamadas_por_rota mostra as ordens enviadas
+    from binance.client import Client
+    from operacoes import abrir_operacao, rolar_operacoes, fechar_operacoes, get_next_quarter_symbol
+    from metadados import registro
+    from precos import get_snapshot
+
+    client = Client()
+    perps = [s for s in registro.contratos("PERPETUAL")]
+    ops = []
+    with medidor.medir("abrir"):
+        for i in range(n_operacoes):
+            perp = perps[i % len(perps)]["symbol"]
+            ops.append(abrir_operacao(client, perp, registro.contrato(perp, "CURRENT_QUARTER"), 100.0, get_snapshot()))
+    with medidor.medir("rolar_lote"):
+        ops, falhas = rolar_operacoes(client, [(op, get_next_quarter_symbol(op["symbol_perpetuo"])) for op in ops],
+                                      get_snapshot())
+        if falhas:
+            raise falhas[0][1]
+    with medidor.medir("fechar_lote"):
+        _, falhas = fechar_operacoes(client, ops, get_snapshot())
+        if falhas:
+            raise falhas[0][1]
+
+
+def _caso_gravador_saldo(medidor, n_operacoes):
+    from binance.client import Client
+    from serie_saldo import GravadorSaldo, consultar
+
+    client = Client()
+    gravador = GravadorSaldo()
+    inicio = datetime.now(timezone.utc) - timedelta(minutes=n_operacoes)
+    with medidor.medir("gravar"):
+        for i in range(n_operacoes):
+            total = float(client.futures_account()["totalWalletBalance"])
+            gravador.gravar({"timestamp": (inicio + timedelta(minutes=i)).isoformat(), "total": total})
+        gravador.fechar()
+    with medidor.medir("consultar"):
+        consultar(inicio.timestamp(), time.time())
+
+
+def _caso_execucao_fatiada(medidor, n_operacoes):
+    # notional de n_operacoes x 1000 USD por perna contra o livro simulado;
+    # cada modo comeca com o livro recomposto
+    from binance.client import Client
+    from execucao_fatiada import executar_fatiado
+    from metadados import registro, calcular_qty
+    from precos import get_snapshot
+
+    client = Client()
+    perp = registro.contratos("PERPETUAL")[0]["symbol"]
+    fut = registro.contrato(perp, "CURRENT_QUARTER")
+    preco_perp, preco_fut = get_snapshot().par(perp, fut)
+    volume = n_operacoes * 1000.0
+    pernas = [
+        {"symbol": perp, "side": "SELL", "quantity": calcular_qty(volume, preco_perp, perp)},
+        {"symbol": fut, "side": "BUY", "quantity": calcular_qty(volume, preco_fut, fut)},
+    ]
+    for modo in ("mercado", "profundidade", "twap"):
+        medidor.fake.livros.clear()
+        with medidor.medir(modo) as extra:
+            _, relatorio = executar_fatiado(client, pernas, modo=modo, intervalo=0.2)
+            extra["fatias"] = relatorio["fatias"]
+            extra["slippage_bps"] = round(sum(p["slippage_bps"] for p in relatorio["pernas"]), 3)
+
+
+def _caso_serie_basis(medidor, n_operacoes):
+    # n_operacoes minutos de amostras por segundo para cada trimestral, depois
+    # leitura do intervalo inteiro (copia das amostras validas) e por particao (views)
+    from metadados import registro
+    from serie_basis import SerieBasis
+
+    serie = SerieBasis()
+    futuros = [c["symbol"] for c in registro.contratos("CURRENT_QUARTER")]
+    fim = int(time.time())
+    inicio = fim - n_operacoes * 60
+    leitura = {"preco_perp": 100.0, "preco_futuro": 101.0, "basis_pct": 0.01, "basis_dia": 0.0001,
+               "funding_previsto": 0.0001}
+    with medidor.medir("gravar") as extra:
+        for t in range(inicio, fim):
+            for futuro in futuros:
+                serie.gravar(futuro, t, leitura)
+        serie.sincronizar()
+        extra["amostras"] = (fim - inicio) * len(futuros)
+    with medidor.medir("ler") as extra:
+        extra["amostras"] = sum(len(serie.ler(f, inicio, fim)["tempo_ms"]) for f in futuros)
+    with medidor.medir("particoes"):
+        for futuro in futuros:
+            for _, views in serie.particoes(futuro, inicio, fim):
+                views["basis_dia"].max()
+
+
+def _caso_estatisticas_funding(medidor, n_operacoes):
+    # carga inicial das janelas de todos os perpetuos, releitura sem eventos novos
+    # (o que cada render do scanner paga) e n_operacoes * 1000 eventos sinteticos
+    # aplicados um a um
+    from estatisticas_funding import EstatisticasFunding, EstatisticasSimbolo
+    from scanner import pares_trimestrais
+
+    estatisticas = EstatisticasFunding()
+    perps = sorted({p[0] for p in pares_trimestrais()})
+    with medidor.medir("carga") as extra:
+        estatisticas.atualizar_varios(perps)
+        extra["eventos"] = sum(estatisticas.resumo(s)["30d"]["n"] for s in perps)
+    with medidor.medir("releitura"):
+        for _ in range(10):
+            estatisticas.atualizar_varios(perps)
+    simbolo = EstatisticasSimbolo()
+    with medidor.medir("eventos") as extra:
+        for i in range(n_operacoes * 1000):
+            simbolo.adicionar(i * 8 * 3600000, 0.0001 * ((i % 7) - 2))
+        extra["eventos"] = n_operacoes * 1000
+
+
+def _partida_pagina(pagina, url):
+    # processo novo por pagina: o que a pagina importa e constroi entra no tempo
+    sys.path.insert(0, DIR_REPO)
+    from streamlit.testing.v1 import AppTest
+
+    _apontar_client(url)
+    # o primeiro run do AppTest carrega o runtime do streamlit, que no servidor
+    # ja esta no ar; o primeiro run de outra pagina vazia mede o custo fixo do
+    # harness (varredura de componentes), descontado do tempo da pagina
+    AppTest.from_string("import streamlit as st").run()
+    vazia = AppTest.from_string("import streamlit as st")
+    inicio = time.perf_counter()
+    vazia.run()
+    custo_harness = time.perf_counter() - inicio
+    at = AppTest.from_file(os.path.join(DIR_REPO, pagina), default_timeout=3600)
+    inicio = time.perf_counter()
+    at.run()
+    tempo = max(time.perf_counter() - inicio - custo_harness, 0.0)
+    erro = str(at.exception[0].value) if at.exception else None
+    return tempo, [m for m in MODULOS_PESADOS if m in sys.modules], erro
+
+
+def _caso_partida_fria(medidor, n_operacoes):
+    for pagina, (orcamento, proibidos) in ORCAMENTO_PARTIDA.items():
+        with medidor.medir(pagina.removesuffix(".py")[:12]) as extra:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                tempo, carregados, erro = pool.submit(_partida_pagina, pagina, medidor.fake.url).result()
+            if erro:
+                raise RuntimeError(f"{pagina}: {erro}")
+            extra["primeiro_rerun_s"] = round(tempo, 4)
+            extra["orcamento_s"] = orcamento
+            extra["modulos"] = carregados
+            extra["fora_do_orcamento"] = ([f"{tempo:.2f}s > {orcamento}s"] if tempo > orcamento else []) + [
+                f"importou {m}" for m in carregados if m in proibidos]
+
+
+def rodar_caso(caso, n_simbolos, n_operacoes, latencia=0.0):
+    sys.path.insert(0, DIR_REPO)
+    fake = _preparar(n_simbolos, n_operacoes, latencia)
+    medidor = _Medidor(fake)
+    try:
+        globals()[f"_caso_{caso}"](medidor, n_operacoes)
+        erro = None
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+    finally:
+        fake.parar()
+    base = {"caso": caso, "simbolos": n_simbolos, "operacoes": n_operacoes, "erro": erro}
+    return [{**base, **fase} for fase in medidor.fases] or [base]
+
+
+# Execucao e comparacao
+
+def rodar(casos, simbolos, operacoes, latencia=0.0):
+    resultados = []
+    contexto = get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto, max_tasks_per_child=1) as pool:
+        for caso in casos:
+            for n_simbolos in simbolos:
+                for n_operacoes in operacoes:
+                    linhas = pool.submit(rodar_caso, caso, n_simbolos, n_operacoes, latencia).result()
+                    for linha in linhas:
+                        print(_formatar(linha), flush=True)
+                    resultados += linhas
+    return resultados
+
+
+def _chave(linha):
+    return (linha["caso"], linha["simbolos"], linha["operacoes"], linha.get("fase"))
+
+
+def _formatar(linha):
+    if linha.get("erro") and "fase" not in linha:
+        return f"{linha['caso']:<16} s={linha['simbolos']:<4} ops={linha['operacoes']:<6} ERRO {linha['erro']}"
+    texto = (f"{linha['caso']:<16} s={linha['simbolos']:<4} ops={linha['operacoes']:<6} {linha['fase']:<12}"
+             f" {linha['tempo_s']:>9.3f}s {linha['chamadas_http']:>7} http {linha['memoria_pico_mb']:>8.1f} MB")
+    if "orcamento_s" in linha:
+        texto += f" 1o rerun {linha['primeiro_rerun_s']:.3f}s/{linha['orcamento_s']}s"
+        texto += "".join(f"  ACIMA: {f}" for f in linha["fora_do_orcamento"])
+    if "slippage_bps" in linha:
+        texto += f" {linha['fatias']:>3} fatias {linha['slippage_bps']:>8.3f} bps"
+    return texto + (f"  ERRO {linha['erro']}" if linha.get("erro") else "")
+
+
+def comparar(resultados, base, tolerancia=TOLERANCIA_PADRAO):
+    # Regressoes de tempo, chamadas HTTP ou memoria acima da tolerancia
+    anteriores = {_chave(l): l for l in base if "fase" in l}
+    regressoes = []
+    for linha in resultados:
+        anterior = anteriores.get(_chave(linha))
+        if not anterior or "fase" not in linha:
+            continue
+        for metrica in ("tempo_s", "chamadas_http", "memoria_pico_mb", "slippage_bps", "primeiro_rerun_s"):
+            if metrica not in linha or metrica not in anterior:
+                continue
+            antes, agora = anterior[metrica], linha[metrica]
+            if antes and (agora - antes) / antes > tolerancia:
+                caso, simbolos, operacoes, fase = _chave(linha)
+                regressoes.append(f"{caso} s={simbolos} ops={operacoes} {fase} {metrica}: {antes} -> {agora}")
+    return regressoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de ponta a ponta contra a API fake da Binance")
+    parser.add_argument("--casos", nargs="+", choices=CASOS, default=list(CASOS))
+    parser.add_argument("--simbolos", nargs="+", type=int, default=[2, 20])
+    parser.add_argument("--operacoes", nargs="+", type=int, default=[1, 100, 1000])
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos de atraso por requisição no fake")
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--base", help="resultados anteriores (JSON) para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO)
+    args = parser.parse_args()
+
+    resultados = rodar(args.casos, args.simbolos, args.operacoes, args.latencia)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=1)
+    falhas = [f"ORÇAMENTO {l['caso']} s={l['simbolos']} {l['fase']}: {f}"
+              for l in resultados for f in l.get("fora_do_orcamento", [])]
+    if args.base:
+        with open(args.base) as f:
+            falhas += [f"REGRESSÃO {r}" for r in comparar(resultados, json.load(f), args.tolerancia)]
+    for falha in falhas:
+        print(falha)
+    sys.exit(1 if falhas else 0)
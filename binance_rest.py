@@ -0,0 +1,116 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+from agendador import agendador, peso_rota, prioridade_rota
+from metricas import medir
+
+# Cliente HTTP compartilhado por todo acesso REST: uma Session por processo
+# com pool de conexoes keep-alive, timeouts limitados e retry com jitter
+# apenas para GETs (ordens nunca sao reenviadas automaticamente). Toda
+# requisicao passa pelo agendador de peso da API (agendador.py). requests e
+# python-binance so sao importados na primeira requisicao, e o Client das
+# paginas (ClienteTardio) so e criado na primeira chamada de metodo.
+
+# URL base da API de futuros (pode apontar para um servidor local de testes)
+FAPI_URL = os.getenv("BINANCE_FAPI_URL", "https://fapi.binance.com")
+TIMEOUT_CONEXAO = float(os.getenv("HTTP_TIMEOUT_CONEXAO", 3.05))  # segundos
+TIMEOUT_LEITURA = float(os.getenv("HTTP_TIMEOUT_LEITURA", 10))  # segundos
+TENTATIVAS = int(os.getenv("HTTP_TENTATIVAS", 3))
+COMPRESSAO = os.getenv("HTTP_COMPRESSAO", "1") == "1"
+TAMANHO_POOL = 16  # conexoes por host (threads do backfill de funding e do scanner)
+STATUS_RETRY = (429, 500, 502, 503, 504)  # 418 (IP banido) nunca e repetido
+
+_lock = threading.Lock()
+_session = None
+
+
+def _retry():
+    from urllib3.util.retry import Retry
+
+    return Retry(
+        total=TENTATIVAS,
+        backoff_factor=0.3,
+        backoff_jitter=0.3,
+        status_forcelist=STATUS_RETRY,
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def montar_session(session=None):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = session or requests.Session()
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=TAMANHO_POOL, max_retries=_retry())
+    session.mount("https://", adaptador)
+    session.mount("http://", adaptador)
+    session.headers["Accept-Encoding"] = "gzip, deflate" if COMPRESSAO else "identity"
+    session.hooks["response"].append(agendador.registrar_resposta)
+    return session
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = montar_session()
+    return _session
+
+
+def get_json(path, params=None, timeout=None, prioridade=None):
+    prioridade = prioridade if prioridade is not None else prioridade_rota("GET", path)
+    with agendador.reservar(peso_rota(path, params), prioridade), medir(f"rest {path}"):
+        resp = get_session().get(f"{FAPI_URL}{path}", params=params, timeout=timeout or (TIMEOUT_CONEXAO, TIMEOUT_LEITURA))
+    resp.raise_for_status()
+    return resp.json()
+
+
+def criar_client(api_key=None, api_secret=None):
+    # Client da python-binance com o mesmo pool, retry e timeouts
+    from binance.client import Client
+
+    # sem ping na construcao: falhas de rede aparecem na primeira chamada real
+    client = Client(api_key, api_secret, requests_params={"timeout": (TIMEOUT_CONEXAO, TIMEOUT_LEITURA)}, ping=False)
+    montar_session(client.session)
+    _agendar_client(client)
+    return client
+
+
+def _agendar_client(client):
+    # ordens (POST/DELETE) entram na fila com prioridade maxima; conta e
+    # posicoes como marcacao
+    original = client._request
+
+    def _request(method, uri, signed, force_params=False, **kwargs):
+        path = urlparse(uri).path
+        with agendador.reservar(peso_rota(path, kwargs.get("data")), prioridade_rota(method, path)), \
+                medir(f"client {method.upper()} {path}"):
+            return original(method, uri, signed, force_params, **kwargs)
+
+    client._request = _request
+
+
+class ClienteTardio:
+    # Mesma interface do Client; importa a python-binance e cria o Client na
+    # primeira chamada de metodo, entao paginas que nao acessam a conta nao
+    # pagam o import nem a montagem da sessao
+    def __init__(self, api_key=None, api_secret=None):
+        self._credenciais = (api_key, api_secret)
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def criado(self):
+        return self._client is not None
+
+    def _obter(self):
+        with self._lock:
+            if self._client is None:
+                self._client = criar_client(*self._credenciais)
+        return self._client
+
+    def __getattr__(self, nome):
+        return getattr(self._obter(), nome)
@@ -0,0 +1,101 @@
+from metadados import calcular_qty, registro
+
+# Compensacao (netting) das pernas de varias operacoes executadas juntas.
+# Operacoes empilhadas no mesmo par (perpetuo, trimestral) viram uma unica
+# ordem por simbolo com a soma das quantidades de cada operacao (que ja sao
+# multiplas do lote, entao a soma tambem e); compras e vendas do mesmo simbolo
+# se anulam. O preco medio realizado de cada simbolo volta para as operacoes
+# que participaram dele, e cada uma fica com a sua propria quantidade.
+
+
+def quantidades(op):
+    # (qty perpetuo, qty trimestral) da operacao: as gravadas quando a execucao
+    # foi parcial ou, no caso normal, as calculadas pelo volume e precos de entrada
+    qty_perp = op.get("qty_perpetuo")
+    qty_fut = op.get("qty_futuro")
+    if qty_perp is None:
+        qty_perp = calcular_qty(op["volume_usd"], op["preco_entrada_perp"], op["symbol_perpetuo"])
+    if qty_fut is None:
+        qty_fut = calcular_qty(op["volume_usd"], op["preco_entrada_futuro"], op["symbol_futuro"])
+    return qty_perp, qty_fut
+
+
+def exposicao_liquida(abertas):
+    # uma linha por par (perpetuo, trimestral): quantidades vendidas no perpetuo
+    # (negativa) e compradas no trimestral que um fechamento em lote enviaria
+    pares = {}
+    for op in abertas:
+        chave = (op["symbol_perpetuo"], op["symbol_futuro"])
+        linha = pares.setdefault(chave, {
+            "perpetuo": chave[0], "futuro": chave[1], "operacoes": [], "volume_usd": 0.0,
+            "qty_perpetuo": 0.0, "qty_futuro": 0.0,
+        })
+        linha["operacoes"].append(op["id"])
+        linha["volume_usd"] += op["volume_usd"]
+        qty_perp, qty_fut = quantidades(op)
+        linha["qty_perpetuo"] -= qty_perp
+        linha["qty_futuro"] += qty_fut
+    for linha in pares.values():
+        linha["qty_perpetuo"] = round(linha["qty_perpetuo"], 8)
+        linha["qty_futuro"] = round(linha["qty_futuro"], 8)
+    return [pares[chave] for chave in sorted(pares)]
+
+
+def consolidar(pernas_por_operacao):
+    # [[perna, ...], ...] -> uma ordem por simbolo com a quantidade liquida
+    liquido = {}
+    for pernas in pernas_por_operacao:
+        for perna in pernas:
+            sinal = 1 if perna["side"] == "BUY" else -1
+            liquido[perna["symbol"]] = liquido.get(perna["symbol"], 0.0) + sinal * perna["quantity"]
+    return [
+        {"symbol": symbol, "side": "BUY" if qty > 0 else "SELL", "quantity": round(abs(qty), 8)}
+        for symbol, qty in sorted(liquido.items())
+        if round(abs(qty), 8) > 0
+    ]
+
+
+def precos_realizados(resultados):
+    # {symbol: preco medio executado} das respostas RESULT (uma ou varias fatias por simbolo)
+    custo, executado = {}, {}
+    for r in resultados:
+        resposta = r.get("resposta") or {}
+        qty = float(resposta.get("executedQty") or 0)
+        preco = float(resposta.get("avgPrice") or 0)
+        if qty > 0 and preco > 0:
+            custo[r["symbol"]] = custo.get(r["symbol"], 0.0) + preco * qty
+            executado[r["symbol"]] = executado.get(r["symbol"], 0.0) + qty
+    return {symbol: custo[symbol] / executado[symbol] for symbol in custo}
+
+
+def quantidades_executadas(resultados):
+    # {symbol: quantidade executada} das ordens aceitas (executedQty da resposta
+    # RESULT, ou a quantidade enviada se a resposta nao trouxer)
+    executado = {}
+    for r in resultados:
+        if r.get("erro") is not None:
+            continue
+        resposta = r.get("resposta") or {}
+        qty = float(resposta["executedQty"]) if resposta.get("executedQty") is not None else r["quantity"]
+        executado[r["symbol"]] = round(executado.get(r["symbol"], 0.0) + qty, 8)
+    return executado
+
+
+def fracoes_executadas(ordens, resultados):
+    # {symbol: fracao executada da ordem liquida} (0 a 1) de um lote que falhou.
+    # Simbolos sem ordem (quantidades anuladas) ficam de fora: nada a executar
+    executado = quantidades_executadas(resultados)
+    return {o["symbol"]: min(executado.get(o["symbol"], 0.0) / o["quantity"], 1.0) for o in ordens}
+
+
+def restante(qty, fracao, symbol):
+    # parte de uma perna ainda nao executada quando a ordem liquida do simbolo
+    # executou `fracao`; todas as pernas do simbolo sao reduzidas na mesma
+    # proporcao, em lotes inteiros
+    step = registro.step_lote(symbol)
+    return round(round(qty * (1 - fracao) / step) * step, 8)
+
+
+def resumo_execucao(ordens, metricas, n_operacoes):
+    # registro gravado em cada operacao do lote: as ordens liquidas e as metricas da execucao conjunta
+    return {**metricas, "compensada": True, "operacoes_no_lote": n_operacoes, "ordens_liquidas": ordens}
@@ -0,0 +1,251 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from market_data import WS_URL
+from metricas import instrumentar
+from operacoes_store import STATUS_FINAIS, ler_estado, publicar_estado, store
+
+# Estado da conta dirigido por eventos do user-data stream de futuros. Uma
+# fotografia REST (futures_account) na conexao e a cada reconexao; depois
+# disso saldo e posicoes so mudam com ACCOUNT_UPDATE e as execucoes de ordem
+# (ORDER_TRADE_UPDATE) sao gravadas em preenchimentos por orderId, com o preco
+# medio real, que e levado as operacoes cujas execucoes usaram a ordem
+# (operacoes.conciliar_preenchimentos). Cada mudanca de saldo vai para a serie de saldo com o horario
+# do evento e o estado e publicado no banco de operacoes (estado "conta"),
+# de onde as paginas leem o saldo sem consultar a API. O listenKey e renovado
+# a cada INTERVALO_KEEPALIVE; se expirar, a reconexao pede um novo.
+
+INTERVALO_KEEPALIVE = 30 * 60  # segundos; o listenKey expira com 60 min sem renovacao
+INTERVALO_PUBLICACAO = 30  # segundos entre publicacoes do estado sem eventos (heartbeat)
+IDADE_MAXIMA_ESTADO = 3 * INTERVALO_PUBLICACAO  # estado mais velho que isso nao e usado pelas paginas
+JANELA_CONCILIACAO = 3600  # segundos em que um preenchimento sem operacao ainda e reconciliado
+ATIVOS_SALDO = ("USDT", "USDC", "FDUSD", "BFUSD")  # ativos somados no saldo total (USD)
+
+log = logging.getLogger("conta_stream")
+
+
+def _iso(momento_ms):
+    return datetime.fromtimestamp(momento_ms / 1000, tz=timezone.utc).isoformat()
+
+
+class ContaStream:
+    def __init__(self, client, gravador=None, url=WS_URL, loja=store):
+        self.client = client
+        self.gravador = gravador
+        self.url = url
+        self.loja = loja
+        self.conectado = False
+        self.reconexoes = 0
+        self.eventos = 0
+        self.saldos = {}  # ativo -> {"carteira", "cruzado"}
+        self.posicoes = {}  # symbol -> {"quantidade", "preco_entrada"}
+        self.disponivel = None
+        self.evento_ms = None
+        self._ultimo_total = None
+        self._ultimo_ms = 0  # horario (relogio da corretora) do ultimo ponto gravado na serie
+        self._fotografia_ms = 0
+        self._listen_key = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._ws = None
+        self._threads = []
+
+    # Estado
+
+    def total(self):
+        with self._lock:
+            return sum(b["carteira"] for ativo, b in self.saldos.items() if ativo in ATIVOS_SALDO)
+
+    def carregar(self):
+        # fotografia REST (peso 5) que cobre os eventos perdidos enquanto desconectado.
+        # O horario da fotografia vem do relogio da corretora, o mesmo do E/T dos
+        # eventos, e e lido antes da conta: eventos anteriores ja estao nela
+        agora = int(self.client.futures_time()["serverTime"])
+        conta = self.client.futures_account()
+        with self._lock:
+            self.saldos = {
+                a["asset"]: {"carteira": float(a["walletBalance"]), "cruzado": float(a["crossWalletBalance"])}
+                for a in conta.get("assets", [])
+            } or {"USDT": {"carteira": float(conta["totalWalletBalance"]),
+                           "cruzado": float(conta["totalWalletBalance"])}}
+            self.posicoes = {
+                p["symbol"]: {"quantidade": float(p["positionAmt"]), "preco_entrada": float(p["entryPrice"])}
+                for p in conta.get("positions", []) if float(p["positionAmt"])
+            }
+            self.disponivel = float(conta["availableBalance"])
+            self.evento_ms = agora
+            self._fotografia_ms = agora
+        self._gravar(agora)
+        self.publicar()
+
+    @instrumentar("conta.aplicar")
+    def aplicar(self, evento):
+        tipo = evento.get("e")
+        self.eventos += 1
+        if tipo == "ACCOUNT_UPDATE":
+            if evento["E"] < self._fotografia_ms:
+                # enfileirado antes da fotografia (reconexao): o estado dela e mais novo
+                return
+            with self._lock:
+                for b in evento["a"].get("B", []):
+                    anterior = self.saldos.get(b["a"], {}).get("carteira", 0.0)
+                    self.saldos[b["a"]] = {"carteira": float(b["wb"]), "cruzado": float(b["cw"])}
+                    if self.disponivel is not None and b["a"] in ATIVOS_SALDO:
+                        # o evento nao traz o disponivel: acompanha a variacao da carteira ate a proxima fotografia
+                        self.disponivel += float(b["wb"]) - anterior
+                for p in evento["a"].get("P", []):
+                    if float(p["pa"]):
+                        self.posicoes[p["s"]] = {"quantidade": float(p["pa"]), "preco_entrada": float(p["ep"])}
+                    else:
+                        self.posicoes.pop(p["s"], None)
+                self.evento_ms = evento["E"]
+            self._gravar(evento.get("T") or evento["E"])
+            self.publicar()
+        elif tipo == "ORDER_TRADE_UPDATE":
+            o = evento["o"]
+            # execucoes e o encerramento da ordem (IOC expirada ou cancelada,
+            # com a quantidade acumulada executada ate ali)
+            if o["x"] == "TRADE" or o["X"] in STATUS_FINAIS:
+                self.loja.registrar_preenchimento(o["i"], o["s"], o["S"], float(o["ap"]), float(o["z"]), o["X"], o["T"])
+                if o["X"] in STATUS_FINAIS:
+                    self._conciliar([o["i"]])
+        elif tipo == "listenKeyExpired":
+            self._renovar_conexao()
+
+    def _conciliar(self, order_ids):
+        from operacoes import conciliar_preenchimentos
+
+        try:
+            conciliar_preenchimentos(order_ids, self.loja)
+        except Exception:
+            log.exception("Erro ao conciliar preenchimentos")
+
+    def _gravar(self, momento_ms):
+        total = self.total()
+        if self.gravador is None or total == self._ultimo_total:
+            return
+        # a serie nunca volta no tempo, mesmo com eventos fora de ordem
+        self._ultimo_ms = max(momento_ms, self._ultimo_ms)
+        self.gravador.gravar({"timestamp": _iso(self._ultimo_ms), "total": total})
+        self._ultimo_total = total
+
+    def publicar(self):
+        with self._lock:
+            estado = {
+                "total": sum(b["carteira"] for ativo, b in self.saldos.items() if ativo in ATIVOS_SALDO),
+                "disponivel": self.disponivel,
+                "saldos": dict(self.saldos),
+                "posicoes": dict(self.posicoes),
+                "evento_ms": self.evento_ms,
+                "conectado": self.conectado,
+            }
+        publicar_estado("conta", estado)
+
+    # Conexao
+
+    def _renovar_conexao(self):
+        # listenKey invalido: a reconexao pede outro e refaz a fotografia
+        self._listen_key = None
+        if self._ws:
+            self._ws.close()
+
+    def _on_open(self, ws):
+        if self._parar.is_set():
+            # parar() chamado antes do run_forever comecar
+            ws.close()
+            return
+        self.conectado = True
+        self._espera = 1
+        try:
+            self.carregar()
+        except Exception:
+            log.exception("Erro ao carregar a fotografia da conta")
+
+    def _on_message(self, ws, mensagem):
+        self.aplicar(json.loads(mensagem))
+
+    def _on_close(self, ws, *args):
+        self.conectado = False
+
+    def _loop(self, websocket):
+        self._espera = 1
+        while not self._parar.is_set():
+            try:
+                if self._listen_key is None:
+                    self._listen_key = self.client.futures_stream_get_listen_key()
+                self._ws = websocket.WebSocketApp(
+                    f"{self.url}/ws/{self._listen_key}",
+                    on_open=self._on_open,
+                    on_message=self._on_message,
+                    on_close=self._on_close,
+                    on_error=lambda ws, erro: None,
+                )
+                self._ws.run_forever(ping_interval=60, ping_timeout=20)
+            except Exception:
+                log.exception("Erro no user-data stream")
+            self.conectado = False
+            self.publicar()
+            if self._parar.is_set():
+                break
+            self.reconexoes += 1
+            self._parar.wait(self._espera)
+            self._espera = min(self._espera * 2, 60)
+
+    def _manter(self):
+        renovado_em = time.monotonic()
+        while not self._parar.wait(INTERVALO_PUBLICACAO):
+            if self.conectado:
+                self.publicar()
+            # preenchimentos que chegaram antes de a operacao ser gravada
+            pendentes = self.loja.preenchimentos_pendentes(int((time.time() - JANELA_CONCILIACAO) * 1000))
+            if pendentes:
+                self._conciliar(pendentes)
+            if self._listen_key and time.monotonic() - renovado_em >= INTERVALO_KEEPALIVE:
+                try:
+                    self.client.futures_stream_keepalive(self._listen_key)
+                except Exception:
+                    log.exception("Erro ao renovar o listenKey")
+                    self._renovar_conexao()
+                renovado_em = time.monotonic()
+
+    def iniciar(self):
+        if not self._threads:
+            import websocket
+
+            self._parar.clear()
+            self._threads = [
+                threading.Thread(target=self._loop, args=(websocket,), name="conta-stream", daemon=True),
+                threading.Thread(target=self._manter, name="conta-keepalive", daemon=True),
+            ]
+            for t in self._threads:
+                t.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._ws:
+            self._ws.close()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+        self.conectado = False
+        self.publicar()
+        if self._listen_key:
+            try:
+                self.client.futures_stream_close(self._listen_key)
+            except Exception:
+                pass
+            self._listen_key = None
+
+
+def saldo_publicado(idade_maxima=IDADE_MAXIMA_ESTADO):
+    # (total, disponivel) publicados por um stream conectado, ou None
+    conta, atualizado_em = ler_estado("conta")
+    if not conta or not conta.get("conectado") or atualizado_em is None:
+        return None
+    if time.time() - atualizado_em > idade_maxima or conta.get("disponivel") is None:
+        return None
+    return conta["total"], conta["disponivel"]
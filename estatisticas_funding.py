@@ -0,0 +1,166 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from funding_store import store as funding_store
+from metricas import instrumentar
+
+# Estatisticas de funding por simbolo atualizadas evento a evento. Cada
+# janela (1d/7d/30d, terminando no ultimo funding) guarda somas correntes da
+# taxa, do quadrado e de log(1 + taxa); um evento novo entra e os que saem da
+# janela sao subtraidos, entao soma, media, desvio e APR composto custam O(1)
+# por evento. A EWMA usa meia-vida em tempo, o que acomoda simbolos com
+# intervalo de funding de 8h, 4h ou 1h. A janela 1d e o funding diario usado
+# pelo gatilho de entrada (para intervalos de 8h, a soma dos 3 ultimos
+# periodos). Os eventos vem do funding_store e so o que chegou desde o ultimo
+# funding processado, ate o fim da cobertura do simbolo, e lido a cada
+# atualizacao.
+
+JANELAS = {"1d": 86400000, "7d": 7 * 86400000, "30d": 30 * 86400000}  # ms
+MEIA_VIDA_EWMA = 3 * 86400000  # ms
+ANO_MS = 365 * 86400000
+RECALCULO_MINIMO = 64  # remocoes antes de refazer as somas (erro de arredondamento)
+THREADS_ATUALIZACAO = 8
+
+
+class _Janela:
+    def __init__(self, duracao_ms):
+        self.duracao_ms = duracao_ms
+        self.eventos = deque()
+        self.soma = self.soma_quad = self.soma_log = 0.0
+        self._remocoes = 0
+
+    def adicionar(self, tempo_ms, taxa):
+        self.eventos.append((tempo_ms, taxa))
+        self.soma += taxa
+        self.soma_quad += taxa * taxa
+        self.soma_log += math.log1p(taxa)
+        limite = tempo_ms - self.duracao_ms
+        while self.eventos[0][0] <= limite:
+            _, antiga = self.eventos.popleft()
+            self.soma -= antiga
+            self.soma_quad -= antiga * antiga
+            self.soma_log -= math.log1p(antiga)
+            self._remocoes += 1
+        # somas refeitas a cada len(janela) remocoes: custo amortizado O(1)
+        if self._remocoes >= max(len(self.eventos), RECALCULO_MINIMO):
+            self.soma = sum(t for _, t in self.eventos)
+            self.soma_quad = sum(t * t for _, t in self.eventos)
+            self.soma_log = sum(math.log1p(t) for _, t in self.eventos)
+            self._remocoes = 0
+
+    def resumo(self, intervalo_ms):
+        n = len(self.eventos)
+        if not n:
+            return {"n": 0, "soma": 0.0, "media": None, "desvio": None, "apr_composto": None}
+        media = self.soma / n
+        variancia = (self.soma_quad - n * media * media) / (n - 1) if n > 1 else 0.0
+        # periodo coberto: a janela inteira ou, no inicio do historico, so os eventos que existem
+        cobertura = min(self.duracao_ms, self.eventos[-1][0] - self.eventos[0][0] + (intervalo_ms or 0)) or self.duracao_ms
+        return {
+            "n": n,
+            "soma": self.soma,
+            "media": media,
+            "desvio": math.sqrt(max(variancia, 0.0)),
+            "apr_composto": math.expm1(self.soma_log * ANO_MS / cobertura),
+        }
+
+
+class EstatisticasSimbolo:
+    def __init__(self, janelas=JANELAS, meia_vida=MEIA_VIDA_EWMA):
+        self.janelas = {nome: _Janela(duracao) for nome, duracao in janelas.items()}
+        self.meia_vida = meia_vida
+        self.ewma = None
+        self.ewma_var = 0.0
+        self.ultimo_ms = None
+        self.intervalo_ms = None
+        self.lock = threading.Lock()
+
+    def adicionar(self, tempo_ms, taxa):
+        # eventos repetidos ou fora de ordem sao ignorados
+        if self.ultimo_ms is not None and tempo_ms <= self.ultimo_ms:
+            return False
+        for janela in self.janelas.values():
+            janela.adicionar(tempo_ms, taxa)
+        if self.ewma is None:
+            self.ewma = taxa
+        else:
+            self.intervalo_ms = tempo_ms - self.ultimo_ms
+            alfa = 1 - 0.5 ** (self.intervalo_ms / self.meia_vida)
+            desvio = taxa - self.ewma
+            self.ewma += alfa * desvio
+            self.ewma_var = (1 - alfa) * (self.ewma_var + alfa * desvio * desvio)
+        self.ultimo_ms = tempo_ms
+        return True
+
+    def resumo(self):
+        periodos_dia = 86400000 / self.intervalo_ms if self.intervalo_ms else None
+        return {
+            **{nome: janela.resumo(self.intervalo_ms) for nome, janela in self.janelas.items()},
+            "ewma": self.ewma,
+            "ewma_desvio": math.sqrt(self.ewma_var),
+            "ewma_dia": self.ewma * periodos_dia if self.ewma is not None and periodos_dia else None,
+            "intervalo_h": self.intervalo_ms / 3600000 if self.intervalo_ms else None,
+            "ultimo_ms": self.ultimo_ms,
+        }
+
+
+class EstatisticasFunding:
+    def __init__(self, funding=funding_store, janelas=JANELAS, meia_vida=MEIA_VIDA_EWMA):
+        self.funding = funding
+        self.janelas = janelas
+        self.meia_vida = meia_vida
+        self._simbolos = {}
+        self._lock = threading.Lock()
+
+    def _simbolo(self, symbol):
+        with self._lock:
+            if symbol not in self._simbolos:
+                self._simbolos[symbol] = EstatisticasSimbolo(self.janelas, self.meia_vida)
+            return self._simbolos[symbol]
+
+    @instrumentar("funding.estatisticas")
+    def atualizar(self, symbol):
+        # le do banco so os fundings posteriores ao ultimo processado, ate o fim
+        # da cobertura: depois dele ainda pode chegar funding publicado com atraso
+        estat = self._simbolo(symbol)
+        with estat.lock:
+            if estat.ultimo_ms is None:
+                inicio = int(time.time() * 1000) - max(self.janelas.values())
+            else:
+                inicio = estat.ultimo_ms + 1
+            self.funding.sincronizar(symbol, inicio)
+            coberto = self.funding.coberto_ate(symbol)
+            if coberto is None or coberto < inicio:
+                return estat
+            tempos, taxas = self.funding.serie(symbol, inicio, coberto)
+            for tempo_ms, taxa in zip(tempos, taxas):
+                estat.adicionar(tempo_ms, taxa)
+        return estat
+
+    def atualizar_varios(self, simbolos):
+        with ThreadPoolExecutor(max_workers=THREADS_ATUALIZACAO) as pool:
+            list(pool.map(self.atualizar, simbolos))
+
+    def resumo(self, symbol):
+        estat = self.atualizar(symbol)
+        with estat.lock:
+            return estat.resumo()
+
+    def funding_diario(self, symbol):
+        estat = self.atualizar(symbol)
+        with estat.lock:
+            return estat.janelas["1d"].soma if "1d" in estat.janelas else 0.0
+
+
+estatisticas = EstatisticasFunding()
+
+
+def resumo_funding(symbol):
+    return estatisticas.resumo(symbol)
+
+
+def funding_diario(symbol):
+    return estatisticas.funding_diario(symbol)
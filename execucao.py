@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import medir
+
+# Execucao simultanea das pernas de uma operacao (entrada, saida ou rolagem).
+# As quantidades sao calculadas antes e as ordens MARKET sao enviadas em
+# paralelo; para cada execucao sao medidas a latencia envio->ack de cada
+# perna e o desvio (skew) entre as pernas, que e a janela sem hedge.
+
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ordens")
+
+
+class ErroExecucao(Exception):
+    def __init__(self, mensagem, pernas, metricas):
+        super().__init__(mensagem)
+        self.pernas = pernas
+        self.metricas = metricas
+
+
+def _enviar(client, perna):
+    envio = time.perf_counter()
+    try:
+        with medir("futures_create_order"):
+            resposta = client.futures_create_order(
+                symbol=perna["symbol"], side=perna["side"], type="MARKET", quantity=perna["quantity"],
+                newOrderRespType="RESULT",  # resposta com preco medio e quantidade executada
+            )
+        erro = None
+    except Exception as e:
+        resposta, erro = None, e
+    return {**perna, "resposta": resposta, "erro": erro, "envio": envio, "ack": time.perf_counter()}
+
+
+def _metricas(resultados, inicio):
+    envios = [r["envio"] for r in resultados]
+    acks = [r["ack"] for r in resultados]
+    return {
+        "pernas": [
+            {"symbol": r["symbol"], "side": r["side"], "quantity": r["quantity"],
+             "latencia_ms": round((r["ack"] - r["envio"]) * 1000, 2),
+             # orderId liga a perna aos preenchimentos do user-data stream
+             "order_id": (r["resposta"] or {}).get("orderId")}
+            for r in resultados
+        ],
+        "skew_envio_ms": round((max(envios) - min(envios)) * 1000, 2),
+        "skew_ack_ms": round((max(acks) - min(acks)) * 1000, 2),
+        "total_ms": round((max(acks) - inicio) * 1000, 2),
+    }
+
+
+def _erro(resultados, metricas):
+    falhas = [r for r in resultados if r["erro"] is not None]
+    if not falhas:
+        return None
+    executadas = [f"{r['side']} {r['symbol']}" for r in resultados if r["erro"] is None]
+    detalhes = "; ".join(f"{r['side']} {r['symbol']}: {r['erro']}" for r in falhas)
+    return ErroExecucao(
+        f"Falha em {len(falhas)} perna(s) ({detalhes}). Executadas: {', '.join(executadas) or 'nenhuma'}",
+        resultados, metricas,
+    )
+
+
+def executar_pernas(client, pernas):
+    # pernas: [{"symbol": ..., "side": "BUY"/"SELL", "quantity": ...}, ...]
+    inicio = time.perf_counter()
+    futuros = [_pool.submit(_enviar, client, p) for p in pernas]
+    resultados = [f.result() for f in futuros]
+    metricas = _metricas(resultados, inicio)
+    erro = _erro(resultados, metricas)
+    if erro:
+        raise erro
+    return resultados, metricas
@@ -0,0 +1,130 @@
+import math
+import os
+import time
+
+from execucao import ErroExecucao, executar_pernas
+from metadados import registro
+from metricas import instrumentar
+
+# Execucao fatiada para operacoes de notional alto. Le o livro de ofertas das
+# duas pernas e divide a operacao em fatias pareadas (perpetuo + trimestral
+# com a mesma fracao do total, em lotes inteiros), enviadas em sequencia; as
+# duas pernas de cada fatia saem juntas, entao o hedge fica balanceado fatia a
+# fatia. Modo "profundidade": cada fatia consome no maximo FRACAO_PROFUNDIDADE
+# da liquidez a ate BPS_PROFUNDIDADE do mid na perna mais rasa. Modo "twap":
+# FATIAS_TWAP fatias iguais. O resultado inclui o preco medio realizado e o
+# slippage contra o mid do inicio por perna.
+
+MODO_FATIAS = os.getenv("EXEC_MODO", "profundidade")  # "profundidade", "twap" ou "mercado" (uma fatia)
+LIMIAR_FATIAMENTO = float(os.getenv("EXEC_LIMIAR_FATIAS", 5000))  # USD por perna a partir do qual fatia
+INTERVALO_FATIAS = float(os.getenv("EXEC_INTERVALO_FATIAS", 1.0))  # segundos entre fatias
+BPS_PROFUNDIDADE = 10  # liquidez considerada: niveis ate 10 bps do mid
+FRACAO_PROFUNDIDADE = 0.25
+FATIAS_TWAP = 5
+MAX_FATIAS = 50
+LIMITE_LIVRO = 50  # niveis lidos por lado (peso 2)
+
+
+def ler_livro(client, symbol, limite=LIMITE_LIVRO):
+    livro = client.futures_order_book(symbol=symbol, limit=limite)
+    return ([(float(p), float(q)) for p, q in livro["bids"]],
+            [(float(p), float(q)) for p, q in livro["asks"]])
+
+
+def mid(livro):
+    bids, asks = livro
+    return (bids[0][0] + asks[0][0]) / 2
+
+
+def profundidade(livro, side, bps=BPS_PROFUNDIDADE):
+    # quantidade que uma ordem `side` encontra ate `bps` do mid
+    centro = mid(livro)
+    niveis = livro[1] if side == "BUY" else livro[0]
+    return sum(q for p, q in niveis if abs(p - centro) / centro * 10000 <= bps)
+
+
+def dividir(qty, step, n):
+    # n quantidades multiplas de step somando qty; o lote que sobra vai para as primeiras
+    lotes = round(qty / step)
+    base, resto = divmod(lotes, n)
+    return [round((base + (i < resto)) * step, 8) for i in range(n)]
+
+
+def numero_fatias(pernas, livros, modo=MODO_FATIAS):
+    if modo == "mercado":
+        n = 1
+    elif modo == "twap":
+        n = FATIAS_TWAP
+    else:
+        n = 1
+        for perna in pernas:
+            limite = profundidade(livros[perna["symbol"]], perna["side"]) * FRACAO_PROFUNDIDADE
+            n = max(n, math.ceil(perna["quantity"] / limite) if limite > 0 else MAX_FATIAS)
+    # nenhuma fatia pode ficar sem ao menos um lote em alguma perna
+    lotes = min(round(p["quantity"] / registro.step_lote(p["symbol"])) for p in pernas)
+    return max(min(n, MAX_FATIAS, lotes), 1)
+
+
+def planejar_fatias(pernas, livros, modo=MODO_FATIAS):
+    # [[perna_fatia, ...], ...]: a fatia i de cada perna e a mesma fracao do total
+    n = numero_fatias(pernas, livros, modo)
+    por_perna = [dividir(p["quantity"], registro.step_lote(p["symbol"]), n) for p in pernas]
+    return [[{**p, "quantity": qtys[i]} for p, qtys in zip(pernas, por_perna)] for i in range(n)]
+
+
+def _preco_medio(resultados):
+    executado = sum(float(r["resposta"]["executedQty"]) for r in resultados)
+    custo = sum(float(r["resposta"]["avgPrice"]) * float(r["resposta"]["executedQty"]) for r in resultados)
+    return (custo / executado if executado else None), executado
+
+
+def _relatorio(pernas, livros, por_perna, fatias_metricas, modo, inicio):
+    relatorio = []
+    for perna, resultados in zip(pernas, por_perna):
+        referencia = mid(livros[perna["symbol"]])
+        preco, executado = _preco_medio(resultados)
+        sinal = 1 if perna["side"] == "BUY" else -1
+        relatorio.append({
+            "symbol": perna["symbol"], "side": perna["side"], "quantity": round(executado, 8),
+            "preco_medio": preco, "mid": referencia,
+            # positivo = pior que o mid
+            "slippage_bps": round(sinal * (preco - referencia) / referencia * 10000, 3) if preco else None,
+        })
+    return {
+        "modo": modo,
+        "fatias": len(fatias_metricas),
+        "pernas": relatorio,
+        "skew_ack_ms": max(m["skew_ack_ms"] for m in fatias_metricas),
+        "total_ms": round((time.perf_counter() - inicio) * 1000, 2),
+        "por_fatia": fatias_metricas,
+    }
+
+
+@instrumentar("executar_fatiado")
+def executar_fatiado(client, pernas, modo=MODO_FATIAS, intervalo=INTERVALO_FATIAS):
+    # Mesma assinatura de executar_pernas; devolve (resultados por perna, relatorio)
+    inicio = time.perf_counter()
+    livros = {p["symbol"]: ler_livro(client, p["symbol"]) for p in pernas}
+    fatias = planejar_fatias(pernas, livros, modo)
+    por_perna = [[] for _ in pernas]
+    fatias_metricas = []
+    for i, fatia in enumerate(fatias):
+        if i and intervalo:
+            time.sleep(intervalo)
+        try:
+            resultados, metricas = executar_pernas(client, fatia)
+        except ErroExecucao as e:
+            # fatias anteriores ficam executadas e hedgeadas; a atual pode ter perna solta
+            for lista, r in zip(por_perna, e.pernas):
+                if r["erro"] is None:
+                    lista.append(r)
+            relatorio = _relatorio(pernas, livros, por_perna, fatias_metricas + [e.metricas], modo, inicio)
+            raise ErroExecucao(f"Fatia {i + 1}/{len(fatias)}: {e}", por_perna, relatorio) from e
+        for lista, r in zip(por_perna, resultados):
+            lista.append(r)
+        fatias_metricas.append(metricas)
+    return por_perna, _relatorio(pernas, livros, por_perna, fatias_metricas, modo, inicio)
+
+
+def precisa_fatiar(volume_usd, limiar=LIMIAR_FATIAMENTO):
+    return volume_usd >= limiar
@@ -0,0 +1,356 @@
+import argparse
+import json
+import math
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from fake_ws import FakeWSServer
+from livro_simulado import LivroSimulado, PROFUNDIDADE_USD
+
+# API REST fake da Binance Futures para testes e benchmarks offline. Gera
+# exchangeInfo, precos, funding, klines e conta para N ativos (perpetuo +
+# dois trimestrais cada), aceita ordens e conta as chamadas por rota. Cada
+# simbolo tem um livro de ofertas simulado (livro_simulado.py): /depth le o
+# livro e as ordens a mercado sao executadas contra ele. Pode subir junto o
+# servidor WebSocket fake com os mesmos precos, que tambem faz o papel do
+# user-data stream: cada ordem executada atualiza posicao e saldo (taxa e PnL
+# realizado) e publica ORDER_TRADE_UPDATE e ACCOUNT_UPDATE para os listenKeys
+# ativos.
+
+ATIVOS_BASE = ["BTC", "ETH", "BNB", "SOL", "XRP", "ADA", "DOGE", "LINK", "DOT", "LTC"]
+PRECOS_BASE = {"BTC": 105000.0, "ETH": 2500.0, "BNB": 650.0, "SOL": 150.0, "XRP": 2.2}
+INTERVALO_FUNDING_MS = 8 * 3600 * 1000
+TAXA_ORDEM = 0.0004  # taxa taker cobrada do saldo a cada execucao
+INICIO_HISTORICO_MS = 1577836800000  # 2020-01-01
+INTERVALOS_KLINES = {"1m": 60000, "5m": 300000, "15m": 900000, "1h": 3600000, "4h": 14400000,
+                     "8h": 28800000, "1d": 86400000}
+
+# Peso aproximado de cada rota (X-MBX-USED-WEIGHT-1M)
+PESOS = {
+    "/fapi/v1/exchangeInfo": 1,
+    "/fapi/v1/ticker/price": 2,
+    "/fapi/v1/fundingRate": 1,
+    "/fapi/v1/klines": 5,
+    "/fapi/v1/continuousKlines": 5,
+    "/fapi/v1/order": 1,
+    "/fapi/v1/depth": 5,
+    "/fapi/v2/account": 5,
+    "/fapi/v1/listenKey": 1,
+}
+
+
+def _proximas_entregas(agora_ms, n=2):
+    # ultimas sextas de mar/jun/set/dez as 08:00 UTC depois de agora
+    entregas = []
+    ano = datetime.fromtimestamp(agora_ms / 1000, tz=timezone.utc).year
+    while len(entregas) < n:
+        for mes in (3, 6, 9, 12):
+            ultimo = datetime(ano + mes // 12, mes % 12 + 1, 1, 8, tzinfo=timezone.utc) - timedelta(days=1)
+            entrega = int((ultimo - timedelta(days=(ultimo.weekday() - 4) % 7)).timestamp() * 1000)
+            if entrega > agora_ms and len(entregas) < n:
+                entregas.append(entrega)
+        ano += 1
+    return entregas
+
+
+def _fase(symbol):
+    # fase deterministica por simbolo para as series sinteticas
+    return (zlib.crc32(symbol.encode()) % 1000) / 1000 * 2 * math.pi
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # cabecalho e corpo saem em writes separados
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.send_header("X-MBX-USED-WEIGHT-1M", str(self.server.peso_usado()))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _tratar(self, metodo):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        if tamanho:
+            params.update({k: v[-1] for k, v in parse_qs(self.rfile.read(tamanho).decode()).items()})
+        self.server.registrar(url.path)
+        if self.server.latencia:
+            time.sleep(self.server.latencia)
+        rota = self.server.rotas.get((metodo, url.path))
+        if rota is None:
+            self._responder(404, {"code": -1, "msg": f"rota fake inexistente: {metodo} {url.path}"})
+            return
+        try:
+            self._responder(200, rota(params))
+        except (KeyError, ValueError) as e:
+            self._responder(400, {"code": -1102, "msg": str(e)})
+
+    def do_GET(self):
+        self._tratar("GET")
+
+    def do_POST(self):
+        self._tratar("POST")
+
+    def do_PUT(self):
+        self._tratar("PUT")
+
+    def do_DELETE(self):
+        self._tratar("DELETE")
+
+
+class FakeBinance(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", porta=0, n_ativos=2, latencia=0.0, saldo=1000.0, com_ws=True,
+                 profundidade_usd=PROFUNDIDADE_USD):
+        super().__init__((host, porta), _Handler)
+        self.latencia = latencia
+        self.saldo = saldo
+        self.profundidade_usd = profundidade_usd
+        self.livros = {}
+        self.chamadas = Counter()
+        self.ordens = []
+        self.posicoes = {}  # symbol -> (quantidade com sinal, preco de entrada)
+        self.listen_keys = set()
+        self._pesos = []
+        self._lock = threading.Lock()
+
+        agora = int(time.time() * 1000)
+        entregas = _proximas_entregas(agora)
+        ativos = ATIVOS_BASE[:n_ativos] + [f"A{i:03d}" for i in range(max(n_ativos - len(ATIVOS_BASE), 0))]
+        self.simbolos = []
+        self.precos = {}
+        for ativo in ativos:
+            perp = f"{ativo}USDT"
+            base = PRECOS_BASE.get(ativo, 10.0 + zlib.crc32(ativo.encode()) % 500)
+            self._adicionar(perp, perp, ativo, "PERPETUAL", 4102444800000)
+            self.precos[perp] = base
+            for tipo, entrega in zip(("CURRENT_QUARTER", "NEXT_QUARTER"), entregas):
+                symbol = f"{perp}_{datetime.fromtimestamp(entrega / 1000, tz=timezone.utc):%y%m%d}"
+                self._adicionar(symbol, perp, ativo, tipo, entrega)
+                self.precos[symbol] = base * (1 + 0.0002 * (entrega - agora) / 86400000)
+
+        self.rotas = {
+            ("GET", "/fapi/v1/ping"): lambda p: {},
+            ("GET", "/fapi/v1/time"): lambda p: {"serverTime": int(time.time() * 1000)},
+            ("GET", "/fapi/v1/exchangeInfo"): self._exchange_info,
+            ("GET", "/fapi/v1/ticker/price"): self._ticker_price,
+            ("GET", "/fapi/v1/fundingRate"): self._funding_rate,
+            ("GET", "/fapi/v1/klines"): lambda p: self._klines(p["symbol"], p),
+            ("GET", "/fapi/v1/continuousKlines"): lambda p: self._klines(f"{p['pair']}_{p['contractType']}", p),
+            ("GET", "/fapi/v1/depth"): lambda p: self.livro(p["symbol"]).livro(int(p.get("limit", 500))),
+            ("POST", "/fapi/v1/order"): self._ordem,
+            ("GET", "/fapi/v2/account"): self._conta,
+            ("POST", "/fapi/v1/listenKey"): self._criar_listen_key,
+            ("PUT", "/fapi/v1/listenKey"): self._renovar_listen_key,
+            ("DELETE", "/fapi/v1/listenKey"): lambda p: self.listen_keys.discard(p["listenKey"]) or {},
+        }
+        self.ws = FakeWSServer(host, 0, precos=self.precos) if com_ws else None
+
+    def _adicionar(self, symbol, pair, ativo, tipo, entrega):
+        self.simbolos.append({
+            "symbol": symbol, "pair": pair, "contractType": tipo, "baseAsset": ativo,
+            "status": "TRADING", "deliveryDate": entrega,
+            "filters": [
+                {"filterType": "PRICE_FILTER", "tickSize": "0.10"},
+                {"filterType": "LOT_SIZE", "stepSize": "0.001", "minQty": "0.001"},
+            ],
+        })
+
+    @property
+    def url(self):
+        host, porta = self.server_address
+        return f"http://{host}:{porta}"
+
+    # Contadores
+
+    def registrar(self, rota):
+        with self._lock:
+            self.chamadas[rota] += 1
+            self._pesos.append((time.time(), PESOS.get(rota, 1)))
+
+    def peso_usado(self):
+        limite = time.time() - 60
+        with self._lock:
+            self._pesos = [(t, p) for t, p in self._pesos if t > limite]
+            return sum(p for _, p in self._pesos)
+
+    def total_chamadas(self):
+        with self._lock:
+            return sum(self.chamadas.values())
+
+    def zerar_contagem(self):
+        with self._lock:
+            self.chamadas.clear()
+
+    # Rotas
+
+    def _exchange_info(self, params):
+        return {"timezone": "UTC", "serverTime": int(time.time() * 1000), "symbols": self.simbolos}
+
+    def _ticker_price(self, params):
+        agora = int(time.time() * 1000)
+        if "symbol" in params:
+            return {"symbol": params["symbol"], "price": f"{self.precos[params['symbol']]:.8f}", "time": agora}
+        return [{"symbol": s, "price": f"{p:.8f}", "time": agora} for s, p in self.precos.items()]
+
+    def _taxa(self, symbol, t):
+        return 0.0001 + 0.00015 * math.sin(t / (7 * 86400000) * 2 * math.pi + _fase(symbol))
+
+    def _funding_rate(self, params):
+        symbol = params["symbol"]
+        limite = min(int(params.get("limit", 100)), 1000)
+        fim = min(int(params.get("endTime", time.time() * 1000)), int(time.time() * 1000))
+        inicio = int(params.get("startTime", fim - (limite - 1) * INTERVALO_FUNDING_MS))
+        t = max(-(-inicio // INTERVALO_FUNDING_MS) * INTERVALO_FUNDING_MS, INICIO_HISTORICO_MS)
+        linhas = []
+        while t <= fim and len(linhas) < limite:
+            linhas.append({"symbol": symbol, "fundingTime": t, "fundingRate": f"{self._taxa(symbol, t):.8f}",
+                           "markPrice": f"{self.precos.get(symbol, 0.0):.8f}"})
+            t += INTERVALO_FUNDING_MS
+        return linhas
+
+    def _klines(self, chave, params):
+        passo = INTERVALOS_KLINES[params["interval"]]
+        limite = min(int(params.get("limit", 500)), 1500)
+        fim = min(int(params.get("endTime", time.time() * 1000)), int(time.time() * 1000))
+        inicio = int(params.get("startTime", fim - limite * passo))
+        t = max(-(-inicio // passo) * passo, INICIO_HISTORICO_MS)
+        perp = chave.split("_")[0]
+        base = self.precos.get(perp, 100.0)
+        basis = 0.0 if chave == perp else 0.0002
+        velas = []
+        while t <= fim and len(velas) < limite:
+            preco = base * (1 + 0.2 * math.sin(t / (90 * 86400000) * 2 * math.pi + _fase(perp)))
+            preco *= 1 + basis * ((-t % (91 * 86400000)) / 86400000)
+            velas.append([t, f"{preco:.2f}", f"{preco:.2f}", f"{preco:.2f}", f"{preco:.2f}", "1.0",
+                          t + passo - 1, f"{preco:.2f}", 1, "0.5", f"{preco / 2:.2f}", "0"])
+            t += passo
+        return velas
+
+    def livro(self, symbol):
+        with self._lock:
+            if symbol not in self.livros:
+                self.livros[symbol] = LivroSimulado(self.precos[symbol], profundidade_usd=self.profundidade_usd)
+            return self.livros[symbol]
+
+    def _ordem(self, params):
+        with self._lock:
+            order_id = len(self.ordens) + 1
+            self.ordens.append(params)
+        symbol = params["symbol"]
+        preco, executada = self.livro(symbol).executar(params["side"], float(params["quantity"]))
+        agora = int(time.time() * 1000)
+        self._liquidar(symbol, params["side"], preco, executada, order_id, agora)
+        return {
+            "orderId": order_id, "symbol": symbol, "status": "FILLED", "side": params["side"],
+            "type": params.get("type", "MARKET"), "origQty": params["quantity"], "executedQty": f"{executada:.8f}",
+            "avgPrice": f"{preco:.8f}", "updateTime": agora,
+        }
+
+    def _liquidar(self, symbol, side, preco, qty, order_id, agora):
+        # posicao liquida por simbolo com preco medio de entrada; reducoes realizam PnL
+        sinal = 1 if side == "BUY" else -1
+        with self._lock:
+            atual, entrada = self.posicoes.get(symbol, (0.0, 0.0))
+            nova = atual + sinal * qty
+            realizado = 0.0
+            if atual and (atual > 0) != (sinal > 0):
+                fechada = min(abs(atual), qty)
+                realizado = fechada * (preco - entrada) * (1 if atual > 0 else -1)
+            if abs(nova) < 1e-12:
+                nova, entrada = 0.0, 0.0
+            elif not atual or (atual > 0) != (nova > 0):
+                entrada = preco
+            elif (atual > 0) == (sinal > 0):
+                entrada = (abs(atual) * entrada + qty * preco) / abs(nova)
+            self.posicoes[symbol] = (nova, entrada)
+            taxa = preco * qty * TAXA_ORDEM
+            self.saldo += realizado - taxa
+            saldo = self.saldo
+            chaves = list(self.listen_keys)
+        if not self.ws:
+            return
+        ordem = {
+            "e": "ORDER_TRADE_UPDATE", "E": agora, "T": agora,
+            "o": {"s": symbol, "S": side, "o": "MARKET", "q": f"{qty:.8f}", "ap": f"{preco:.8f}",
+                  "x": "TRADE", "X": "FILLED", "i": order_id, "l": f"{qty:.8f}", "z": f"{qty:.8f}",
+                  "L": f"{preco:.8f}", "n": f"{taxa:.8f}", "N": "USDT", "T": agora, "rp": f"{realizado:.8f}"},
+        }
+        conta = {
+            "e": "ACCOUNT_UPDATE", "E": agora, "T": agora,
+            "a": {"m": "ORDER",
+                  "B": [{"a": "USDT", "wb": f"{saldo:.8f}", "cw": f"{saldo:.8f}", "bc": f"{realizado - taxa:.8f}"}],
+                  "P": [{"s": symbol, "pa": f"{nova:.8f}", "ep": f"{entrada:.8f}", "up": "0", "ps": "BOTH"}]},
+        }
+        for chave in chaves:
+            self.ws.publicar_conta(chave, ordem)
+            self.ws.publicar_conta(chave, conta)
+
+    def _criar_listen_key(self, params):
+        chave = f"fake{len(self.listen_keys) + 1:04d}{int(time.time() * 1000) % 100000:05d}"
+        with self._lock:
+            self.listen_keys.add(chave)
+        return {"listenKey": chave}
+
+    def _renovar_listen_key(self, params):
+        if params["listenKey"] not in self.listen_keys:
+            raise ValueError("This listenKey does not exist.")
+        return {}
+
+    def expirar_listen_key(self, chave):
+        with self._lock:
+            self.listen_keys.discard(chave)
+        if self.ws:
+            self.ws.publicar_conta(chave, {"e": "listenKeyExpired", "E": int(time.time() * 1000), "listenKey": chave})
+
+    def _conta(self, params):
+        with self._lock:
+            posicoes = [{"symbol": s, "positionAmt": f"{q:.8f}", "entryPrice": f"{e:.8f}", "unrealizedProfit": "0"}
+                        for s, (q, e) in self.posicoes.items() if q]
+            saldo = self.saldo
+        return {"totalWalletBalance": f"{saldo:.8f}", "availableBalance": f"{saldo:.8f}",
+                "assets": [{"asset": "USDT", "walletBalance": f"{saldo:.8f}", "crossWalletBalance": f"{saldo:.8f}"}],
+                "positions": posicoes}
+
+    # Ciclo de vida
+
+    def iniciar(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        if self.ws:
+            self.ws.iniciar()
+        return self
+
+    def parar(self):
+        if self.ws:
+            self.ws.parar()
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API REST fake da Binance Futures")
+    parser.add_argument("--porta", type=int, default=9000)
+    parser.add_argument("--ativos", type=int, default=2, help="número de ativos (perpétuo + 2 trimestrais cada)")
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos de atraso por requisição")
+    args = parser.parse_args()
+    servidor = FakeBinance(porta=args.porta, n_ativos=args.ativos, latencia=args.latencia).iniciar()
+    print(f"API fake em {servidor.url} — WS fake em {servidor.ws.url}")
+    print(f"Use BINANCE_FAPI_URL={servidor.url} BINANCE_WS_URL={servidor.ws.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.parar()
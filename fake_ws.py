@@ -0,0 +1,236 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+# Servidor WebSocket local que imita os streams combinados de futuros da
+# Binance (markPrice@1s e bookTicker) para testar o motor de mercado offline.
+# Aceita os metodos SUBSCRIBE/UNSUBSCRIBE e publica precos em passeio
+# aleatorio para os streams assinados. Conexoes em /ws/<listenKey> recebem os
+# eventos de conta (user-data stream) publicados pela API REST fake.
+
+GUID_WS = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _ler_exato(sock, n):
+    dados = b""
+    while len(dados) < n:
+        parte = sock.recv(n - len(dados))
+        if not parte:
+            raise ConnectionError("conexao encerrada")
+        dados += parte
+    return dados
+
+
+def ler_frame(sock):
+    b1, b2 = _ler_exato(sock, 2)
+    opcode = b1 & 0x0F
+    tamanho = b2 & 0x7F
+    if tamanho == 126:
+        tamanho = struct.unpack(">H", _ler_exato(sock, 2))[0]
+    elif tamanho == 127:
+        tamanho = struct.unpack(">Q", _ler_exato(sock, 8))[0]
+    mascara = _ler_exato(sock, 4) if b2 & 0x80 else None
+    payload = _ler_exato(sock, tamanho)
+    if mascara:
+        payload = bytes(b ^ mascara[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+def enviar_frame(sock, payload, opcode=0x1):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    cabecalho = bytes([0x80 | opcode])
+    n = len(payload)
+    if n < 126:
+        cabecalho += bytes([n])
+    elif n < 65536:
+        cabecalho += bytes([126]) + struct.pack(">H", n)
+    else:
+        cabecalho += bytes([127]) + struct.pack(">Q", n)
+    sock.sendall(cabecalho + payload)
+
+
+class _Conexao(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.streams = set()
+        self.caminho = "/"
+        self.lock_envio = threading.Lock()
+
+    def _handshake(self):
+        dados = b""
+        while b"\r\n\r\n" not in dados:
+            parte = self.request.recv(4096)
+            if not parte:
+                return False
+            dados += parte
+        chave = ""
+        linhas = dados.decode(errors="ignore").split("\r\n")
+        self.caminho = linhas[0].split(" ")[1] if len(linhas[0].split(" ")) > 1 else "/"
+        for linha in linhas:
+            if linha.lower().startswith("sec-websocket-key:"):
+                chave = linha.split(":", 1)[1].strip()
+        aceite = base64.b64encode(hashlib.sha1((chave + GUID_WS).encode()).digest()).decode()
+        self.request.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {aceite}\r\n\r\n"
+        ).encode())
+        return True
+
+    def enviar(self, mensagem):
+        with self.lock_envio:
+            enviar_frame(self.request, json.dumps(mensagem))
+
+    def handle(self):
+        if not self._handshake():
+            return
+        self.server.registrar(self)
+        try:
+            while True:
+                opcode, payload = ler_frame(self.request)
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    with self.lock_envio:
+                        enviar_frame(self.request, payload, opcode=0xA)
+                    continue
+                if opcode != 0x1:
+                    continue
+                msg = json.loads(payload)
+                params = [p.lower() for p in msg.get("params", [])]
+                if msg.get("method") == "SUBSCRIBE":
+                    self.streams.update(params)
+                elif msg.get("method") == "UNSUBSCRIBE":
+                    self.streams.difference_update(params)
+                self.enviar({"result": None, "id": msg.get("id")})
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.server.remover(self)
+
+
+class FakeWSServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", porta=0, precos=None, funding=0.0001, intervalo=0.2, latencia=0.0):
+        super().__init__((host, porta), _Conexao)
+        self.precos = dict(precos or {})
+        self.funding = funding
+        self.intervalo = intervalo
+        self.latencia = latencia
+        self.conexoes = set()
+        self.mensagens_enviadas = 0
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    @property
+    def url(self):
+        host, porta = self.server_address
+        return f"ws://{host}:{porta}"
+
+    def registrar(self, conexao):
+        with self._lock:
+            self.conexoes.add(conexao)
+
+    def remover(self, conexao):
+        with self._lock:
+            self.conexoes.discard(conexao)
+
+    def publicar_conta(self, listen_key, evento):
+        # evento do user-data stream para as conexoes abertas com esse listenKey
+        with self._lock:
+            conexoes = [c for c in self.conexoes if c.caminho == f"/ws/{listen_key}"]
+        for c in conexoes:
+            try:
+                c.enviar(evento)
+                self.mensagens_enviadas += 1
+            except OSError:
+                pass
+
+    def derrubar_conexoes(self):
+        with self._lock:
+            conexoes = list(self.conexoes)
+        for c in conexoes:
+            try:
+                c.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _evento(self, stream):
+        symbol, tipo = stream.split("@", 1)
+        symbol = symbol.upper()
+        if symbol not in self.precos:
+            # Contrato trimestral sem preco inicial: parte do perpetuo com 1% de basis
+            base = self.precos.get(symbol.split("_")[0], 100.0)
+            self.precos[symbol] = base * 1.01 if "_" in symbol else base
+        preco = self.precos[symbol]
+        agora = int(time.time() * 1000)
+        if tipo.startswith("markprice"):
+            return {
+                "e": "markPriceUpdate", "E": agora, "s": symbol,
+                "p": f"{preco:.8f}", "i": f"{preco:.8f}",
+                "r": f"{self.funding:.8f}" if "_" not in symbol else "",
+                "T": (agora // 28800000 + 1) * 28800000,
+            }
+        if tipo == "bookticker":
+            spread = preco * 0.0001
+            return {
+                "e": "bookTicker", "E": agora, "T": agora, "s": symbol,
+                "b": f"{preco - spread:.8f}", "B": "1.0",
+                "a": f"{preco + spread:.8f}", "A": "1.0",
+            }
+        return None
+
+    def _publicar(self):
+        while not self._parar.wait(self.intervalo):
+            for symbol in self.precos:
+                self.precos[symbol] *= 1 + random.gauss(0, 0.0005)
+            with self._lock:
+                conexoes = list(self.conexoes)
+            if self.latencia:
+                time.sleep(self.latencia)
+            for c in conexoes:
+                for stream in list(c.streams):
+                    data = self._evento(stream)
+                    if data is None:
+                        continue
+                    try:
+                        c.enviar({"stream": stream, "data": data})
+                        self.mensagens_enviadas += 1
+                    except OSError:
+                        break
+
+    def iniciar(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        threading.Thread(target=self._publicar, daemon=True).start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor WebSocket fake da Binance Futures")
+    parser.add_argument("--porta", type=int, default=9100)
+    parser.add_argument("--intervalo", type=float, default=1.0)
+    parser.add_argument("--latencia", type=float, default=0.0)
+    args = parser.parse_args()
+    servidor = FakeWSServer(porta=args.porta, intervalo=args.intervalo, latencia=args.latencia,
+                            precos={"BTCUSDT": 105000.0, "ETHUSDT": 2500.0})
+    print(f"Servidor WS fake em {servidor.url}")
+    servidor.iniciar()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.parar()
@@ -0,0 +1,164 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from binance_rest import get_json
+from metricas import instrumentar
+
+# Armazenamento local (SQLite) do historico de funding rate por simbolo.
+# Cada simbolo guarda o intervalo [inicio, fim] ja coberto; novas consultas
+# so baixam o que falta (o gap desde o ultimo funding ou um periodo anterior
+# ao inicio da cobertura), em paginas de 1000 e em paralelo. A Binance
+# publica alguns registros depois do horario (fundingTime) que eles levam,
+# entao a cobertura so vai ate MARGEM_PUBLICACAO antes da sincronizacao: o
+# proximo download recomeca desse ponto e o que foi publicado atrasado entra.
+
+ARQUIVO_FUNDING = "funding.db"
+LIMITE_PAGINA = 1000
+INTERVALO_FUNDING_MS = 8 * 3600 * 1000
+DIAS_PADRAO = 30  # cobertura inicial quando nao ha data de referencia
+INTERVALO_SYNC = 300  # segundos entre duas sincronizacoes do mesmo simbolo
+THREADS_BACKFILL = 4
+MARGEM_PUBLICACAO = 15 * 60 * 1000  # ms antes da sincronizacao ainda nao considerados completos
+
+
+def _agora_ms():
+    return int(time.time() * 1000)
+
+
+class FundingStore:
+    def __init__(self, arquivo=ARQUIVO_FUNDING):
+        self.arquivo = arquivo
+        self._local = threading.local()
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.arquivo, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS funding (
+                    symbol TEXT NOT NULL,
+                    funding_time INTEGER NOT NULL,
+                    rate REAL NOT NULL,
+                    PRIMARY KEY (symbol, funding_time)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cobertura (
+                    symbol TEXT PRIMARY KEY,
+                    inicio INTEGER NOT NULL,
+                    fim INTEGER NOT NULL,
+                    sincronizado_em REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _lock_simbolo(self, symbol):
+        with self._locks_lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _buscar_janela(self, symbol, inicio, fim):
+        linhas = []
+        while inicio <= fim:
+            params = {"symbol": symbol, "startTime": inicio, "endTime": fim, "limit": LIMITE_PAGINA}
+            data = get_json("/fapi/v1/fundingRate", params)
+            linhas.extend((symbol, int(e["fundingTime"]), float(e["fundingRate"])) for e in data)
+            if len(data) < LIMITE_PAGINA:
+                break
+            inicio = int(data[-1]["fundingTime"]) + 1
+        return linhas
+
+    def _baixar(self, symbol, inicio, fim):
+        passo = LIMITE_PAGINA * INTERVALO_FUNDING_MS
+        janelas = [(i, min(i + passo - 1, fim)) for i in range(inicio, fim + 1, passo)]
+        if len(janelas) == 1:
+            return self._buscar_janela(symbol, inicio, fim)
+        with ThreadPoolExecutor(max_workers=THREADS_BACKFILL) as pool:
+            partes = pool.map(lambda j: self._buscar_janela(symbol, *j), janelas)
+            return [linha for parte in partes for linha in parte]
+
+    @instrumentar("funding.sincronizar")
+    def sincronizar(self, symbol, inicio_ms=None, forcar=False):
+        with self._lock_simbolo(symbol):
+            conn = self._conn()
+            agora = _agora_ms()
+            cob = conn.execute(
+                "SELECT inicio, fim, sincronizado_em FROM cobertura WHERE symbol = ?", (symbol,)
+            ).fetchone()
+
+            if cob is None:
+                inicio = inicio_ms if inicio_ms is not None else agora - DIAS_PADRAO * 86400000
+                linhas = self._baixar(symbol, inicio, agora)
+                novo_inicio, novo_fim = inicio, max(agora - MARGEM_PUBLICACAO, inicio)
+                sincronizado_em = time.time()
+            else:
+                inicio, fim, sincronizado_em = cob
+                linhas = []
+                novo_inicio, novo_fim = inicio, fim
+                if inicio_ms is not None and inicio_ms < inicio:
+                    linhas += self._baixar(symbol, inicio_ms, inicio - 1)
+                    novo_inicio = inicio_ms
+                if forcar or time.time() - sincronizado_em > INTERVALO_SYNC:
+                    linhas += self._baixar(symbol, fim + 1, agora)
+                    novo_fim = max(agora - MARGEM_PUBLICACAO, fim)
+                    sincronizado_em = time.time()
+                if not linhas and novo_inicio == inicio and novo_fim == fim and sincronizado_em == cob[2]:
+                    return
+
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO funding VALUES (?, ?, ?)", linhas)
+                conn.execute(
+                    "INSERT OR REPLACE INTO cobertura VALUES (?, ?, ?, ?)",
+                    (symbol, novo_inicio, novo_fim, sincronizado_em),
+                )
+
+    def taxas(self, symbol, inicio_ms, fim_ms=None):
+        self.sincronizar(symbol, inicio_ms)
+        fim_ms = fim_ms if fim_ms is not None else _agora_ms()
+        rows = self._conn().execute(
+            "SELECT rate FROM funding WHERE symbol = ? AND funding_time BETWEEN ? AND ? ORDER BY funding_time",
+            (symbol, inicio_ms, fim_ms),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def soma(self, symbol, inicio_ms, fim_ms=None):
+        self.sincronizar(symbol, inicio_ms)
+        fim_ms = fim_ms if fim_ms is not None else _agora_ms()
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(rate), 0) FROM funding WHERE symbol = ? AND funding_time BETWEEN ? AND ?",
+            (symbol, inicio_ms, fim_ms),
+        ).fetchone()
+        return row[0]
+
+    def serie(self, symbol, inicio_ms, fim_ms=None):
+        # (funding_times, rates) como listas ordenadas, para calculos vetorizados
+        self.sincronizar(symbol, inicio_ms)
+        fim_ms = fim_ms if fim_ms is not None else _agora_ms()
+        rows = self._conn().execute(
+            "SELECT funding_time, rate FROM funding WHERE symbol = ? AND funding_time BETWEEN ? AND ? ORDER BY funding_time",
+            (symbol, inicio_ms, fim_ms),
+        ).fetchall()
+        return [r[0] for r in rows], [r[1] for r in rows]
+
+    def coberto_ate(self, symbol):
+        # fim (ms) do intervalo ja sincronizado; nenhum funding ate aqui falta no banco
+        # (fica MARGEM_PUBLICACAO antes da ultima sincronizacao)
+        row = self._conn().execute("SELECT fim FROM cobertura WHERE symbol = ?", (symbol,)).fetchone()
+        return row[0] if row else None
+
+    def recentes(self, symbol, limit=3):
+        self.sincronizar(symbol)
+        rows = self._conn().execute(
+            "SELECT rate FROM funding WHERE symbol = ? ORDER BY funding_time DESC LIMIT ?",
+            (symbol, limit),
+        ).fetchall()
+        return [r[0] for r in reversed(rows)]
+
+
+store = FundingStore()
@@ -1,26 +1,54 @@
 import streamlit as st
-import pandas as pd
-import json
+from datetime import datetime, time, timezone
+from serie_saldo import consultar, limites
 
 st.set_page_config(page_title="Histórico de Saldo", layout="wide")
 
 st.title("📈 Histórico do Saldo Total da Corretora")
 
-ARQUIVO_HISTORICO = "saldo_historico.json"
+PERIODOS = {"24h": 1, "7 dias": 7, "30 dias": 30, "90 dias": 90, "1 ano": 365, "Tudo": None, "Personalizado": None}
+
+# fim acompanha a ultima amostra gravada, entao novas amostras mudam a chave
+@st.cache_data(show_spinner=False, max_entries=32)
+def carregar_historico(inicio, fim, pontos):
+    # pandas so e importado quando ha serie gravada para mostrar
+    import pandas as pd
 
-def carregar_historico():
     try:
-        with open(ARQUIVO_HISTORICO, "r") as f:
-            historico = json.load(f)
-            return pd.DataFrame(historico)
+        serie, resolucao = consultar(inicio, fim, pontos)
+        df = pd.DataFrame(serie, columns=["timestamp", "total"])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit="s", utc=True)
+        return df, resolucao
     except:
-        return pd.DataFrame(columns=["timestamp", "total"])
+        return pd.DataFrame(columns=["timestamp", "total"]), None
+
+intervalo_total = limites()
+
+if intervalo_total:
+    primeiro, ultimo = intervalo_total
+    col_periodo, col_pontos = st.columns([2, 1])
+    periodo = col_periodo.radio("Período", list(PERIODOS), index=2, horizontal=True)
+    pontos = col_pontos.slider("Pontos no gráfico", min_value=200, max_value=5000, value=1000, step=100)
 
-df = carregar_historico()
+    if periodo == "Personalizado":
+        data_min = datetime.fromtimestamp(primeiro, tz=timezone.utc).date()
+        data_max = datetime.fromtimestamp(ultimo, tz=timezone.utc).date()
+        datas = st.date_input("Intervalo", value=(data_min, data_max), min_value=data_min, max_value=data_max)
+        data_ini, data_fim = datas if len(datas) == 2 else (datas[0], datas[0])
+        inicio = datetime.combine(data_ini, time.min, tzinfo=timezone.utc).timestamp()
+        fim = datetime.combine(data_fim, time.max, tzinfo=timezone.utc).timestamp()
+    elif PERIODOS[periodo] is None:
+        inicio, fim = primeiro, ultimo
+    else:
+        inicio, fim = max(ultimo - PERIODOS[periodo] * 86400, primeiro), ultimo
+
+    df, resolucao = carregar_historico(inicio, fim, pontos)
+else:
+    df, resolucao = None, None
 
-if not df.empty:
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+if df is not None and not df.empty:
     df.set_index('timestamp', inplace=True)
     st.line_chart(df['total'])
+    st.caption(f"{len(df)} pontos · resolução `{resolucao}`")
 else:
     st.info("Nenhum dado histórico disponível.")
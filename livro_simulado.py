@@ -0,0 +1,74 @@
+import math
+import threading
+import time
+
+# Livro de ofertas simulado para testes e benchmarks offline da execucao
+# fatiada. Cada lado tem niveis a partir de meio spread do mid, com
+# quantidade crescente com a distancia. Ordens a mercado percorrem os
+# niveis e deixam um deficit de liquidez que se recompoe exponencialmente
+# (constante `recuperacao` em segundos), de modo que fatias muito proximas
+# pagam mais impacto que fatias espacadas.
+
+NIVEIS = 100
+SPREAD_BPS = 1.0  # spread cheio entre melhor compra e melhor venda
+PASSO_BPS = 0.5  # distancia entre niveis consecutivos
+PROFUNDIDADE_USD = 25000.0  # notional no melhor nivel de cada lado
+CRESCIMENTO = 0.05  # aumento relativo da quantidade por nivel
+RECUPERACAO = 2.0  # segundos
+
+
+class LivroSimulado:
+    def __init__(self, mid, niveis=NIVEIS, spread_bps=SPREAD_BPS, passo_bps=PASSO_BPS,
+                 profundidade_usd=PROFUNDIDADE_USD, crescimento=CRESCIMENTO, recuperacao=RECUPERACAO):
+        self.mid = mid
+        self.recuperacao = recuperacao
+        distancias = [(spread_bps / 2 + i * passo_bps) / 10000 for i in range(niveis)]
+        qty_base = profundidade_usd / mid
+        self._precos = {
+            "BUY": [mid * (1 + d) for d in distancias],  # compra consome as vendas (asks)
+            "SELL": [mid * (1 - d) for d in distancias],
+        }
+        self._base = [qty_base * (1 + i * crescimento) for i in range(niveis)]
+        self._deficit = {"BUY": [0.0] * niveis, "SELL": [0.0] * niveis}
+        self._atualizado_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recompor(self):
+        agora = time.monotonic()
+        fator = math.exp(-(agora - self._atualizado_em) / self.recuperacao) if self.recuperacao else 0.0
+        for lado in self._deficit.values():
+            for i, d in enumerate(lado):
+                if d:
+                    lado[i] = d * fator if d * fator > 1e-12 else 0.0
+        self._atualizado_em = agora
+
+    def _disponivel(self, side):
+        return [max(b - d, 0.0) for b, d in zip(self._base, self._deficit[side])]
+
+    def livro(self, limite=20):
+        # formato de /fapi/v1/depth
+        with self._lock:
+            self._recompor()
+            niveis = {
+                side: [[f"{p:.8f}", f"{q:.8f}"] for p, q in zip(self._precos[side], self._disponivel(side)) if q > 0][:limite]
+                for side in ("BUY", "SELL")
+            }
+        return {"lastUpdateId": int(time.time() * 1000), "E": int(time.time() * 1000), "T": int(time.time() * 1000),
+                "bids": niveis["SELL"], "asks": niveis["BUY"]}
+
+    def executar(self, side, qty):
+        # (preco medio, quantidade executada) de uma ordem a mercado
+        with self._lock:
+            self._recompor()
+            restante, custo = qty, 0.0
+            for i, (preco, disponivel) in enumerate(zip(self._precos[side], self._disponivel(side))):
+                if restante <= 0:
+                    break
+                consumo = min(restante, disponivel)
+                if consumo <= 0:
+                    continue
+                self._deficit[side][i] += consumo
+                custo += consumo * preco
+                restante -= consumo
+        executada = qty - max(restante, 0.0)
+        return (custo / executada if executada else self.mid), executada
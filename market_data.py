@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+
+from metadados import registro
+
+# Motor de dados de mercado em background: assina markPrice@1s e bookTicker
+# dos perpetuos e dos seus contratos trimestrais e mantem em memoria o ultimo
+# preco, basis e funding previsto de cada par. Os paineis do Streamlit apenas
+# leem o estado (sem bloquear); reconexao e reassinatura sao automaticas. O
+# websocket-client so e importado quando o motor e iniciado.
+
+WS_URL = os.getenv("BINANCE_WS_URL", "wss://fstream.binance.com")
+MARKET_DATA_WS = os.getenv("MARKET_DATA_WS", "1") == "1"
+IDADE_MAXIMA_LEITURA = 10  # segundos sem atualizacao antes de descartar a leitura
+PERIODOS_FUNDING_DIA = 3
+
+
+def streams_do_simbolo(symbol):
+    s = symbol.lower()
+    return [f"{s}@markPrice@1s", f"{s}@bookTicker"]
+
+
+class MotorMercado:
+    def __init__(self, url=WS_URL):
+        self.url = url
+        self.pares = set()
+        self.conectado = False
+        self.reconexoes = 0
+        self.mensagens = 0
+        self._estado = {}
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._ws = None
+        self._thread = None
+        self._id = 0
+
+    # Assinaturas
+
+    def _streams(self, pares):
+        simbolos = sorted({s for par in pares for s in par})
+        return [st for s in simbolos for st in streams_do_simbolo(s)]
+
+    def _assinar(self, streams):
+        if not streams or not self.conectado:
+            return
+        import websocket
+
+        self._id += 1
+        try:
+            self._ws.send(json.dumps({"method": "SUBSCRIBE", "params": streams, "id": self._id}))
+        except websocket.WebSocketException:
+            pass
+
+    def adicionar_pares(self, pares):
+        with self._lock:
+            novos = set(pares) - self.pares
+            self.pares |= novos
+        self._assinar(self._streams(novos))
+
+    # Conexao
+
+    def _on_open(self, ws):
+        self.conectado = True
+        self._espera = 1
+        self._assinar(self._streams(self.pares))
+
+    def _on_message(self, ws, mensagem):
+        msg = json.loads(mensagem)
+        data = msg.get("data", msg)
+        evento = data.get("e")
+        if evento not in ("markPriceUpdate", "bookTicker"):
+            return
+        self.mensagens += 1
+        with self._lock:
+            estado = self._estado.setdefault(data["s"], {})
+            if evento == "markPriceUpdate":
+                estado["mark"] = float(data["p"])
+                if data.get("r"):
+                    estado["funding"] = float(data["r"])
+                    estado["proximo_funding"] = data.get("T")
+            else:
+                estado["bid"] = float(data["b"])
+                estado["ask"] = float(data["a"])
+            estado["atualizado_em"] = time.time()
+
+    def _on_close(self, ws, *args):
+        self.conectado = False
+
+    def _loop(self, websocket):
+        self._espera = 1
+        while not self._parar.is_set():
+            self._ws = websocket.WebSocketApp(
+                f"{self.url}/stream",
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_close=self._on_close,
+                on_error=lambda ws, erro: None,
+            )
+            self._ws.run_forever(ping_interval=60, ping_timeout=20)
+            self.conectado = False
+            if self._parar.is_set():
+                break
+            self.reconexoes += 1
+            self._parar.wait(self._espera)
+            self._espera = min(self._espera * 2, 60)
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            import websocket
+
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, args=(websocket,), name="motor-mercado", daemon=True)
+            self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._ws:
+            self._ws.close()
+
+    # Leitura
+
+    def _preco(self, estado):
+        if "bid" in estado and "ask" in estado:
+            return (estado["bid"] + estado["ask"]) / 2
+        return estado.get("mark")
+
+    def leitura(self, symbol_perp, symbol_futuro):
+        with self._lock:
+            perp = dict(self._estado.get(symbol_perp, {}))
+            fut = dict(self._estado.get(symbol_futuro, {}))
+        preco_perp, preco_fut = self._preco(perp), self._preco(fut)
+        if not preco_perp or not preco_fut:
+            return None
+        atualizado_em = min(perp["atualizado_em"], fut["atualizado_em"])
+        if time.time() - atualizado_em > IDADE_MAXIMA_LEITURA:
+            return None
+        dias = registro.dias_ate_vencimento(symbol_futuro)
+        basis_pct = (preco_fut - preco_perp) / preco_perp
+        funding = perp.get("funding")
+        return {
+            "preco_perp": preco_perp,
+            "preco_futuro": preco_fut,
+            "dias_vencimento": dias,
+            "basis_pct": basis_pct,
+            "basis_dia": basis_pct / dias,
+            "funding_previsto": funding,
+            "funding_diario_previsto": funding * PERIODOS_FUNDING_DIA if funding is not None else None,
+            "atualizado_em": atualizado_em,
+        }
+
+
+_lock_motor = threading.Lock()
+_motor = None
+
+
+def get_motor(pares=()):
+    global _motor
+    if not MARKET_DATA_WS:
+        return None
+    with _lock_motor:
+        if _motor is None:
+            _motor = MotorMercado().iniciar()
+    _motor.adicionar_pares(pares)
+    return _motor
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+
+from binance_rest import get_json
+from metricas import instrumentar
+
+# Registro de metadados da exchange (exchangeInfo) compartilhado pelos apps.
+# O payload completo e baixado no maximo uma vez por TTL; as consultas sao
+# feitas em dicionarios indexados, sem chamada de rede.
+
+ARQUIVO_METADADOS = "exchange_info_cache.json"
+TTL_METADADOS = int(os.getenv("METADADOS_TTL", 3600))  # segundos
+RETENTATIVA_METADADOS = 60  # segundos ate nova tentativa quando o download falha
+
+STEP_PADRAO = 0.001
+
+
+def _filtro(s, tipo, campo, padrao):
+    for f in s.get("filters", []):
+        if f["filterType"] == tipo:
+            return float(f[campo])
+    return padrao
+
+
+def _compactar(s):
+    return {
+        "symbol": s["symbol"],
+        "pair": s.get("pair") or s["symbol"].split("_")[0],
+        "contractType": s.get("contractType", ""),
+        "baseAsset": s.get("baseAsset", ""),
+        "status": s.get("status", ""),
+        "deliveryDate": s.get("deliveryDate", 0),
+        "step_lote": _filtro(s, "LOT_SIZE", "stepSize", STEP_PADRAO),
+        "qty_minima": _filtro(s, "LOT_SIZE", "minQty", 0.0),
+        "tick_preco": _filtro(s, "PRICE_FILTER", "tickSize", 0.0),
+    }
+
+
+class RegistroMetadados:
+    def __init__(self, ttl=TTL_METADADOS, arquivo=ARQUIVO_METADADOS):
+        self.ttl = ttl
+        self.arquivo = arquivo
+        self._lock = threading.Lock()
+        self._carregado_em = 0.0
+        self._simbolos = {}
+        self._por_contrato = {}
+        self._por_ativo = {}
+
+    def _indexar(self, simbolos, carregado_em):
+        por_simbolo, por_contrato, por_ativo = {}, {}, {}
+        for s in simbolos:
+            por_simbolo[s["symbol"]] = s
+            if s["contractType"]:
+                por_contrato.setdefault((s["pair"], s["contractType"]), s["symbol"])
+            por_ativo.setdefault(s["baseAsset"], []).append(s["symbol"])
+        self._simbolos, self._por_contrato, self._por_ativo = por_simbolo, por_contrato, por_ativo
+        self._carregado_em = carregado_em
+
+    @instrumentar("metadados.ler_json")
+    def _ler_snapshot(self):
+        if not self.arquivo or not os.path.exists(self.arquivo):
+            return None
+        try:
+            with open(self.arquivo, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @instrumentar("metadados.salvar_json")
+    def _salvar_snapshot(self, simbolos, baixado_em):
+        if not self.arquivo:
+            return
+        tmp = self.arquivo + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"baixado_em": baixado_em, "symbols": simbolos}, f)
+        os.replace(tmp, self.arquivo)
+
+    def atualizar(self, forcar=False):
+        with self._lock:
+            agora = time.time()
+            if not forcar and agora - self._carregado_em < self.ttl:
+                return
+            snapshot = self._ler_snapshot()
+            if not forcar and snapshot and agora - snapshot["baixado_em"] < self.ttl:
+                self._indexar(snapshot["symbols"], snapshot["baixado_em"])
+                return
+            try:
+                info = get_json("/fapi/v1/exchangeInfo")
+                simbolos = [_compactar(s) for s in info["symbols"]]
+            except Exception:
+                # Sem rede: usa o snapshot em disco, mesmo vencido, se existir, e
+                # tenta de novo em RETENTATIVA_METADADOS em vez de um TTL inteiro
+                if snapshot:
+                    self._indexar(snapshot["symbols"], agora - self.ttl + min(RETENTATIVA_METADADOS, self.ttl))
+                    return
+                raise
+            self._indexar(simbolos, agora)
+            self._salvar_snapshot(simbolos, agora)
+
+    def _garantir(self):
+        if time.time() - self._carregado_em >= self.ttl:
+            self.atualizar()
+
+    def simbolo(self, symbol):
+        self._garantir()
+        return self._simbolos.get(symbol)
+
+    def contrato(self, pair, contract_type="CURRENT_QUARTER"):
+        self._garantir()
+        return self._por_contrato.get((pair, contract_type))
+
+    def contratos(self, contract_type):
+        self._garantir()
+        return [self._simbolos[symbol] for (pair, tipo), symbol in self._por_contrato.items() if tipo == contract_type]
+
+    def simbolos_do_ativo(self, base_asset):
+        self._garantir()
+        return list(self._por_ativo.get(base_asset, []))
+
+    def dias_ate_vencimento(self, symbol):
+        s = self.simbolo(symbol)
+        if s and s["deliveryDate"]:
+            return max((s["deliveryDate"] / 1000 - time.time()) / 86400, 1)
+        return 90
+
+    def step_lote(self, symbol):
+        s = self.simbolo(symbol)
+        return s["step_lote"] if s else STEP_PADRAO
+
+    def tick_preco(self, symbol):
+        s = self.simbolo(symbol)
+        return s["tick_preco"] if s else 0.0
+
+
+registro = RegistroMetadados()
+
+
+@instrumentar("calcular_qty")
+def calcular_qty(volume_usd, preco, symbol):
+    qty = volume_usd / preco
+    step = registro.step_lote(symbol)
+    qty = qty - (qty % step)
+    return round(qty, 8)
@@ -0,0 +1,168 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Instrumentacao leve dos caminhos quentes: histograma de latencia, contagem
+# de chamadas e de erros por operacao, exportados em texto Prometheus por um
+# servidor HTTP local. Desligada (METRICAS=0) os decoradores devolvem a
+# propria funcao e medir() devolve um contexto vazio, sem custo por chamada.
+
+ATIVO = os.getenv("METRICAS", "0") == "1"
+PORTA = int(os.getenv("METRICAS_PORTA", 9464))
+PREFIXO = "basishunter"
+LIMITES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # segundos
+
+log = logging.getLogger("metricas")
+
+
+class _Serie:
+    __slots__ = ("baldes", "soma", "contagem", "erros")
+
+    def __init__(self):
+        self.baldes = [0] * (len(LIMITES) + 1)
+        self.soma = 0.0
+        self.contagem = 0
+        self.erros = 0
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, nome, duracao, erro=False):
+        with self._lock:
+            serie = self._series.get(nome)
+            if serie is None:
+                serie = self._series[nome] = _Serie()
+            serie.baldes[bisect.bisect_left(LIMITES, duracao)] += 1
+            serie.soma += duracao
+            serie.contagem += 1
+            serie.erros += erro
+
+    def _copiar(self):
+        with self._lock:
+            return {nome: (list(s.baldes), s.soma, s.contagem, s.erros) for nome, s in self._series.items()}
+
+    def texto_prometheus(self):
+        linhas = [
+            f"# HELP {PREFIXO}_duracao_segundos Latencia das operacoes instrumentadas",
+            f"# TYPE {PREFIXO}_duracao_segundos histogram",
+        ]
+        series = sorted(self._copiar().items())
+        for nome, (baldes, soma, contagem, _) in series:
+            acumulado = 0
+            for limite, n in zip(LIMITES + ("+Inf",), baldes):
+                acumulado += n
+                linhas.append(f'{PREFIXO}_duracao_segundos_bucket{{operacao="{nome}",le="{limite}"}} {acumulado}')
+            linhas.append(f'{PREFIXO}_duracao_segundos_sum{{operacao="{nome}"}} {soma:.6f}')
+            linhas.append(f'{PREFIXO}_duracao_segundos_count{{operacao="{nome}"}} {contagem}')
+        linhas += [
+            f"# HELP {PREFIXO}_erros_total Chamadas que terminaram em excecao",
+            f"# TYPE {PREFIXO}_erros_total counter",
+        ]
+        linhas += [f'{PREFIXO}_erros_total{{operacao="{nome}"}} {s[3]}' for nome, s in series]
+        return "\n".join(linhas) + "\n"
+
+    def _quantil(self, baldes, contagem, q):
+        # limite superior do balde que contem o quantil
+        alvo, acumulado = q * contagem, 0
+        for limite, n in zip(LIMITES + (float("inf"),), baldes):
+            acumulado += n
+            if acumulado >= alvo:
+                return limite
+        return float("inf")
+
+    def resumo(self):
+        # uma linha por operacao para o painel de diagnostico
+        return [
+            {
+                "operacao": nome,
+                "chamadas": contagem,
+                "erros": erros,
+                "media_ms": round(soma / contagem * 1000, 2) if contagem else 0.0,
+                "p50_ms<=": self._quantil(baldes, contagem, 0.5) * 1000,
+                "p95_ms<=": self._quantil(baldes, contagem, 0.95) * 1000,
+                "total_s": round(soma, 3),
+            }
+            for nome, (baldes, soma, contagem, erros) in sorted(self._copiar().items(), key=lambda i: -i[1][1])
+        ]
+
+
+registro = RegistroMetricas()
+
+
+@contextmanager
+def _medir(nome):
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registro.observar(nome, time.perf_counter() - inicio, erro=True)
+        raise
+    registro.observar(nome, time.perf_counter() - inicio)
+
+
+_NULO = nullcontext()
+
+
+def medir(nome):
+    return _medir(nome) if ATIVO else _NULO
+
+
+def instrumentar(nome=None):
+    def decorador(funcao):
+        if not ATIVO:
+            return funcao
+        rotulo = nome or funcao.__qualname__
+
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with _medir(rotulo):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        corpo = registro.texto_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+
+_lock_servidor = threading.Lock()
+_servidor = None
+
+
+def iniciar_servidor(porta=PORTA, host="127.0.0.1"):
+    # Idempotente por processo; se a porta estiver ocupada (outro app ja
+    # exporta nela) apenas registra o aviso
+    global _servidor
+    if not ATIVO:
+        return None
+    with _lock_servidor:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer((host, porta), _Handler)
+            except OSError as e:
+                log.warning("Metricas sem endpoint: porta %s indisponivel (%s)", porta, e)
+                _servidor = False
+                return None
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, name="metricas", daemon=True).start()
+    return _servidor or None
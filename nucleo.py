@@ -0,0 +1,100 @@
+import os
+
+import streamlit as st
+from dotenv import load_dotenv
+
+from binance_rest import ClienteTardio
+from operacoes import get_recent_funding
+from operacoes_store import carregar_operacoes, versao_operacoes
+from precos import get_snapshot
+
+# Recursos e dados compartilhados pelos apps Streamlit entre reruns e sessoes
+# do mesmo processo. O Client e criado uma unica vez, na primeira chamada a
+# API (ClienteTardio); o motor de PnL e o scanner (pandas) so sao importados
+# quando a pagina os usa. As operacoes e o PnL ficam em cache ate a versao do
+# banco mudar (qualquer escrita, do app ou do daemon, incrementa a versao) e,
+# para operacoes abertas, ate o snapshot de precos ser renovado. Funding e
+# saldo da conta expiram por tempo; o saldo vem do user-data stream quando
+# ha um consumidor conectado (conta_stream.py). As listas devolvidas sao
+# compartilhadas entre sessoes e nao devem ser modificadas.
+
+TTL_FUNDING = 60  # segundos; a taxa muda a cada 8h
+TTL_SALDO = 15  # segundos
+MAX_VERSOES = 16  # combinacoes (filtro, versao) mantidas em cache
+
+
+@st.cache_resource(show_spinner=False)
+def get_client():
+    load_dotenv()
+    return ClienteTardio(os.getenv("BINANCE_API_KEY"), os.getenv("BINANCE_API_SECRET"))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_VERSOES)
+def _operacoes(status, symbol, versao):
+    return carregar_operacoes(status=status, symbol=symbol)
+
+
+def operacoes(status=None, symbol=None):
+    return _operacoes(status, symbol, versao_operacoes())
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_VERSOES)
+def _pnl(status, versao, momento_snapshot, _snapshot):
+    from pnl_engine import calcular_pnl_operacoes
+
+    return calcular_pnl_operacoes(_operacoes(status, None, versao), _snapshot)
+
+
+def pnl_operacoes(status=None, snapshot=None):
+    # o snapshot so entra na chave quando ha operacao aberta para marcar
+    versao = versao_operacoes()
+    if any(op["status"] == "aberta" for op in _operacoes(status, None, versao)):
+        snapshot = snapshot or get_snapshot()
+    else:
+        snapshot = None
+    return _pnl(status, versao, snapshot.timestamp if snapshot else None, snapshot)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _pnl_materializado(versao, momento_snapshot, _snapshot):
+    from pnl_materializado import atualizar_pnl, ler_pnl
+
+    # so materializa quando o banco ou o snapshot mudam; os periodos de funding
+    # novos entram na proxima renovacao do snapshot
+    atualizar_pnl()
+    return ler_pnl(_snapshot)
+
+
+def pnl_materializado(snapshot=None):
+    snapshot = snapshot or get_snapshot()
+    return _pnl_materializado(versao_operacoes(), snapshot.timestamp, snapshot)
+
+
+@st.cache_data(show_spinner=False, ttl=TTL_FUNDING)
+def funding_diario(symbol):
+    return get_recent_funding(symbol)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _scanner(momento_snapshot, _snapshot):
+    from scanner import escanear
+
+    return escanear(_snapshot)
+
+
+def scanner(snapshot=None):
+    snapshot = snapshot or get_snapshot()
+    return _scanner(snapshot.timestamp, snapshot)
+
+
+@st.cache_data(show_spinner=False, ttl=TTL_SALDO)
+def saldos():
+    # saldo publicado pelo user-data stream (saldo_historico_app.py) quando ele esta
+    # conectado; sem stream, uma consulta REST (peso 5) a cada TTL_SALDO
+    from conta_stream import saldo_publicado
+
+    publicado = saldo_publicado()
+    if publicado is not None:
+        return publicado
+    account_info = get_client().futures_account()
+    return float(account_info["totalWalletBalance"]), float(account_info["availableBalance"])
@@ -0,0 +1,347 @@
+from datetime import datetime, timezone
+
+from metadados import registro, calcular_qty
+from estatisticas_funding import funding_diario
+from execucao import ErroExecucao, executar_pernas
+from execucao_fatiada import executar_fatiado, precisa_fatiar
+from operacoes_store import STATUS_FINAIS, inserir_operacao, atualizar_operacao, atualizar_operacoes, store
+from metricas import instrumentar
+from compensacao import (consolidar, fracoes_executadas, precos_realizados, quantidades, quantidades_executadas,
+                         restante, resumo_execucao)
+
+# Ciclo de vida das operacoes (entrada, saida e rolagem) compartilhado pelos
+# apps Streamlit e pelo daemon de trading.
+
+TAXA_PERNA = 0.0004
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+
+
+def agora_str():
+    return datetime.now(timezone.utc).strftime(FORMATO_DATA)
+
+
+@instrumentar("get_recent_funding")
+def get_recent_funding(symbol):
+    # soma do funding nas ultimas 24h ate o ultimo evento (3 periodos de 8h)
+    return funding_diario(symbol)
+
+
+def get_next_quarter_symbol(symbol_prefix):
+    return registro.contrato(symbol_prefix, "NEXT_QUARTER")
+
+
+def _executar(client, volume, pernas):
+    # notional alto: fatias pareadas pelo livro de ofertas, com slippage por perna nas metricas.
+    # Devolve (resultados de todas as ordens enviadas, metricas). Em falha, o
+    # ErroExecucao traz em `pernas` a lista plana das ordens enviadas, inclusive
+    # as de fatias anteriores ja executadas
+    if not pernas:
+        # lote compensado em que todas as quantidades se anularam
+        return [], {"pernas": [], "skew_envio_ms": 0.0, "skew_ack_ms": 0.0, "total_ms": 0.0}
+    if precisa_fatiar(volume):
+        try:
+            por_perna, relatorio = executar_fatiado(client, pernas)
+        except ErroExecucao as e:
+            raise ErroExecucao(str(e), [r for resultados in e.pernas for r in resultados], e.metricas) from e
+        return [r for resultados in por_perna for r in resultados], relatorio
+    return executar_pernas(client, pernas)
+
+
+def _execucao_parcial(erro):
+    return {**(erro.metricas or {}), "parcial": True, "erro": str(erro)}
+
+
+@instrumentar("abrir_operacao")
+def abrir_operacao(client, symbol_perp, symbol_futuro, volume, snapshot):
+    preco_perp, preco_fut = snapshot.par(symbol_perp, symbol_futuro)
+    qty_perp = calcular_qty(volume, preco_perp, symbol_perp)
+    qty_fut = calcular_qty(volume, preco_fut, symbol_futuro)
+
+    try:
+        _, metricas = _executar(client, volume, [
+            {"symbol": symbol_perp, "side": "SELL", "quantity": qty_perp},
+            {"symbol": symbol_futuro, "side": "BUY", "quantity": qty_fut},
+        ])
+    except ErroExecucao as e:
+        # parte das ordens executou (fatias anteriores ou uma das pernas): a
+        # posicao aberta fica registrada com as quantidades executadas
+        executado = quantidades_executadas(e.pernas)
+        qty_perp, qty_fut = executado.get(symbol_perp, 0.0), executado.get(symbol_futuro, 0.0)
+        if qty_perp or qty_fut:
+            inserir_operacao({
+                "data_entrada": agora_str(),
+                "symbol_perpetuo": symbol_perp,
+                "symbol_futuro": symbol_futuro,
+                "preco_entrada_perp": preco_perp,
+                "preco_entrada_futuro": preco_fut,
+                "volume_usd": round(qty_perp * preco_perp if qty_perp else qty_fut * preco_fut, 2),
+                "qty_perpetuo": qty_perp,
+                "qty_futuro": qty_fut,
+                "funding_rate_entrada_diario": get_recent_funding(symbol_perp),
+                "status": "aberta",
+                "execucao_entrada": _execucao_parcial(e),
+            })
+        raise
+
+    nova_ordem = {
+        "data_entrada": agora_str(),
+        "symbol_perpetuo": symbol_perp,
+        "symbol_futuro": symbol_futuro,
+        "preco_entrada_perp": preco_perp,
+        "preco_entrada_futuro": preco_fut,
+        "volume_usd": volume,
+        "funding_rate_entrada_diario": get_recent_funding(symbol_perp),
+        "status": "aberta",
+        "execucao_entrada": metricas,
+    }
+    inserir_operacao(nova_ordem)
+    return nova_ordem
+
+
+@instrumentar("fechar_operacao")
+def fechar_operacao(client, ordem, snapshot):
+    preco_atual_perp, preco_atual_fut = snapshot.par(ordem["symbol_perpetuo"], ordem["symbol_futuro"])
+    qty_perp, qty_fut = quantidades(ordem)
+
+    try:
+        _, metricas = _executar(client, ordem["volume_usd"], [
+            {"symbol": ordem["symbol_perpetuo"], "side": "BUY", "quantity": qty_perp},
+            {"symbol": ordem["symbol_futuro"], "side": "SELL", "quantity": qty_fut},
+        ])
+    except ErroExecucao as e:
+        # a operacao continua aberta so com o que nao foi executado
+        executado = quantidades_executadas(e.pernas)
+        resto_perp = round(max(qty_perp - executado.get(ordem["symbol_perpetuo"], 0.0), 0.0), 8)
+        resto_fut = round(max(qty_fut - executado.get(ordem["symbol_futuro"], 0.0), 0.0), 8)
+        if resto_perp != qty_perp or resto_fut != qty_fut:
+            atualizar_operacao(*_saida_parcial(ordem, resto_perp, resto_fut, _execucao_parcial(e)))
+        raise
+
+    return atualizar_operacao(ordem["id"], {
+        "status": "fechada",
+        "data_saida": agora_str(),
+        "preco_saida_perp": preco_atual_perp,
+        "preco_saida_futuro": preco_atual_fut,
+        "execucao_saida": metricas,
+    })
+
+
+def _saida_parcial(ordem, resto_perp, resto_fut, execucao):
+    # alteracao de uma operacao que segue aberta com as quantidades que faltam fechar
+    qty_perp, qty_fut = quantidades(ordem)
+    fracao = max(resto_perp / qty_perp if qty_perp else 0.0, resto_fut / qty_fut if qty_fut else 0.0)
+    return ordem["id"], {
+        "volume_usd": round(ordem["volume_usd"] * fracao, 2),
+        "qty_perpetuo": resto_perp,
+        "qty_futuro": resto_fut,
+    }, None, {"saidas_parciais": {"data": agora_str(), **execucao}}
+
+
+def _pernas_rolagem(ordem, novo_symbol_fut, preco_novo_futuro):
+    qty_fut_atual = quantidades(ordem)[1]
+    qty_fut_novo = calcular_qty(ordem["volume_usd"], preco_novo_futuro, novo_symbol_fut)
+    return [
+        {"symbol": ordem["symbol_futuro"], "side": "SELL", "quantity": qty_fut_atual},
+        {"symbol": novo_symbol_fut, "side": "BUY", "quantity": qty_fut_novo},
+    ]
+
+
+def _alteracao_rolagem(ordem, novo_symbol_fut, preco_atual_futuro, preco_novo_futuro, metricas):
+    # campos do contrato novo, acumuladores (taxa e PnL de todas as pernas
+    # roladas) e a entrada do historico, gravados juntos pelo store
+    qty = ordem["volume_usd"] / ordem["preco_entrada_perp"]
+    pnl = (preco_atual_futuro - ordem["preco_entrada_futuro"]) * qty
+    taxa = round(ordem["volume_usd"] * 2 * TAXA_PERNA, 2)
+    somar = {"taxa_rolagem": taxa, "pnl_rolagem": pnl}
+    if "pnl_rolagem" not in ordem and ordem.get("preco_saida_futuro_anterior") is not None:
+        # rolagem feita antes do PnL acumulado: so os campos *_anterior registram a perna
+        somar["pnl_rolagem"] += (ordem["preco_saida_futuro_anterior"] - ordem["preco_entrada_futuro_anterior"]) * qty
+    data = agora_str()
+    campos = {
+        "symbol_futuro_anterior": ordem["symbol_futuro"],
+        "preco_entrada_futuro_anterior": ordem["preco_entrada_futuro"],
+        "preco_saida_futuro_anterior": preco_atual_futuro,
+        "preco_saida_futuro": preco_atual_futuro,
+        "symbol_futuro": novo_symbol_fut,
+        "preco_entrada_futuro": preco_novo_futuro,
+        "qty_futuro": None,  # o contrato novo foi comprado pelo volume
+        "data_rolagem": data,
+        "execucao_rolagem": metricas,
+    }
+    rolagem = {
+        "data": data,
+        "de": ordem["symbol_futuro"],
+        "para": novo_symbol_fut,
+        "preco_entrada_anterior": ordem["preco_entrada_futuro"],
+        "preco_saida": preco_atual_futuro,
+        "preco_entrada": preco_novo_futuro,
+        "taxa": taxa,
+        "pnl": pnl,
+        "skew_ack_ms": metricas["skew_ack_ms"],
+    }
+    return ordem["id"], campos, somar, {"rolagens": rolagem}
+
+
+@instrumentar("rolar_operacao")
+def rolar_operacao(client, ordem, novo_symbol_fut, snapshot):
+    # lote de uma operacao: mesma execucao (fatiada acima do limiar) e o mesmo
+    # registro de execucao parcial da rolagem em lote
+    roladas, falhas = rolar_operacoes(client, [(ordem, novo_symbol_fut)], snapshot)
+    if falhas:
+        raise falhas[0][1]
+    return roladas[0]
+
+
+@instrumentar("fechar_operacoes")
+def fechar_operacoes(client, ordens, snapshot):
+    # Fechamento em lote compensado: uma ordem por simbolo com a soma das
+    # quantidades das operacoes. Cada operacao recebe o preco medio realizado
+    # do seu simbolo (o do snapshot se a resposta nao trouxer o preco) e todas
+    # sao gravadas numa unica transacao. Devolve (fechadas, [(ordem, erro), ...])
+    if not ordens:
+        return [], []
+    pernas = [
+        [{"symbol": o["symbol_perpetuo"], "side": "BUY", "quantity": quantidades(o)[0]},
+         {"symbol": o["symbol_futuro"], "side": "SELL", "quantity": quantidades(o)[1]}]
+        for o in ordens
+    ]
+    liquidas = consolidar(pernas)
+    try:
+        resultados, metricas = _executar(client, sum(o["volume_usd"] for o in ordens), liquidas)
+        fracoes, erro = {}, None
+    except ErroExecucao as e:
+        # ordens liquidas de outros simbolos podem ter executado: as operacoes
+        # desses simbolos fecham (ou ficam com o que falta) e so o resto volta como falha
+        resultados, metricas, erro = e.pernas, e.metricas or {}, e
+        fracoes = fracoes_executadas(liquidas, resultados)
+    realizados = precos_realizados(resultados)
+    execucao = resumo_execucao(liquidas, metricas, len(ordens))
+    if erro is not None:
+        execucao = {**execucao, **_execucao_parcial(erro)}
+    data = agora_str()
+    alteracoes, falhas = [], []
+    for o in ordens:
+        qty_perp, qty_fut = quantidades(o)
+        resto_perp = restante(qty_perp, fracoes.get(o["symbol_perpetuo"], 1.0), o["symbol_perpetuo"])
+        resto_fut = restante(qty_fut, fracoes.get(o["symbol_futuro"], 1.0), o["symbol_futuro"])
+        if resto_perp or resto_fut:
+            falhas.append((o, erro))
+            if resto_perp != qty_perp or resto_fut != qty_fut:
+                alteracoes.append(_saida_parcial(o, resto_perp, resto_fut, execucao))
+            continue
+        preco_perp, preco_fut = snapshot.par(o["symbol_perpetuo"], o["symbol_futuro"])
+        alteracoes.append((o["id"], {
+            "status": "fechada",
+            "data_saida": data,
+            "preco_saida_perp": realizados.get(o["symbol_perpetuo"], preco_perp),
+            "preco_saida_futuro": realizados.get(o["symbol_futuro"], preco_fut),
+            "execucao_saida": execucao,
+        }, None, None))
+    alteradas = atualizar_operacoes(alteracoes) if alteracoes else []
+    return [o for o in alteradas if o["status"] == "fechada"], falhas
+
+
+@instrumentar("rolar_operacoes")
+def rolar_operacoes(client, rolagens, snapshot):
+    # rolagens: [(ordem, novo_symbol_fut), ...]. Rolagem em lote compensada:
+    # uma venda por contrato atual e uma compra por contrato novo (um simbolo
+    # que e vendido por umas e comprado por outras sai so com o liquido). A
+    # saida do contrato atual usa o preco medio realizado; a entrada no novo
+    # fica com o preco do snapshot, que e o que definiu a quantidade comprada
+    # e que o fechamento usa para recalcula-la. Devolve (roladas, [(ordem, erro), ...])
+    if not rolagens:
+        return [], []
+    precos = [snapshot.par(ordem["symbol_futuro"], novo) for ordem, novo in rolagens]
+    liquidas = consolidar([
+        _pernas_rolagem(ordem, novo, preco_novo) for (ordem, novo), (_, preco_novo) in zip(rolagens, precos)
+    ])
+    try:
+        resultados, metricas = _executar(client, sum(o["volume_usd"] for o, _ in rolagens), liquidas)
+        fracoes, erro = {}, None
+    except ErroExecucao as e:
+        # rola as operacoes cujos dois contratos executaram; as demais voltam
+        # como falha, com a quantidade do contrato atual que ainda falta vender
+        resultados, metricas, erro = e.pernas, e.metricas or {}, e
+        fracoes = fracoes_executadas(liquidas, resultados)
+    realizados = precos_realizados(resultados)
+    execucao = resumo_execucao(liquidas, metricas, len(rolagens))
+    if erro is not None:
+        execucao = {**execucao, **_execucao_parcial(erro)}
+    alteracoes, roladas, falhas = [], [], []
+    for (ordem, novo), (preco_atual, preco_novo) in zip(rolagens, precos):
+        fracao_atual, fracao_nova = fracoes.get(ordem["symbol_futuro"], 1.0), fracoes.get(novo, 1.0)
+        if fracao_atual >= 1.0 and fracao_nova >= 1.0:
+            roladas.append(ordem["id"])
+            alteracoes.append(_alteracao_rolagem(
+                ordem, novo, realizados.get(ordem["symbol_futuro"], preco_atual), preco_novo, execucao))
+            continue
+        falhas.append((ordem, erro))
+        qty_atual = quantidades(ordem)[1]
+        resto = restante(qty_atual, fracao_atual, ordem["symbol_futuro"])
+        comprado = round(calcular_qty(ordem["volume_usd"], preco_novo, novo) * fracao_nova, 8)
+        if resto != qty_atual or comprado:
+            # comprado > 0: parte do contrato novo ja esta na conta e fica so no historico da operacao
+            alteracoes.append((ordem["id"], {"qty_futuro": resto}, None, {"rolagens_parciais": {
+                "data": agora_str(), "para": novo, "qty_comprada": comprado, "preco_entrada": preco_novo, **execucao,
+            }}))
+    alteradas = atualizar_operacoes(alteracoes) if alteracoes else []
+    return [o for o in alteradas if o["id"] in roladas], falhas
+
+
+def _campos_preenchidos(op, execucao, precos):
+    # campos de preco da operacao que recebem o preco medio preenchido. A perna
+    # do trimestral na entrada de uma operacao ja rolada e a da rolagem so ficam
+    # em preco_real_*: os acumuladores da rolagem ja foram gravados com o preco da resposta
+    if execucao == "execucao_entrada":
+        campos = {op["symbol_perpetuo"]: "preco_entrada_perp"}
+        if not op.get("symbol_futuro_anterior"):
+            campos[op["symbol_futuro"]] = "preco_entrada_futuro"
+    elif execucao == "execucao_saida":
+        campos = {op["symbol_perpetuo"]: "preco_saida_perp", op["symbol_futuro"]: "preco_saida_futuro"}
+    else:
+        return {}
+    alteracao = {campo: precos[symbol] for symbol, campo in campos.items() if symbol in precos}
+    if execucao == "execucao_entrada" and alteracao:
+        # o preco de entrada define as quantidades: ficam fixadas antes da troca
+        qty_perp, qty_fut = quantidades(op)
+        if op.get("qty_perpetuo") is None:
+            alteracao["qty_perpetuo"] = qty_perp
+        if op.get("qty_futuro") is None:
+            alteracao["qty_futuro"] = qty_fut
+    return alteracao
+
+
+@instrumentar("conciliar_preenchimentos")
+def conciliar_preenchimentos(order_ids, loja=store):
+    # Preco medio real (dos preenchimentos do user-data stream) nas operacoes
+    # cujas execucoes contem essas ordens. Uma execucao so e conciliada quando
+    # todas as suas ordens estao encerradas (preenchidas, expiradas ou
+    # canceladas); ate la as ordens continuam pendentes. O preco de cada perna
+    # e a media ponderada pela quantidade executada de cada ordem.
+    # Devolve os ids das operacoes alteradas
+    execucoes = loja.execucoes_das_ordens(order_ids)
+    if not execucoes:
+        return []
+    ops = {op["id"]: op for op in loja.listar(ids={op_id for op_id, _ in execucoes})}
+    alteracoes, conciliadas = [], []
+    for (op_id, execucao), ids in execucoes.items():
+        preenchidas = loja.preenchimentos(ids)
+        if len(preenchidas) < len(ids) or any(p["status"] not in STATUS_FINAIS for p in preenchidas.values()):
+            continue
+        custo, executado = {}, {}
+        for p in preenchidas.values():
+            if p["quantidade"] > 0:
+                custo[p["symbol"]] = custo.get(p["symbol"], 0.0) + p["preco_medio"] * p["quantidade"]
+                executado[p["symbol"]] = executado.get(p["symbol"], 0.0) + p["quantidade"]
+        precos = {symbol: custo[symbol] / executado[symbol] for symbol in custo}
+        conciliadas += ids
+        if not precos:
+            continue  # nenhuma ordem da execucao foi executada
+        alteracoes.append((op_id, {
+            "preco_real_" + execucao.removeprefix("execucao_"): precos,
+            **_campos_preenchidos(ops[op_id], execucao, precos),
+        }, None, None))
+    if alteracoes:
+        loja.atualizar_lote(alteracoes)
+    loja.marcar_conciliados(conciliadas)
+    return [op_id for op_id, *_ in alteracoes]
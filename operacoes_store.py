@@ -0,0 +1,382 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metricas import instrumentar
+
+# Armazenamento transacional das operacoes (SQLite em modo WAL). Cada
+# operacao e uma linha: abrir, fechar ou rolar uma posicao grava apenas a
+# linha afetada, e as consultas por status/simbolo/data usam indices.
+# Na primeira abertura o historico de operacoes_reais.json e importado.
+# O mesmo banco guarda o estado publicado pelo daemon de trading, a fila de
+# comandos enviados pelos apps e as execucoes de ordens recebidas pelo
+# user-data stream (preenchimentos, por orderId), ligadas as operacoes pelos
+# orderIds das execucoes (ordens_operacao). Toda escrita em operacoes incrementa a versao
+# do banco (meta.versao) na mesma transacao e grava essa versao na linha; os
+# caches dos apps (nucleo.py) e o PnL materializado (pnl_materializado.py)
+# usam as versoes para descobrir mudancas feitas por qualquer processo.
+
+ARQUIVO_DB = os.getenv("OPERACOES_DB", "operacoes.db")
+ARQUIVO_JSON = "operacoes_reais.json"
+STATUS_FINAIS = ("FILLED", "CANCELED", "EXPIRED", "EXPIRED_IN_MATCH")  # ordem sem mais execucoes
+
+
+class OperacoesStore:
+    def __init__(self, arquivo=ARQUIVO_DB, arquivo_json=ARQUIVO_JSON):
+        self.arquivo = arquivo
+        self.arquivo_json = arquivo_json
+        self._local = threading.local()
+        self._lock_init = threading.Lock()
+        self._inicializado = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.arquivo, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock_init:
+                if not self._inicializado:
+                    self._criar_tabelas(conn)
+                    self._importar_se_vazio(conn)
+                    self._inicializado = True
+        return conn
+
+    def _criar_tabelas(self, conn):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS operacoes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                symbol_perpetuo TEXT NOT NULL,
+                symbol_futuro TEXT NOT NULL,
+                data_entrada TEXT NOT NULL,
+                dados TEXT NOT NULL,
+                versao INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_operacoes_status ON operacoes (status);
+            CREATE INDEX IF NOT EXISTS idx_operacoes_symbol ON operacoes (symbol_perpetuo);
+            CREATE INDEX IF NOT EXISTS idx_operacoes_entrada ON operacoes (data_entrada);
+            CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+            CREATE TABLE IF NOT EXISTS estado (
+                chave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL,
+                atualizado_em REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS comandos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                comando TEXT NOT NULL,
+                parametros TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                executado_em REAL,
+                resultado TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_comandos_pendentes ON comandos (executado_em);
+            CREATE TABLE IF NOT EXISTS preenchimentos (
+                order_id INTEGER PRIMARY KEY,
+                symbol TEXT NOT NULL,
+                side TEXT NOT NULL,
+                preco_medio REAL NOT NULL,
+                quantidade REAL NOT NULL,
+                status TEXT NOT NULL,
+                tempo_ms INTEGER NOT NULL,
+                conciliado INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS ordens_operacao (
+                order_id INTEGER NOT NULL,
+                op_id INTEGER NOT NULL,
+                execucao TEXT NOT NULL,
+                PRIMARY KEY (order_id, op_id, execucao)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_ordens_operacao_op ON ordens_operacao (op_id, execucao);
+        """)
+        # bancos anteriores a versao por linha
+        colunas = {r[1] for r in conn.execute("PRAGMA table_info(operacoes)")}
+        if "versao" not in colunas:
+            conn.execute("ALTER TABLE operacoes ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_operacoes_versao ON operacoes (versao)")
+        colunas = {r[1] for r in conn.execute("PRAGMA table_info(preenchimentos)")}
+        if "conciliado" not in colunas:
+            conn.execute("ALTER TABLE preenchimentos ADD COLUMN conciliado INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_preenchimentos_pendentes ON preenchimentos (conciliado, tempo_ms)")
+
+    def _importar_se_vazio(self, conn):
+        importado = conn.execute("SELECT valor FROM meta WHERE chave = 'importado_json'").fetchone()
+        if importado or not self.arquivo_json or not os.path.exists(self.arquivo_json):
+            return
+        self.importar_json(self.arquivo_json, conn)
+
+    @instrumentar("operacoes.importar_json")
+    def importar_json(self, arquivo_json, conn=None):
+        conn = conn or self._conn()
+        with open(arquivo_json, "r") as f:
+            ops = json.load(f)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # outro processo abrindo o banco pela primeira vez pode ter importado
+            # o mesmo arquivo entre a leitura da flag e o BEGIN IMMEDIATE
+            importado = conn.execute("SELECT valor FROM meta WHERE chave = 'importado_json'").fetchone()
+            if importado and importado[0] == arquivo_json:
+                conn.execute("ROLLBACK")
+                return 0
+            versao = self._incrementar_versao(conn)
+            for op in ops:
+                self._inserir(conn, op, versao)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('importado_json', ?)", (arquivo_json,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(ops)
+
+    def _inserir(self, conn, op, versao):
+        dados = {k: v for k, v in op.items() if k != "id"}
+        cur = conn.execute(
+            "INSERT INTO operacoes (status, symbol_perpetuo, symbol_futuro, data_entrada, dados, versao) VALUES (?, ?, ?, ?, ?, ?)",
+            (op["status"], op["symbol_perpetuo"], op["symbol_futuro"], op["data_entrada"], json.dumps(dados), versao),
+        )
+        self._indexar_ordens(conn, cur.lastrowid, dados)
+        return cur.lastrowid
+
+    def _indexar_ordens(self, conn, op_id, campos):
+        # orderIds de cada execucao gravada (pernas e, na execucao fatiada, as fatias)
+        for execucao, metricas in campos.items():
+            if not execucao.startswith("execucao_") or not isinstance(metricas, dict):
+                continue
+            pernas = list(metricas.get("pernas", []))
+            for fatia in metricas.get("por_fatia", []):
+                pernas += fatia.get("pernas", [])
+            # uma nova rolagem substitui execucao_rolagem: as ordens da anterior saem do indice
+            conn.execute("DELETE FROM ordens_operacao WHERE op_id = ? AND execucao = ?", (op_id, execucao))
+            conn.executemany(
+                "INSERT OR IGNORE INTO ordens_operacao VALUES (?, ?, ?)",
+                [(p["order_id"], op_id, execucao) for p in pernas if p.get("order_id") is not None],
+            )
+
+    def _incrementar_versao(self, conn):
+        # nova versao do banco; as linhas escritas na transacao recebem este valor
+        rows = conn.execute(
+            "INSERT INTO meta VALUES ('versao', 1) ON CONFLICT (chave) DO UPDATE SET valor = CAST(valor AS INTEGER) + 1"
+            " RETURNING valor"
+        ).fetchall()
+        return int(rows[0][0])
+
+    def versao(self):
+        row = self._conn().execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()
+        return int(row[0]) if row else 0
+
+    @instrumentar("operacoes.inserir")
+    def inserir(self, op):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            op["id"] = self._inserir(conn, op, self._incrementar_versao(conn))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return op["id"]
+
+    def _atualizar(self, conn, op_id, campos, somar, anexar, versao):
+        row = conn.execute("SELECT dados FROM operacoes WHERE id = ?", (op_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Operação {op_id} não encontrada")
+        dados = json.loads(row[0])
+        dados.update({k: v for k, v in campos.items() if k != "id"})
+        self._indexar_ordens(conn, op_id, campos)
+        # acumuladores e listas sao alterados sobre o valor gravado, nao sobre a copia do chamador
+        for campo, valor in (somar or {}).items():
+            dados[campo] = (dados.get(campo) or 0) + valor
+        for campo, item in (anexar or {}).items():
+            dados[campo] = dados.get(campo, []) + [item]
+        conn.execute(
+            "UPDATE operacoes SET status = ?, symbol_perpetuo = ?, symbol_futuro = ?, data_entrada = ?, dados = ?,"
+            " versao = ? WHERE id = ?",
+            (dados["status"], dados["symbol_perpetuo"], dados["symbol_futuro"], dados["data_entrada"],
+             json.dumps(dados), versao, op_id),
+        )
+        dados["id"] = op_id
+        return dados
+
+    @instrumentar("operacoes.atualizar")
+    def atualizar(self, op_id, campos, somar=None, anexar=None):
+        return self.atualizar_lote([(op_id, campos, somar, anexar)])[0]
+
+    @instrumentar("operacoes.atualizar_lote")
+    def atualizar_lote(self, alteracoes):
+        # alteracoes: [(op_id, campos, somar, anexar), ...] gravadas numa unica transacao
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            versao = self._incrementar_versao(conn)
+            resultado = [self._atualizar(conn, *alteracao, versao) for alteracao in alteracoes]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return resultado
+
+    @instrumentar("operacoes.listar")
+    def listar(self, status=None, symbol=None, desde=None, ids=None):
+        filtros, params = [], []
+        if ids is not None:
+            ids = list(ids)
+            filtros.append(f"id IN ({', '.join('?' * len(ids))})")
+            params.extend(ids)
+        if status is not None:
+            filtros.append("status = ?")
+            params.append(status)
+        if symbol is not None:
+            filtros.append("symbol_perpetuo = ?")
+            params.append(symbol)
+        if desde is not None:
+            filtros.append("data_entrada >= ?")
+            params.append(desde)
+        where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+        rows = self._conn().execute(f"SELECT id, dados FROM operacoes {where} ORDER BY id", params).fetchall()
+        ops = []
+        for op_id, dados in rows:
+            op = json.loads(dados)
+            op["id"] = op_id
+            ops.append(op)
+        return ops
+
+    def alteradas(self, desde_versao):
+        # operacoes inseridas ou alteradas depois de desde_versao, com a versao de cada uma
+        rows = self._conn().execute(
+            "SELECT id, dados, versao FROM operacoes WHERE versao > ? ORDER BY id", (desde_versao,)
+        ).fetchall()
+        ops = []
+        for op_id, dados, versao in rows:
+            op = json.loads(dados)
+            op["id"] = op_id
+            ops.append((op, versao))
+        return ops
+
+    # Estado do daemon e fila de comandos
+
+    def publicar_estado(self, chave, valor):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO estado VALUES (?, ?, ?)", (chave, json.dumps(valor, default=str), time.time())
+        )
+
+    def ler_estado(self, chave, padrao=None):
+        row = self._conn().execute("SELECT valor, atualizado_em FROM estado WHERE chave = ?", (chave,)).fetchone()
+        if row is None:
+            return padrao, None
+        return json.loads(row[0]), row[1]
+
+    def enviar_comando(self, comando, parametros=None):
+        cur = self._conn().execute(
+            "INSERT INTO comandos (comando, parametros, criado_em) VALUES (?, ?, ?)",
+            (comando, json.dumps(parametros or {}), time.time()),
+        )
+        return cur.lastrowid
+
+    def comandos_pendentes(self):
+        rows = self._conn().execute(
+            "SELECT id, comando, parametros FROM comandos WHERE executado_em IS NULL ORDER BY id"
+        ).fetchall()
+        return [{"id": r[0], "comando": r[1], "parametros": json.loads(r[2])} for r in rows]
+
+    def concluir_comando(self, comando_id, resultado):
+        self._conn().execute(
+            "UPDATE comandos SET executado_em = ?, resultado = ? WHERE id = ?",
+            (time.time(), json.dumps(resultado, default=str), comando_id),
+        )
+
+    # Execucoes recebidas pelo user-data stream (conta_stream.py)
+
+    def registrar_preenchimento(self, order_id, symbol, side, preco_medio, quantidade, status, tempo_ms):
+        # um registro por ordem; execucoes parciais atualizam o preco medio e a quantidade acumulada
+        self._conn().execute(
+            "INSERT INTO preenchimentos (order_id, symbol, side, preco_medio, quantidade, status, tempo_ms)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (order_id) DO UPDATE SET"
+            " preco_medio = excluded.preco_medio, quantidade = excluded.quantidade, status = excluded.status,"
+            " tempo_ms = excluded.tempo_ms WHERE excluded.tempo_ms >= preenchimentos.tempo_ms",
+            (order_id, symbol, side, preco_medio, quantidade, status, tempo_ms),
+        )
+
+    def preenchimentos(self, order_ids):
+        ids = list(order_ids)
+        if not ids:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT order_id, symbol, side, preco_medio, quantidade, status, tempo_ms FROM preenchimentos"
+            f" WHERE order_id IN ({', '.join('?' * len(ids))})", ids,
+        ).fetchall()
+        return {r[0]: {"symbol": r[1], "side": r[2], "preco_medio": r[3], "quantidade": r[4], "status": r[5],
+                       "tempo_ms": r[6]} for r in rows}
+
+    def preenchimentos_pendentes(self, desde_ms):
+        # ordens encerradas desde desde_ms ainda sem operacao conciliada (o
+        # preenchimento pode chegar antes de a operacao ser gravada)
+        rows = self._conn().execute(
+            f"SELECT order_id FROM preenchimentos WHERE conciliado = 0"
+            f" AND status IN ({', '.join('?' * len(STATUS_FINAIS))}) AND tempo_ms >= ?",
+            (*STATUS_FINAIS, desde_ms),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def execucoes_das_ordens(self, order_ids):
+        # {(op_id, execucao): [order_id, ...]} com todas as ordens de cada execucao que contem alguma das ordens
+        ids = list(order_ids)
+        if not ids:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT o.op_id, o.execucao, o.order_id FROM ordens_operacao o JOIN ("
+            f"SELECT DISTINCT op_id, execucao FROM ordens_operacao WHERE order_id IN ({', '.join('?' * len(ids))})"
+            f") e ON o.op_id = e.op_id AND o.execucao = e.execucao", ids,
+        ).fetchall()
+        execucoes = {}
+        for op_id, execucao, order_id in rows:
+            execucoes.setdefault((op_id, execucao), []).append(order_id)
+        return execucoes
+
+    def marcar_conciliados(self, order_ids):
+        ids = list(order_ids)
+        if ids:
+            self._conn().execute(
+                f"UPDATE preenchimentos SET conciliado = 1 WHERE order_id IN ({', '.join('?' * len(ids))})", ids
+            )
+
+
+store = OperacoesStore()
+
+
+def carregar_operacoes(status=None, symbol=None):
+    return store.listar(status=status, symbol=symbol)
+
+
+def versao_operacoes():
+    return store.versao()
+
+
+def inserir_operacao(op):
+    return store.inserir(op)
+
+
+def atualizar_operacao(op_id, campos, somar=None, anexar=None):
+    return store.atualizar(op_id, campos, somar, anexar)
+
+
+def atualizar_operacoes(alteracoes):
+    return store.atualizar_lote(alteracoes)
+
+
+def publicar_estado(chave, valor):
+    store.publicar_estado(chave, valor)
+
+
+def ler_estado(chave, padrao=None):
+    return store.ler_estado(chave, padrao)
+
+
+def enviar_comando(comando, parametros=None):
+    return store.enviar_comando(comando, parametros)
+
+
+def preenchimentos(order_ids):
+    return store.preenchimentos(order_ids)
@@ -0,0 +1,138 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from funding_store import store as funding_store
+from metricas import instrumentar
+
+# Motor de PnL em lote usado por todas as paginas de historico. Recebe a
+# lista de operacoes, um PriceSnapshot (para marcar as posicoes abertas) e
+# o armazenamento de funding, e calcula funding, basis, rolagem, taxas,
+# total e APR de todas as operacoes com operacoes colunares.
+
+TAXA_PERNA = 0.0004
+PERIODOS_FUNDING_ANO = 3 * 365
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+
+COLUNAS = [
+    "id", "symbol_perpetuo", "symbol_futuro", "status", "data_entrada", "data_saida", "volume_usd",
+    "preco_perp_ref", "preco_futuro_ref", "n_funding", "funding_acumulado", "pnl_funding",
+    "pnl_futuro", "pnl_perp", "pnl_basis", "pnl_rolagem", "taxa_abertura", "taxa_rolagem",
+    "pnl_total", "dias", "apr",
+]
+
+
+_EPOCH = pd.Timestamp(0, tz="UTC")
+
+
+def _para_ms(datas):
+    # datas "YYYY-mm-dd HH:MM:SS" (UTC) -> epoch em ms; NaN onde nao ha data
+    dt = pd.to_datetime(datas, format=FORMATO_DATA, utc=True)
+    return ((dt - _EPOCH) // pd.Timedelta(milliseconds=1)).to_numpy(float)
+
+
+@instrumentar("pnl.funding_por_intervalo")
+def funding_por_intervalo(symbols, inicio_ms, fim_ms, funding=None):
+    # Soma e contagem de funding em [inicio, fim] para cada linha, via somas
+    # acumuladas e busca binaria por simbolo
+    funding = funding or funding_store
+    soma = np.zeros(len(symbols))
+    contagem = np.zeros(len(symbols), dtype=int)
+    for symbol in np.unique(symbols):
+        idx = np.flatnonzero(symbols == symbol)
+        tempos, taxas = funding.serie(symbol, int(inicio_ms[idx].min()))
+        if not tempos:
+            continue
+        tempos = np.asarray(tempos)
+        acumulado = np.concatenate(([0.0], np.cumsum(taxas)))
+        a = np.searchsorted(tempos, inicio_ms[idx], side="left")
+        b = np.searchsorted(tempos, fim_ms[idx], side="right")
+        soma[idx] = acumulado[b] - acumulado[a]
+        contagem[idx] = b - a
+    return soma, contagem
+
+
+@instrumentar("pnl.calcular_pnl_operacoes")
+def calcular_pnl_operacoes(operacoes, snapshot=None, funding=None, agora=None):
+    if not len(operacoes):
+        return pd.DataFrame(columns=COLUNAS)
+    agora = agora if agora is not None else time.time()
+    ops = pd.DataFrame(list(operacoes))
+    for col in ["id", "data_saida", "preco_saida_perp", "preco_saida_futuro", "taxa_abertura", "taxa_rolagem",
+                "pnl_rolagem", "preco_entrada_futuro_anterior", "preco_saida_futuro_anterior"]:
+        if col not in ops:
+            ops[col] = np.nan
+
+    volume = ops["volume_usd"].to_numpy(float)
+    entrada_perp = ops["preco_entrada_perp"].to_numpy(float)
+    entrada_fut = ops["preco_entrada_futuro"].to_numpy(float)
+    qty = volume / entrada_perp
+    fechada = (ops["status"] == "fechada").to_numpy()
+
+    # Precos de referencia: saida para fechadas, snapshot para abertas
+    precos = snapshot.precos if snapshot else {}
+    ref_perp = np.where(fechada, ops["preco_saida_perp"].to_numpy(float),
+                        ops["symbol_perpetuo"].map(precos).to_numpy(float))
+    ref_fut = np.where(fechada, ops["preco_saida_futuro"].to_numpy(float),
+                       ops["symbol_futuro"].map(precos).to_numpy(float))
+
+    # Janela de funding: entrada -> saida (fechadas) ou agora (abertas)
+    agora_ms = int(agora * 1000)
+    inicio_ms = _para_ms(ops["data_entrada"])
+    saida_ms = _para_ms(ops["data_saida"])
+    fim_ms = np.where(fechada & ~np.isnan(saida_ms), saida_ms, agora_ms)
+    symbols = ops["symbol_perpetuo"].to_numpy(str)
+    funding_acumulado, n_funding = funding_por_intervalo(symbols, inicio_ms, fim_ms, funding)
+
+    pnl_funding = funding_acumulado * volume
+    pnl_futuro = (ref_fut - entrada_fut) * qty
+    pnl_perp = (entrada_perp - ref_perp) * qty
+    pnl_basis = pnl_futuro + pnl_perp
+    # PnL acumulado de todas as rolagens; operacoes roladas antes dele so tem a ultima perna (*_anterior)
+    pnl_rolagem = ops["pnl_rolagem"].to_numpy(float)
+    pnl_rolagem = np.where(np.isnan(pnl_rolagem), np.nan_to_num((ops["preco_saida_futuro_anterior"].to_numpy(float)
+                           - ops["preco_entrada_futuro_anterior"].to_numpy(float)) * qty), pnl_rolagem)
+    taxa_abertura = ops["taxa_abertura"].fillna(pd.Series(np.round(volume * 2 * TAXA_PERNA, 2))).to_numpy(float)
+    taxa_rolagem = ops["taxa_rolagem"].fillna(0.0).to_numpy(float)
+    pnl_total = pnl_funding + pnl_basis + pnl_rolagem - taxa_abertura - taxa_rolagem
+
+    dias = np.maximum((fim_ms - inicio_ms) / 86400000, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media = np.where(n_funding > 0, funding_acumulado / n_funding, 0.0)
+    apr = (1 + media) ** PERIODOS_FUNDING_ANO - 1
+
+    return pd.DataFrame({
+        "id": ops["id"],
+        "symbol_perpetuo": ops["symbol_perpetuo"],
+        "symbol_futuro": ops["symbol_futuro"],
+        "status": ops["status"],
+        "data_entrada": ops["data_entrada"],
+        "data_saida": ops["data_saida"],
+        "volume_usd": volume,
+        "preco_perp_ref": ref_perp,
+        "preco_futuro_ref": ref_fut,
+        "n_funding": n_funding,
+        "funding_acumulado": funding_acumulado,
+        "pnl_funding": pnl_funding,
+        "pnl_futuro": pnl_futuro,
+        "pnl_perp": pnl_perp,
+        "pnl_basis": pnl_basis,
+        "pnl_rolagem": pnl_rolagem,
+        "taxa_abertura": taxa_abertura,
+        "taxa_rolagem": taxa_rolagem,
+        "pnl_total": pnl_total,
+        "dias": dias,
+        "apr": apr,
+    }, columns=COLUNAS)
+
+
+def totais(df):
+    # (funding, basis + rolagem, taxas, total) ignorando linhas sem preco
+    validas = df.dropna(subset=["pnl_total"])
+    return (
+        validas["pnl_funding"].sum(),
+        (validas["pnl_basis"] + validas["pnl_rolagem"]).sum(),
+        (validas["taxa_abertura"] + validas["taxa_rolagem"]).sum(),
+        validas["pnl_total"].sum(),
+    )
@@ -0,0 +1,249 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from funding_store import store as funding_store
+from metricas import instrumentar
+from operacoes_store import ARQUIVO_DB, store as operacoes_store
+from pnl_engine import COLUNAS, FORMATO_DATA, PERIODOS_FUNDING_ANO, TAXA_PERNA, funding_por_intervalo
+from precos import get_snapshot
+
+# PnL materializado por operacao (tabela pnl_operacoes no banco das
+# operacoes). Cada linha guarda o que nao depende de preco de mercado:
+# funding realmente pago no periodo da operacao (taxas do historico x
+# volume), basis das fechadas, perna da rolagem e taxas. A atualizacao e
+# incremental: so reprocessa as operacoes com versao maior que a ultima
+# materializada e soma apenas os periodos de funding novos das linhas
+# pendentes (abertas, ou fechadas cujo funding ainda nao foi sincronizado
+# ate a saida). Na leitura as abertas sao marcadas com o snapshot de precos.
+
+CAMPOS = [
+    "id", "versao_op", "symbol_perpetuo", "symbol_futuro", "status", "data_entrada", "data_saida",
+    "volume_usd", "qty", "preco_entrada_perp", "preco_entrada_futuro", "preco_perp_ref", "preco_futuro_ref",
+    "pnl_futuro", "pnl_perp", "pnl_basis", "pnl_rolagem", "taxa_abertura", "taxa_rolagem",
+    "inicio_ms", "fim_ms", "funding_ate_ms", "n_funding", "funding_acumulado", "pnl_funding", "pendente",
+]
+
+
+def _para_ms(data):
+    if not data:
+        return None
+    return int(datetime.strptime(data, FORMATO_DATA).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _linha(op, versao):
+    # estado da operacao sem funding; o funding entra em _acumular_funding
+    volume = float(op["volume_usd"])
+    entrada_perp, entrada_fut = float(op["preco_entrada_perp"]), float(op["preco_entrada_futuro"])
+    qty = volume / entrada_perp
+    inicio_ms = _para_ms(op["data_entrada"])
+    fechada = op["status"] == "fechada"
+
+    ref_perp = op.get("preco_saida_perp") if fechada else None
+    ref_fut = op.get("preco_saida_futuro") if fechada else None
+    pnl_futuro = pnl_perp = pnl_basis = None
+    if ref_perp is not None and ref_fut is not None:
+        pnl_futuro = (ref_fut - entrada_fut) * qty
+        pnl_perp = (entrada_perp - ref_perp) * qty
+        pnl_basis = pnl_futuro + pnl_perp
+
+    saida_ant, entrada_ant = op.get("preco_saida_futuro_anterior"), op.get("preco_entrada_futuro_anterior")
+    pnl_rolagem = op.get("pnl_rolagem")
+    if pnl_rolagem is None:
+        pnl_rolagem = (saida_ant - entrada_ant) * qty if saida_ant is not None and entrada_ant is not None else 0.0
+    taxa_abertura = op.get("taxa_abertura")
+    if taxa_abertura is None:
+        taxa_abertura = round(volume * 2 * TAXA_PERNA, 2)
+
+    return (
+        op["id"], versao, op["symbol_perpetuo"], op["symbol_futuro"], op["status"], op["data_entrada"],
+        op.get("data_saida"), volume, qty, entrada_perp, entrada_fut, ref_perp, ref_fut,
+        pnl_futuro, pnl_perp, pnl_basis, pnl_rolagem, taxa_abertura, op.get("taxa_rolagem") or 0.0,
+        inicio_ms, _para_ms(op.get("data_saida")) if fechada else None, inicio_ms - 1, 0, 0.0, 0.0, 1,
+    )
+
+
+class PnlMaterializado:
+    def __init__(self, arquivo=ARQUIVO_DB, operacoes=operacoes_store, funding=funding_store):
+        self.arquivo = arquivo
+        self.operacoes = operacoes
+        self.funding = funding
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.arquivo, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+                CREATE TABLE IF NOT EXISTS pnl_operacoes (
+                    id INTEGER PRIMARY KEY,
+                    versao_op INTEGER NOT NULL,
+                    symbol_perpetuo TEXT NOT NULL,
+                    symbol_futuro TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    data_entrada TEXT NOT NULL,
+                    data_saida TEXT,
+                    volume_usd REAL NOT NULL,
+                    qty REAL NOT NULL,
+                    preco_entrada_perp REAL NOT NULL,
+                    preco_entrada_futuro REAL NOT NULL,
+                    preco_perp_ref REAL,
+                    preco_futuro_ref REAL,
+                    pnl_futuro REAL,
+                    pnl_perp REAL,
+                    pnl_basis REAL,
+                    pnl_rolagem REAL NOT NULL,
+                    taxa_abertura REAL NOT NULL,
+                    taxa_rolagem REAL NOT NULL,
+                    inicio_ms INTEGER NOT NULL,
+                    fim_ms INTEGER,
+                    funding_ate_ms INTEGER NOT NULL,
+                    n_funding INTEGER NOT NULL,
+                    funding_acumulado REAL NOT NULL,
+                    pnl_funding REAL NOT NULL,
+                    pendente INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_pnl_pendente ON pnl_operacoes (pendente);
+                CREATE INDEX IF NOT EXISTS idx_pnl_status ON pnl_operacoes (status);
+            """)
+            self._local.conn = conn
+        return conn
+
+    def versao(self):
+        row = self._conn().execute("SELECT valor FROM meta WHERE chave = 'pnl_versao'").fetchone()
+        return int(row[0]) if row else -1
+
+    @instrumentar("pnl_materializado.atualizar")
+    def atualizar(self, agora=None):
+        # (operacoes reprocessadas, linhas com funding novo)
+        alteradas = self.operacoes.alteradas(self.versao())
+        conn = self._conn()
+        if alteradas:
+            colunas = ", ".join(CAMPOS)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # outro processo pode ter materializado uma versao mais nova da mesma linha
+                conn.executemany(
+                    f"INSERT INTO pnl_operacoes ({colunas}) VALUES ({', '.join('?' * len(CAMPOS))})"
+                    f" ON CONFLICT (id) DO UPDATE SET ({colunas}) = ({', '.join('excluded.' + c for c in CAMPOS)})"
+                    " WHERE excluded.versao_op > pnl_operacoes.versao_op",
+                    [_linha(op, versao) for op, versao in alteradas],
+                )
+                conn.execute(
+                    "INSERT INTO meta VALUES ('pnl_versao', ?) ON CONFLICT (chave)"
+                    " DO UPDATE SET valor = MAX(CAST(valor AS INTEGER), CAST(excluded.valor AS INTEGER))",
+                    (max(versao for _, versao in alteradas),),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(alteradas), self._acumular_funding(conn, agora)
+
+    def _acumular_funding(self, conn, agora=None):
+        rows = conn.execute(
+            "SELECT id, versao_op, symbol_perpetuo, funding_ate_ms, fim_ms FROM pnl_operacoes WHERE pendente = 1"
+        ).fetchall()
+        if not rows:
+            return 0
+        agora_ms = int((agora if agora is not None else time.time()) * 1000)
+        ids, versoes, symbols, desde, fim = zip(*rows)
+        symbols = np.array(symbols)
+        desde = np.array(desde, dtype=float)
+        aberta = np.array([f is None for f in fim])
+        fim = np.array([agora_ms if f is None else f for f in fim], dtype=float)
+
+        # so conta funding ate onde o historico ja esta sincronizado; o resto
+        # fica para a proxima atualizacao
+        ate = fim.copy()
+        for symbol in np.unique(symbols):
+            idx = symbols == symbol
+            self.funding.sincronizar(symbol, int(desde[idx].min()) + 1)
+            coberto = self.funding.coberto_ate(symbol)
+            ate[idx] = np.maximum(np.minimum(fim[idx], coberto if coberto is not None else desde[idx]), desde[idx])
+        soma, contagem = funding_por_intervalo(symbols, desde + 1, ate, self.funding)
+
+        # linhas sem periodo novo ficam como estao: o intervalo seguinte ainda parte de funding_ate_ms
+        pendente = aberta | (ate < fim)
+        avancou = np.flatnonzero((contagem > 0) | ~pendente)
+        if not len(avancou):
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # a condicao em funding_ate_ms impede somar duas vezes o mesmo periodo
+            cur = conn.executemany(
+                "UPDATE pnl_operacoes SET funding_acumulado = funding_acumulado + ?, n_funding = n_funding + ?,"
+                " pnl_funding = (funding_acumulado + ?) * volume_usd, funding_ate_ms = ?, pendente = ?"
+                " WHERE id = ? AND versao_op = ? AND funding_ate_ms = ?",
+                [(float(soma[i]), int(contagem[i]), float(soma[i]), int(ate[i]), int(pendente[i]),
+                  ids[i], versoes[i], int(desde[i])) for i in avancou],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount
+
+    def _marcar(self, df, snapshot=None, agora=None):
+        # basis das abertas pelo snapshot, total e APR de todas as linhas
+        aberta = df["pnl_basis"].isna() & (df["status"] != "fechada")
+        if aberta.any():
+            precos = (snapshot or get_snapshot()).precos
+            df.loc[aberta, "preco_perp_ref"] = df.loc[aberta, "symbol_perpetuo"].map(precos)
+            df.loc[aberta, "preco_futuro_ref"] = df.loc[aberta, "symbol_futuro"].map(precos)
+            df.loc[aberta, "pnl_futuro"] = (df["preco_futuro_ref"] - df["preco_entrada_futuro"]) * df["qty"]
+            df.loc[aberta, "pnl_perp"] = (df["preco_entrada_perp"] - df["preco_perp_ref"]) * df["qty"]
+            df.loc[aberta, "pnl_basis"] = df["pnl_futuro"] + df["pnl_perp"]
+        df["pnl_total"] = (df["pnl_funding"] + df["pnl_basis"] + df["pnl_rolagem"]
+                           - df["taxa_abertura"] - df["taxa_rolagem"])
+        agora_ms = (agora if agora is not None else time.time()) * 1000
+        df["dias"] = np.maximum((df["fim_ms"].fillna(agora_ms) - df["inicio_ms"]) / 86400000, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            media = np.where(df["n_funding"] > 0, df["funding_acumulado"] / df["n_funding"], 0.0)
+        df["apr"] = (1 + media) ** PERIODOS_FUNDING_ANO - 1
+        return df
+
+    @instrumentar("pnl_materializado.ler")
+    def ler(self, snapshot=None, status=None, agora=None):
+        where, params = ("WHERE status = ?", (status,)) if status is not None else ("", ())
+        df = pd.read_sql_query(f"SELECT * FROM pnl_operacoes {where} ORDER BY id", self._conn(), params=params)
+        for col in ("preco_perp_ref", "preco_futuro_ref", "pnl_futuro", "pnl_perp", "pnl_basis", "fim_ms"):
+            df[col] = df[col].astype(float)
+        return self._marcar(df, snapshot, agora)[COLUNAS]
+
+    @instrumentar("pnl_materializado.resumo")
+    def resumo(self, snapshot=None):
+        # totais por status agregados no banco; so as abertas sao lidas para a marcacao
+        df = pd.read_sql_query("""
+            SELECT status, COUNT(*) AS operacoes, SUM(volume_usd) AS volume_usd, SUM(pnl_funding) AS pnl_funding,
+                   SUM(COALESCE(pnl_basis, 0)) + SUM(pnl_rolagem) AS pnl_basis,
+                   SUM(taxa_abertura + taxa_rolagem) AS taxas
+            FROM pnl_operacoes GROUP BY status ORDER BY status
+        """, self._conn())
+        if (df["status"] == "aberta").any():
+            basis_abertas = self.ler(snapshot, status="aberta")["pnl_basis"].sum()
+            df.loc[df["status"] == "aberta", "pnl_basis"] += basis_abertas
+        df["pnl_total"] = df["pnl_funding"] + df["pnl_basis"] - df["taxas"]
+        return df
+
+
+materializado = PnlMaterializado()
+
+
+def atualizar_pnl(agora=None):
+    return materializado.atualizar(agora)
+
+
+def ler_pnl(snapshot=None, status=None):
+    return materializado.ler(snapshot, status)
+
+
+def resumo_pnl(snapshot=None):
+    return materializado.resumo(snapshot)
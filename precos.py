@@ -0,0 +1,44 @@
+import threading
+import time
+
+from binance_rest import get_json
+from metricas import instrumentar
+
+# Snapshot de precos de todos os contratos (perpetuos e trimestrais) obtido
+# com uma unica chamada a /fapi/v1/ticker/price. Cada refresh da pagina
+# baixa um snapshot e o repassa para todos os consumidores.
+
+IDADE_MAXIMA_SNAPSHOT = 5  # segundos
+
+
+class PriceSnapshot:
+    def __init__(self, precos, timestamp):
+        self.precos = precos
+        self.timestamp = timestamp
+
+    @classmethod
+    def baixar(cls):
+        data = get_json("/fapi/v1/ticker/price")
+        return cls({d["symbol"]: float(d["price"]) for d in data}, time.time())
+
+    def preco(self, symbol):
+        return self.precos[symbol]
+
+    def par(self, symbol_perp, symbol_futuro):
+        return self.precos[symbol_perp], self.precos[symbol_futuro]
+
+    def idade(self):
+        return time.time() - self.timestamp
+
+
+_lock = threading.Lock()
+_ultimo = None
+
+
+@instrumentar("get_snapshot")
+def get_snapshot(idade_maxima=IDADE_MAXIMA_SNAPSHOT):
+    global _ultimo
+    with _lock:
+        if _ultimo is None or _ultimo.idade() > idade_maxima:
+            _ultimo = PriceSnapshot.baixar()
+        return _ultimo
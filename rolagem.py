@@ -0,0 +1,60 @@
+from metadados import registro
+from operacoes import TAXA_PERNA
+
+# Motor de rolagem das posicoes abertas. Agrupa as operacoes pelo contrato
+# trimestral em carteira e, dentro da janela antes do vencimento, compara o
+# calendar spread (proximo trimestral - atual) de cada contrato com uma meta
+# de custo: o spread mais as taxas das duas pernas, anualizado pelos dias a
+# mais do contrato novo. Rola quando o custo fica abaixo da meta ou, em
+# qualquer caso, quando faltam menos de `dias_limite` dias. Todas as
+# operacoes elegiveis sao roladas juntas com o mesmo snapshot de precos
+# (operacoes.rolar_operacoes), com uma ordem por contrato (compensacao.py).
+
+JANELA_ROLAGEM = 7  # dias antes do vencimento em que o spread passa a ser observado
+DIAS_LIMITE_ROLAGEM = 2  # abaixo disso rola independente do custo
+CUSTO_MAX_ROLAGEM = 0.10  # custo anualizado (spread + taxas) que antecipa a rolagem
+
+
+def custo_rolagem(preco_atual, preco_proximo, dias_atual, dias_proximo):
+    # (spread relativo, custo anualizado pelos dias a mais do contrato novo)
+    spread = (preco_proximo - preco_atual) / preco_atual
+    dias_extra = max(dias_proximo - dias_atual, 1)
+    return spread, (spread + 2 * TAXA_PERNA) / dias_extra * 365
+
+
+def planejar_rolagens(abertas, snapshot, janela=JANELA_ROLAGEM, dias_limite=DIAS_LIMITE_ROLAGEM,
+                      custo_max=CUSTO_MAX_ROLAGEM):
+    # Uma linha por contrato em carteira dentro da janela, com a decisao e as operacoes afetadas
+    grupos = {}
+    for op in abertas:
+        grupos.setdefault((op["symbol_perpetuo"], op["symbol_futuro"]), []).append(op)
+
+    plano = []
+    for (perp, atual), ops in sorted(grupos.items()):
+        dias = registro.dias_ate_vencimento(atual)
+        if dias >= janela:
+            continue
+        proximo = registro.contrato(perp, "NEXT_QUARTER")
+        linha = {
+            "perpetuo": perp, "atual": atual, "proximo": proximo, "dias_vencimento": round(dias, 2),
+            "operacoes": [op["id"] for op in ops], "volume_usd": sum(op["volume_usd"] for op in ops),
+            "spread": None, "custo_apr": None,
+        }
+        if not proximo or proximo == atual or atual not in snapshot.precos or proximo not in snapshot.precos:
+            plano.append({**linha, "rolar": False, "motivo": "sem contrato seguinte com preço"})
+            continue
+        spread, custo = custo_rolagem(*snapshot.par(atual, proximo), dias, registro.dias_ate_vencimento(proximo))
+        linha.update(spread=spread, custo_apr=custo)
+        if dias < dias_limite:
+            plano.append({**linha, "rolar": True, "motivo": "prazo"})
+        elif custo <= custo_max:
+            plano.append({**linha, "rolar": True, "motivo": "custo"})
+        else:
+            plano.append({**linha, "rolar": False, "motivo": "aguardando custo"})
+    return plano
+
+
+def rolagens_do_plano(plano, abertas):
+    # [(ordem, novo_symbol_fut), ...] das linhas marcadas para rolar
+    por_id = {op["id"]: op for op in abertas}
+    return [(por_id[op_id], linha["proximo"]) for linha in plano if linha["rolar"] for op_id in linha["operacoes"]]
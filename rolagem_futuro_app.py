@@ -1,54 +1,50 @@
 import streamlit as st
-import requests
-import json
-import os
-from datetime import datetime, timezone
-from binance.client import Client
-from dotenv import load_dotenv
+from operacoes_store import enviar_comando
+from operacoes import rolar_operacao, rolar_operacoes, get_next_quarter_symbol
+from precos import get_snapshot
+from rolagem import rolagens_do_plano
+from trader_daemon import daemon_ativo, ler_config, plano_rolagem
+from nucleo import get_client, operacoes
 
 st.set_page_config(page_title="🔄 Arbitragem com Rolagem de Futuro", layout="wide")
 
-ARQUIVO_OPERACOES = "operacoes_reais.json"
-
-load_dotenv()
-API_KEY = os.getenv("BINANCE_API_KEY")
-API_SECRET = os.getenv("BINANCE_API_SECRET")
-client = Client(API_KEY, API_SECRET)
-
-def carregar_operacoes():
-    if os.path.exists(ARQUIVO_OPERACOES):
-        with open(ARQUIVO_OPERACOES, "r") as f:
-            return json.load(f)
-    return []
-
-def salvar_operacoes(ops):
-    with open(ARQUIVO_OPERACOES, "w") as f:
-        json.dump(ops, f, indent=2)
-
-def calcular_qty(volume_usd, preco, symbol):
-    info = client.futures_exchange_info()
-    step = 0.001
-    for s in info['symbols']:
-        if s['symbol'] == symbol:
-            for f in s['filters']:
-                if f['filterType'] == 'LOT_SIZE':
-                    step = float(f['stepSize'])
-    qty = volume_usd / preco
-    qty = qty - (qty % step)
-    return round(qty, 8)
-
-def get_next_quarter_symbol(symbol_prefix):
-    info = requests.get("https://fapi.binance.com/fapi/v1/exchangeInfo").json()
-    futures = sorted(
-        [s["symbol"] for s in info["symbols"] 
-         if s["symbol"].startswith(symbol_prefix) and s["contractType"] == "NEXT_QUARTER"]
-    )
-    return futures[0] if futures else None
+client = get_client()
 
 st.title("🔄 Arbitragem com Rolagem de Contrato Futuro")
 
-operacoes = carregar_operacoes()
-abertas = [op for op in operacoes if op["status"] == "aberta"]
+abertas = operacoes(status="aberta")
+
+# Plano do motor de rolagem: contratos dentro da janela, calendar spread e decisao
+if abertas:
+    config = ler_config()
+    snapshot = get_snapshot()
+    plano = plano_rolagem(abertas, snapshot, config)
+    st.subheader("📅 Plano de Rolagem")
+    if plano:
+        st.dataframe([{
+            "Perpétuo": linha["perpetuo"],
+            "Atual → Próximo": f"{linha['atual']} → {linha['proximo']}",
+            "Dias p/ vencimento": linha["dias_vencimento"],
+            "Operações": len(linha["operacoes"]),
+            "Volume (USD)": linha["volume_usd"],
+            "Spread": f"{linha['spread']:.4%}" if linha["spread"] is not None else "N/A",
+            "Custo anualizado": f"{linha['custo_apr']:.2%}" if linha["custo_apr"] is not None else "N/A",
+            "Decisão": ("🟢 rolar" if linha["rolar"] else "⏳ aguardar") + f" ({linha['motivo']})",
+        } for linha in plano], use_container_width=True, hide_index=True)
+        elegiveis = rolagens_do_plano(plano, abertas)
+        if elegiveis and st.button(f"🔄 Rolar {len(elegiveis)} operação(ões) elegíveis em lote"):
+            if daemon_ativo():
+                cmd = enviar_comando("rolar_lote")
+                st.success(f"🔄 Rolagem em lote enviada ao daemon (comando #{cmd})")
+            else:
+                roladas, falhas = rolar_operacoes(client, elegiveis, snapshot)
+                if roladas:
+                    st.success(f"🔄 {len(roladas)} operação(ões) roladas")
+                for ordem, erro in falhas:
+                    st.error(f"Erro ao rolar a operação #{ordem['id']}: {erro}")
+    else:
+        st.info(f"Nenhum contrato a menos de {config['janela_rolagem']} dias do vencimento.")
+    st.divider()
 
 if abertas:
     for idx, ordem in enumerate(abertas):
@@ -60,7 +56,8 @@ if abertas:
 **Entrada:** `{ordem['data_entrada']}`  
 **Volume:** `${ordem['volume_usd']}`  
 **Contrato Futuro Atual:** `{ordem['symbol_futuro']}`  
-**Preço Entrada Futuro:** `${ordem['preco_entrada_futuro']}`
+**Preço Entrada Futuro:** `${ordem['preco_entrada_futuro']}`  
+**Rolagens:** `{len(ordem.get('rolagens', []))}`
 """)
 
             if st.button(f"🔄 Rolar Futuro #{idx+1}", key=f"rolar_{idx}"):
@@ -71,25 +68,12 @@ if abertas:
                         st.error("Nenhum contrato futuro seguinte encontrado!")
                         st.stop()
 
-                    preco_atual_futuro = float(requests.get(f"https://fapi.binance.com/fapi/v1/ticker/price?symbol={ordem['symbol_futuro']}").json()["price"])
-                    preco_novo_futuro = float(requests.get(f"https://fapi.binance.com/fapi/v1/ticker/price?symbol={novo_symbol_fut}").json()["price"])
-
-                    qty_fut_atual = calcular_qty(ordem["volume_usd"], ordem["preco_entrada_futuro"], ordem["symbol_futuro"])
-                    qty_fut_novo = calcular_qty(ordem["volume_usd"], preco_novo_futuro, novo_symbol_fut)
-
-                    client.futures_create_order(symbol=ordem["symbol_futuro"], side="SELL", type="MARKET", quantity=qty_fut_atual)
-                    client.futures_create_order(symbol=novo_symbol_fut, side="BUY", type="MARKET", quantity=qty_fut_novo)
-
-                    ordem["symbol_futuro_anterior"] = ordem["symbol_futuro"]
-                    ordem["preco_saida_futuro"] = preco_atual_futuro
-                    ordem["symbol_futuro"] = novo_symbol_fut
-                    ordem["preco_entrada_futuro"] = preco_novo_futuro
-                    ordem["data_rolagem"] = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-                    ordem["taxa_rolagem"] = round(ordem["volume_usd"] * 2 * 0.0004, 2)
-
-                    salvar_operacoes(operacoes)
-
-                    st.success(f"🔄 Rolagem realizada com sucesso para contrato {novo_symbol_fut}!")
+                    if daemon_ativo():
+                        cmd = enviar_comando("rolar", {"id": ordem["id"], "symbol_futuro": novo_symbol_fut})
+                        st.success(f"🔄 Rolagem para {novo_symbol_fut} enviada ao daemon (comando #{cmd})")
+                    else:
+                        rolar_operacao(client, ordem, novo_symbol_fut, get_snapshot())
+                        st.success(f"🔄 Rolagem realizada com sucesso para contrato {novo_symbol_fut}!")
 
                 except Exception as e:
                     st.error(f"Erro ao realizar rolagem: {e}")
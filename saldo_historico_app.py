@@ -1,37 +1,60 @@
+import argparse
 import time
-import json
 from datetime import datetime, timezone
-from binance.client import Client
+from binance_rest import criar_client
 from dotenv import load_dotenv
 import os
+from conta_stream import ContaStream
+from serie_saldo import GravadorSaldo, compactar
+from metricas import iniciar_servidor
 
 load_dotenv()
 API_KEY = os.getenv("BINANCE_API_KEY")
 API_SECRET = os.getenv("BINANCE_API_SECRET")
-client = Client(API_KEY, API_SECRET)
-
-ARQUIVO_HISTORICO = "saldo_historico.json"
-
-def salvar_saldo():
-    while True:
-        account_info = client.futures_account()
-        total = float(account_info['totalWalletBalance'])
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        registro = {"timestamp": timestamp, "total": total}
-
-        if os.path.exists(ARQUIVO_HISTORICO):
-            with open(ARQUIVO_HISTORICO, "r") as f:
-                historico = json.load(f)
-        else:
-            historico = []
-
-        historico.append(registro)
-
-        with open(ARQUIVO_HISTORICO, "w") as f:
-            json.dump(historico, f, indent=2)
-
-        time.sleep(3600)  # aguarda 1 hora antes de próxima consulta
+client = criar_client(API_KEY, API_SECRET)
+
+INTERVALO_PADRAO = int(os.getenv("SALDO_INTERVALO", 3600))  # segundos entre amostras (modo polling)
+
+def acompanhar_saldo():
+    # grava cada mudanca de saldo no horario do evento (user-data stream) e
+    # publica saldo e posicoes para as paginas; REST so na conexao
+    gravador = GravadorSaldo()
+    stream = ContaStream(client, gravador).iniciar()
+    try:
+        while True:
+            time.sleep(3600)
+    finally:
+        stream.parar()
+        gravador.fechar()
+
+def salvar_saldo(intervalo=INTERVALO_PADRAO):
+    gravador = GravadorSaldo()
+    try:
+        while True:
+            inicio = time.monotonic()
+            account_info = client.futures_account()
+            total = float(account_info['totalWalletBalance'])
+            timestamp = datetime.now(timezone.utc).isoformat()
+
+            gravador.gravar({"timestamp": timestamp, "total": total})
+
+            # mantem a cadencia descontando o tempo da consulta
+            time.sleep(max(intervalo - (time.monotonic() - inicio), 0))
+    finally:
+        gravador.fechar()
 
 if __name__ == "__main__":
-    salvar_saldo()
+    parser = argparse.ArgumentParser(description="Gravador do histórico de saldo da corretora")
+    parser.add_argument("--intervalo", type=int, default=INTERVALO_PADRAO, help="segundos entre amostras")
+    parser.add_argument("--polling", action="store_true",
+                        help="consulta a conta a cada --intervalo em vez de seguir o user-data stream")
+    parser.add_argument("--compactar", action="store_true", help="compacta o histórico e sai")
+    args = parser.parse_args()
+    if args.compactar:
+        print(f"{compactar()} registros após compactação")
+    elif args.polling:
+        iniciar_servidor()
+        salvar_saldo(args.intervalo)
+    else:
+        iniciar_servidor()
+        acompanhar_saldo()
@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from metadados import registro
+from precos import get_snapshot
+from estatisticas_funding import estatisticas
+from metricas import instrumentar
+
+# Scanner de basis/funding para todos os perpetuos que tem contrato
+# trimestral (CURRENT_QUARTER/NEXT_QUARTER). Precos vem de um unico snapshot,
+# o funding das estatisticas incrementais (estatisticas_funding.py, que leem
+# so os eventos novos do armazenamento local, em paralelo) e as metricas sao
+# calculadas em uma passada vetorizada.
+
+LIMIAR_FUNDING_DIARIO = 0.0003
+MULTIPLICADOR_BASIS = 1.5
+TIPOS_TRIMESTRAIS = ("CURRENT_QUARTER", "NEXT_QUARTER")
+
+
+def gatilho_entrada(funding_diario, basis_dia, limiar=LIMIAR_FUNDING_DIARIO, multiplicador=MULTIPLICADOR_BASIS):
+    # Funciona com escalares e com arrays NumPy/Series
+    return (funding_diario > limiar) | (funding_diario > multiplicador * basis_dia)
+
+
+def pares_trimestrais(tipos=TIPOS_TRIMESTRAIS, perps=None):
+    pares = []
+    for tipo in tipos:
+        for fut in registro.contratos(tipo):
+            perp = registro.contrato(fut["pair"], "PERPETUAL")
+            if perps is not None and perp not in perps:
+                continue
+            if perp and fut["status"] == "TRADING":
+                pares.append((perp, fut["symbol"], tipo, fut["deliveryDate"]))
+    return pares
+
+
+def funding_recente(simbolos):
+    # {symbol: resumo} com funding de 24h, desvio de 7d e APR composto de 30d
+    estatisticas.atualizar_varios(simbolos)
+    return {s: estatisticas.resumo(s) for s in simbolos}
+
+
+@instrumentar("scanner.escanear")
+def escanear(snapshot=None, tipos=TIPOS_TRIMESTRAIS, perps=None):
+    snapshot = snapshot or get_snapshot()
+    pares = [p for p in pares_trimestrais(tipos, perps) if p[0] in snapshot.precos and p[1] in snapshot.precos]
+    colunas = ["perpetuo", "futuro", "tipo", "preco_perp", "preco_futuro", "dias_vencimento",
+               "basis_pct", "basis_dia", "funding_diario", "relacao_fb", "excesso_dia", "gatilho",
+               "desvio_funding_7d", "apr_funding_30d"]
+    if not pares:
+        return pd.DataFrame(columns=colunas)
+
+    perps, futs, tipos_contrato, entregas = map(np.array, zip(*pares))
+    funding = funding_recente(sorted(set(perps)))
+
+    preco_perp = np.array([snapshot.precos[s] for s in perps])
+    preco_fut = np.array([snapshot.precos[s] for s in futs])
+    dias = np.maximum(np.floor((entregas.astype(float) / 1000 - time.time()) / 86400), 1)
+    basis_pct = (preco_fut - preco_perp) / preco_perp
+    basis_dia = basis_pct / dias
+    funding_diario = np.array([funding[s]["1d"]["soma"] for s in perps])
+    # regime do funding: volatilidade por periodo na semana e APR composto no mes (NaN sem historico)
+    desvio_7d = np.array([funding[s]["7d"]["desvio"] for s in perps], dtype=float)
+    apr_30d = np.array([funding[s]["30d"]["apr_composto"] for s in perps], dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relacao_fb = np.where(basis_dia != 0, funding_diario / basis_dia, 0.0)
+
+    df = pd.DataFrame({
+        "perpetuo": perps,
+        "futuro": futs,
+        "tipo": tipos_contrato,
+        "preco_perp": preco_perp,
+        "preco_futuro": preco_fut,
+        "dias_vencimento": dias.astype(int),
+        "basis_pct": basis_pct,
+        "basis_dia": basis_dia,
+        "funding_diario": funding_diario,
+        "relacao_fb": relacao_fb,
+        # carry diario da posicao (short perp + long futuro): funding recebido - convergencia do basis
+        "excesso_dia": funding_diario - basis_dia,
+        "gatilho": gatilho_entrada(funding_diario, basis_dia),
+        "desvio_funding_7d": desvio_7d,
+        "apr_funding_30d": apr_30d,
+    }, columns=colunas)
+    return df.sort_values(["gatilho", "excesso_dia"], ascending=False).reset_index(drop=True)
@@ -0,0 +1,245 @@
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from metricas import instrumentar
+
+# Serie de alta frequencia de basis e funding por contrato trimestral. Um
+# gravador amostra a leitura do motor de mercado (market_data.py) a cada
+# segundo e grava em arquivos de coluna de largura fixa, mapeados em memoria
+# e particionados por dia UTC: <BASIS_DIR>/<AAAAMMDD>/<symbol_futuro>/<coluna>.bin.
+# Cada arquivo tem um slot por segundo do dia, entao a posicao da amostra e o
+# proprio horario: gravar e uma atribuicao no slot e ler um intervalo e um
+# fatiamento, sem indice nem parse. Slots sem amostra tem tempo_ms == 0 (os
+# arquivos sao esparsos ate serem preenchidos). particoes devolve views
+# NumPy sobre o mmap, sem copia, com os slots vazios; ler filtra os slots
+# preenchidos e devolve arrays novos (copia das amostras validas do intervalo).
+# O NumPy so e importado quando um arquivo e aberto.
+
+DIR_BASIS = os.getenv("BASIS_DIR", "basis")
+RESOLUCAO_S = 1  # segundos por slot
+SLOTS_DIA = 86400 // RESOLUCAO_S
+COLUNAS = {
+    "tempo_ms": "int64",  # 0 = slot vazio
+    "preco_perp": "float64",
+    "preco_futuro": "float64",
+    "basis_pct": "float64",
+    "basis_dia": "float64",
+    "funding_previsto": "float64",  # NaN quando o motor ainda nao recebeu a taxa
+}
+INTERVALO_FLUSH = 60  # segundos entre msync dos arquivos abertos para escrita
+DIAS_CACHE_LEITURA = 3  # dias com mapas de leitura abertos; os usados ha mais tempo sao soltos
+
+
+def _dia(momento_s):
+    return datetime.fromtimestamp(momento_s, tz=timezone.utc).strftime("%Y%m%d")
+
+
+def _inicio_dia(dia):
+    return datetime.strptime(dia, "%Y%m%d").replace(tzinfo=timezone.utc).timestamp()
+
+
+class SerieBasis:
+    def __init__(self, diretorio=DIR_BASIS):
+        self.diretorio = diretorio
+        self._escrita = {}  # (dia, futuro) -> {coluna: memmap}
+        self._leitura = OrderedDict()  # dia -> {futuro: {coluna: memmap}}, do menos ao mais usado
+        self._lock = threading.Lock()
+        self._flush_em = time.monotonic()
+
+    def _caminho(self, dia, futuro, coluna):
+        return os.path.join(self.diretorio, dia, futuro, f"{coluna}.bin")
+
+    def _abrir_escrita(self, dia, futuro):
+        import numpy as np
+
+        chave = (dia, futuro)
+        if chave not in self._escrita:
+            # o dia anterior deixa de receber amostras: grava e solta os mapas
+            for antiga in [c for c in self._escrita if c[0] != dia]:
+                for mapa in self._escrita.pop(antiga).values():
+                    mapa.flush()
+            os.makedirs(os.path.join(self.diretorio, dia, futuro), exist_ok=True)
+            colunas = {}
+            for coluna, dtype in COLUNAS.items():
+                caminho = self._caminho(dia, futuro, coluna)
+                modo = "r+" if os.path.exists(caminho) else "w+"
+                colunas[coluna] = np.memmap(caminho, dtype=dtype, mode=modo, shape=(SLOTS_DIA,))
+            self._escrita[chave] = colunas
+        return self._escrita[chave]
+
+    def _completo(self, dia, futuro):
+        # todas as colunas existem com o tamanho do dia; na virada do dia o
+        # gravador pode estar criando os arquivos e o dia conta como vazio
+        import numpy as np
+
+        for coluna, dtype in COLUNAS.items():
+            caminho = self._caminho(dia, futuro, coluna)
+            if not os.path.exists(caminho) or os.path.getsize(caminho) < SLOTS_DIA * np.dtype(dtype).itemsize:
+                return False
+        return True
+
+    def _abrir_leitura(self, dia, futuro):
+        import numpy as np
+
+        with self._lock:
+            por_futuro = self._leitura.get(dia)
+            if por_futuro is None or futuro not in por_futuro:
+                if not self._completo(dia, futuro):
+                    return None
+                por_futuro = self._leitura.setdefault(dia, {})
+                por_futuro[futuro] = {
+                    coluna: np.memmap(self._caminho(dia, futuro, coluna), dtype=dtype, mode="r", shape=(SLOTS_DIA,))
+                    for coluna, dtype in COLUNAS.items()
+                }
+            self._leitura.move_to_end(dia)
+            while len(self._leitura) > DIAS_CACHE_LEITURA:
+                # views ja devolvidas continuam validas: o mmap so e fechado quando elas saem de uso
+                self._leitura.popitem(last=False)
+            return por_futuro[futuro]
+
+    # Escrita
+
+    @instrumentar("basis.gravar")
+    def gravar(self, futuro, momento_s, leitura):
+        # leitura: dicionario de MotorMercado.leitura
+        dia = _dia(momento_s)
+        slot = int(momento_s - _inicio_dia(dia)) // RESOLUCAO_S
+        funding = leitura.get("funding_previsto")
+        with self._lock:
+            colunas = self._abrir_escrita(dia, futuro)
+            colunas["preco_perp"][slot] = leitura["preco_perp"]
+            colunas["preco_futuro"][slot] = leitura["preco_futuro"]
+            colunas["basis_pct"][slot] = leitura["basis_pct"]
+            colunas["basis_dia"][slot] = leitura["basis_dia"]
+            colunas["funding_previsto"][slot] = float("nan") if funding is None else funding
+            # tempo por ultimo: o slot so vale para os leitores quando esta completo
+            colunas["tempo_ms"][slot] = int(momento_s * 1000)
+            if time.monotonic() - self._flush_em >= INTERVALO_FLUSH:
+                self.sincronizar()
+
+    def sincronizar(self):
+        for colunas in self._escrita.values():
+            for mapa in colunas.values():
+                mapa.flush()
+        self._flush_em = time.monotonic()
+
+    def fechar(self):
+        with self._lock:
+            self.sincronizar()
+            self._escrita.clear()
+
+    # Leitura
+
+    def dias(self, futuro=None):
+        if not os.path.isdir(self.diretorio):
+            return []
+        dias = sorted(d for d in os.listdir(self.diretorio) if d.isdigit())
+        if futuro is None:
+            return dias
+        return [d for d in dias if os.path.isdir(os.path.join(self.diretorio, d, futuro))]
+
+    def simbolos(self, dia):
+        caminho = os.path.join(self.diretorio, dia)
+        return sorted(os.listdir(caminho)) if os.path.isdir(caminho) else []
+
+    def particoes(self, futuro, inicio_s, fim_s):
+        # [(dia, {coluna: view}), ...] cobrindo [inicio_s, fim_s]; views sobre o mmap, sem copia,
+        # incluindo slots vazios (tempo_ms == 0)
+        partes = []
+        dia_s = _inicio_dia(_dia(inicio_s))
+        while dia_s <= fim_s:
+            dia = _dia(dia_s)
+            colunas = self._abrir_leitura(dia, futuro)
+            if colunas is not None:
+                de = max(int(inicio_s - dia_s) // RESOLUCAO_S, 0)
+                ate = min(int(fim_s - dia_s) // RESOLUCAO_S + 1, SLOTS_DIA)
+                partes.append((dia, {coluna: mapa[de:ate] for coluna, mapa in colunas.items()}))
+            dia_s = (datetime.fromtimestamp(dia_s, tz=timezone.utc) + timedelta(days=1)).timestamp()
+        return partes
+
+    @instrumentar("basis.ler")
+    def ler(self, futuro, inicio_s, fim_s, colunas=None):
+        # {coluna: array} so com os slots preenchidos. Nao e view: a mascara de slots
+        # vazios copia as amostras validas (tempo_ms tem zeros entre elas, entao nao
+        # ha fatia contigua); para ler sem copia, use particoes
+        import numpy as np
+
+        colunas = list(colunas or COLUNAS)
+        if "tempo_ms" not in colunas:
+            colunas = ["tempo_ms"] + colunas
+        partes = []
+        for _, views in self.particoes(futuro, inicio_s, fim_s):
+            validos = views["tempo_ms"] != 0
+            partes.append({c: views[c][validos] for c in colunas})
+        if not partes:
+            return {c: np.empty(0, dtype=COLUNAS[c]) for c in colunas}
+        return {c: np.concatenate([p[c] for p in partes]) for c in colunas}
+
+
+class GravadorBasis:
+    # Amostra os pares do motor de mercado a cada `intervalo` segundos, alinhado ao relogio
+    def __init__(self, pares, motor, serie=None, intervalo=RESOLUCAO_S):
+        self.pares = list(pares)
+        self.motor = motor
+        self.serie = serie or SerieBasis()
+        self.intervalo = intervalo
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = None
+
+    def amostrar(self, momento_s=None):
+        momento_s = momento_s if momento_s is not None else time.time()
+        for perp, futuro in self.pares:
+            leitura = self.motor.leitura(perp, futuro)
+            if leitura:
+                self.serie.gravar(futuro, momento_s, leitura)
+                self.amostras += 1
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo - time.time() % self.intervalo):
+            self.amostrar()
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name="gravador-basis", daemon=True)
+            self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.serie.fechar()
+
+
+serie = SerieBasis()
+
+
+def ler_basis(futuro, inicio_s, fim_s, colunas=None):
+    return serie.ler(futuro, inicio_s, fim_s, colunas)
+
+
+if __name__ == "__main__":
+    from market_data import get_motor
+    from metadados import registro
+    from metricas import iniciar_servidor
+
+    parser = argparse.ArgumentParser(description="Gravador da série de basis/funding por segundo")
+    parser.add_argument("--simbolos", nargs="+", default=["BTCUSDT", "ETHUSDT"], help="perpétuos a gravar")
+    parser.add_argument("--intervalo", type=float, default=RESOLUCAO_S, help="segundos entre amostras")
+    args = parser.parse_args()
+
+    pares = [(perp, registro.contrato(perp, "CURRENT_QUARTER")) for perp in args.simbolos]
+    pares = [(perp, futuro) for perp, futuro in pares if futuro]
+    iniciar_servidor()
+    gravador = GravadorBasis(pares, get_motor(pares), serie, args.intervalo).iniciar()
+    print(f"Gravando {', '.join(f for _, f in pares)} em {os.path.abspath(serie.diretorio)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        gravador.parar()
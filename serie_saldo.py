@@ -0,0 +1,309 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from metricas import instrumentar
+
+# Serie historica do saldo em formato append-only (uma linha JSON por
+# registro). Cada amostra acrescenta uma linha ao fim do arquivo; o fsync e
+# feito em lotes e uma linha incompleta deixada por um crash e ignorada na
+# leitura e descartada na compactacao. O historico legado (JSON unico) e
+# migrado pelo gravador e pela compactacao; as consultas apenas leem.
+#
+# Para os graficos ha rollups pre-calculados (1m/1h/1d, com min/max/ultimo
+# de cada bucket) e uma consulta por intervalo de tempo que devolve a serie
+# reduzida a um numero alvo de pontos, sem carregar o historico inteiro.
+
+ARQUIVO_SERIE = "saldo_historico.jsonl"
+ARQUIVO_LEGADO = "saldo_historico.json"
+FSYNC_REGISTROS = 10  # fsync a cada N registros...
+FSYNC_SEGUNDOS = 300  # ...ou a cada N segundos, o que vier primeiro
+
+RESOLUCOES = {"1m": 60, "1h": 3600, "1d": 86400}
+BYTES_POR_LINHA = 60  # tamanho medio aproximado de uma linha da serie bruta
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _escrever_atomico(arquivo, registros):
+    tmp = arquivo + ".tmp"
+    with open(tmp, "w") as f:
+        for r in registros:
+            f.write(json.dumps(r) + "\n")
+        _fsync(f)
+    os.replace(tmp, arquivo)
+
+
+def migrar_legado(arquivo=ARQUIVO_SERIE, arquivo_legado=ARQUIVO_LEGADO):
+    if os.path.exists(arquivo) or not os.path.exists(arquivo_legado):
+        return 0
+    with open(arquivo_legado, "r") as f:
+        registros = json.load(f)
+    _escrever_atomico(arquivo, registros)
+    return len(registros)
+
+
+@instrumentar("saldo.ler_registros")
+def ler_registros(arquivo=ARQUIVO_SERIE):
+    if not os.path.exists(arquivo):
+        return
+    with open(arquivo, "r") as f:
+        for linha in f:
+            try:
+                yield json.loads(linha)
+            except ValueError:
+                continue  # linha incompleta (crash no meio da escrita)
+
+
+def compactar(arquivo=ARQUIVO_SERIE):
+    migrar_legado(arquivo)
+    registros = {r["timestamp"]: r for r in ler_registros(arquivo)}
+    ordenados = [registros[ts] for ts in sorted(registros)]
+    _escrever_atomico(arquivo, ordenados)
+    # a compactacao pode inserir registros antigos: recalcula os rollups
+    for rotulo in RESOLUCOES:
+        if os.path.exists(arquivo_rollup(arquivo, rotulo)):
+            os.remove(arquivo_rollup(arquivo, rotulo))
+    atualizar_rollups(arquivo)
+    return len(ordenados)
+
+
+# Rollups e consultas por intervalo
+
+def _epoch(timestamp):
+    return datetime.fromisoformat(timestamp).timestamp()
+
+
+def arquivo_rollup(arquivo, rotulo):
+    return f"{os.path.splitext(arquivo)[0]}_{rotulo}.jsonl"
+
+
+def _ultima_linha(arquivo):
+    if not os.path.exists(arquivo):
+        return None
+    with open(arquivo, "rb") as f:
+        fim = f.seek(0, os.SEEK_END)
+        bloco = b""
+        pos = fim
+        while pos > 0 and bloco.count(b"\n") < 2:
+            passo = min(4096, pos)
+            pos -= passo
+            f.seek(pos)
+            bloco = f.read(passo) + bloco
+    for linha in reversed(bloco.splitlines()):
+        try:
+            return json.loads(linha)
+        except ValueError:
+            continue
+    return None
+
+
+def _offset_para(f, chave, epoch_de):
+    # busca binaria pelo inicio da primeira linha com epoch >= chave
+    # (as linhas estao ordenadas por tempo)
+    baixo, alto = 0, f.seek(0, os.SEEK_END)
+    while baixo < alto:
+        meio = (baixo + alto) // 2
+        if meio == baixo:
+            pos = baixo
+        else:
+            f.seek(meio - 1)
+            f.readline()
+            pos = f.tell()
+            if pos >= alto:
+                pos = baixo
+        f.seek(pos)
+        linha = f.readline()
+        try:
+            ts = epoch_de(json.loads(linha))
+        except (ValueError, KeyError):
+            ts = float("-inf")  # linha incompleta: segue adiante
+        if ts < chave:
+            baixo = f.tell()
+        else:
+            alto = pos
+    return baixo
+
+
+def _ler_intervalo(arquivo, inicio, fim, epoch_de):
+    if not os.path.exists(arquivo):
+        return
+    with open(arquivo, "rb") as f:
+        f.seek(_offset_para(f, inicio, epoch_de))
+        for linha in f:
+            try:
+                r = json.loads(linha)
+                ts = epoch_de(r)
+            except ValueError:
+                continue
+            if ts > fim:
+                break
+            yield ts, r
+
+
+def _epoch_bruto(r):
+    return _epoch(r["timestamp"])
+
+
+def _epoch_rollup(r):
+    return r["t"]
+
+
+def _como_bucket(r):
+    if "total" in r:
+        return {"min": r["total"], "max": r["total"], "ultimo": r["total"], "n": 1}
+    return r
+
+
+@instrumentar("saldo.atualizar_rollups")
+def atualizar_rollups(arquivo=ARQUIVO_SERIE):
+    # Cada nivel e agregado a partir do anterior (bruto -> 1m -> 1h -> 1d),
+    # entao cada chamada le apenas o bucket corrente de cada nivel. So grava
+    # buckets fechados; o bucket corrente e lido da serie bruta na consulta.
+    origem, epoch_de = arquivo, _epoch_bruto
+    for rotulo, res in RESOLUCOES.items():
+        destino = arquivo_rollup(arquivo, rotulo)
+        ultimo = _ultima_linha(destino)
+        inicio = ultimo["t"] + res if ultimo else float("-inf")
+        fechados, atual = [], None
+        for ts, r in _ler_intervalo(origem, inicio, float("inf"), epoch_de):
+            r = _como_bucket(r)
+            t = int(ts // res * res)
+            if atual and atual["t"] != t:
+                fechados.append(atual)
+                atual = None
+            if atual is None:
+                atual = {"t": t, "min": r["min"], "max": r["max"], "ultimo": r["ultimo"], "n": 0}
+            atual["min"] = min(atual["min"], r["min"])
+            atual["max"] = max(atual["max"], r["max"])
+            atual["ultimo"] = r["ultimo"]
+            atual["n"] += r["n"]
+        if fechados:
+            with open(destino, "a") as f:
+                for b in fechados:
+                    f.write(json.dumps(b) + "\n")
+        origem, epoch_de = destino, _epoch_rollup
+
+
+def limites(arquivo=ARQUIVO_SERIE):
+    if not os.path.exists(arquivo):
+        return None
+    primeiro = None
+    with open(arquivo, "r") as f:
+        for linha in f:
+            try:
+                primeiro = json.loads(linha)
+                break
+            except ValueError:
+                continue
+    ultimo = _ultima_linha(arquivo)
+    if not primeiro or not ultimo:
+        return None
+    return _epoch(primeiro["timestamp"]), _epoch(ultimo["timestamp"])
+
+
+def _reduzir(pontos, inicio, fim, alvo):
+    # min/max por bucket: preserva picos e vales com ~alvo pontos. Pontos de
+    # rollup (min != max) viram dois pontos, para o grafico nao perder os extremos
+    expandidos = []
+    for ts, vmin, vmax, _ in pontos:
+        expandidos.extend([(ts, vmin)] if vmin == vmax else [(ts, vmin), (ts, vmax)])
+    if len(expandidos) <= alvo:
+        return expandidos
+    n_buckets = max(alvo // 2, 1)
+    largura = (fim - inicio) / n_buckets or 1
+    buckets = {}
+    for ts, vmin, vmax, _ in pontos:
+        i = min(max(int((ts - inicio) // largura), 0), n_buckets - 1)
+        b = buckets.get(i)
+        if b is None:
+            buckets[i] = [(ts, vmin), (ts, vmax)]
+        else:
+            if vmin < b[0][1]:
+                b[0] = (ts, vmin)
+            if vmax > b[1][1]:
+                b[1] = (ts, vmax)
+    reduzidos = []
+    for i in sorted(buckets):
+        extremos = sorted(set(buckets[i]))
+        reduzidos.extend(extremos)
+    return reduzidos
+
+
+@instrumentar("saldo.consultar")
+def consultar(inicio, fim, pontos=1000, arquivo=ARQUIVO_SERIE):
+    # Retorna ([(epoch, total)], resolucao usada) para o intervalo [inicio, fim]
+    if not os.path.exists(arquivo):
+        return [], "bruto"
+    with open(arquivo, "rb") as f:
+        estimativa = (_offset_para(f, fim, _epoch_bruto) - _offset_para(f, inicio, _epoch_bruto)) / BYTES_POR_LINHA
+
+    resolucao, serie = "bruto", []
+    if estimativa > pontos * 4:
+        for rotulo, res in RESOLUCOES.items():
+            resolucao = rotulo
+            if (fim - inicio) / res <= pontos * 4:
+                break
+
+    inicio_bruto = inicio
+    if resolucao != "bruto":
+        res = RESOLUCOES[resolucao]
+        # o bucket que comeca antes de `inicio` tambem cobre o comeco do intervalo
+        for ts, b in _ler_intervalo(arquivo_rollup(arquivo, resolucao), inicio // res * res, fim, _epoch_rollup):
+            serie.append((max(ts, inicio), b["min"], b["max"], b["ultimo"]))
+            inicio_bruto = ts + res
+    # bucket corrente (ainda nao consolidado) ou a serie bruta do intervalo
+    serie += [(ts, r["total"], r["total"], r["total"])
+              for ts, r in _ler_intervalo(arquivo, inicio_bruto, fim, _epoch_bruto)]
+    return _reduzir(serie, inicio, fim, pontos), resolucao
+
+
+class GravadorSaldo:
+    def __init__(self, arquivo=ARQUIVO_SERIE, fsync_registros=FSYNC_REGISTROS, fsync_segundos=FSYNC_SEGUNDOS):
+        migrar_legado(arquivo)
+        self.arquivo = arquivo
+        self.fsync_registros = fsync_registros
+        self.fsync_segundos = fsync_segundos
+        self._f = open(arquivo, "a+")
+        self._pendentes = 0
+        self._ultimo_fsync = time.monotonic()
+        self._bucket_rollup = None
+        self._terminar_linha_parcial()
+
+    def _terminar_linha_parcial(self):
+        tamanho = self._f.seek(0, os.SEEK_END)
+        if tamanho:
+            self._f.seek(tamanho - 1)
+            if self._f.read(1) != "\n":
+                self._f.write("\n")
+        self._f.seek(0, os.SEEK_END)
+
+    @instrumentar("saldo.gravar")
+    def gravar(self, registro):
+        self._f.write(json.dumps(registro) + "\n")
+        self._f.flush()
+        self._pendentes += 1
+        if (self._pendentes >= self.fsync_registros
+                or time.monotonic() - self._ultimo_fsync >= self.fsync_segundos):
+            self.sincronizar()
+        # os rollups so gravam buckets fechados, e cada nivel so fecha um bucket
+        # quando o nivel anterior fecha o seu: so ha o que agregar quando a
+        # amostra abre um bucket novo da menor resolucao
+        bucket = int(_epoch_bruto(registro) // min(RESOLUCOES.values()))
+        if bucket != self._bucket_rollup:
+            atualizar_rollups(self.arquivo)
+            self._bucket_rollup = bucket
+
+    def sincronizar(self):
+        if self._pendentes:
+            _fsync(self._f)
+        self._pendentes = 0
+        self._ultimo_fsync = time.monotonic()
+
+    def fechar(self):
+        self.sincronizar()
+        self._f.close()
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+DIR_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIR_REPO)
+
+# Os testes rodam contra a API fake (fake_binance.py), com livro simulado por
+# simbolo, num diretorio temporario com banco proprio. Varios modulos leem as
+# variaveis de ambiente na importacao, entao o fake sobe antes da coleta. A
+# execucao fatiada usa TWAP (5 fatias, sem espera entre elas) para que as
+# falhas no meio da execucao sejam deterministicas.
+
+N_ATIVOS = 6
+
+_fake = None
+
+
+def pytest_configure(config):
+    global _fake
+    os.environ.setdefault("EXEC_MODO", "twap")
+    os.environ.setdefault("EXEC_INTERVALO_FATIAS", "0")
+    from benchmark import _preparar
+
+    _fake = _preparar(N_ATIVOS, 0, 0.0)
+
+
+def pytest_unconfigure(config):
+    if _fake is not None:
+        _fake.parar()
+
+
+@pytest.fixture
+def fake():
+    return _fake
+
+
+@pytest.fixture
+def client():
+    from binance_rest import criar_client
+
+    return criar_client()
+
+
+class ClienteFalho:
+    # Client que recusa as ordens de `symbol` depois de `aceitas` ordens
+    # desse simbolo; o resto passa direto para o client real
+    def __init__(self, client, symbol, aceitas=0):
+        self.client = client
+        self.symbol = symbol
+        self.aceitas = aceitas
+
+    def futures_create_order(self, **params):
+        if params["symbol"] == self.symbol:
+            if self.aceitas <= 0:
+                raise RuntimeError(f"ordem recusada: {self.symbol}")
+            self.aceitas -= 1
+        return self.client.futures_create_order(**params)
+
+    def __getattr__(self, nome):
+        return getattr(self.client, nome)
+
+
+@pytest.fixture
+def cliente_falho(client):
+    return lambda symbol, aceitas=0: ClienteFalho(client, symbol, aceitas)
+
+
+@pytest.fixture
+def posicao(fake):
+    # quantidade com sinal do fake num simbolo
+    return lambda symbol: round(fake.posicoes.get(symbol, (0.0, 0.0))[0], 8)
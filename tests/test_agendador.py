@@ -0,0 +1,43 @@
+import threading
+import time
+
+import agendador
+from agendador import HISTORICO, MARCACAO, ORDEM, AgendadorPeso, peso_rota, prioridade_rota
+
+
+def test_peso_e_prioridade_por_rota():
+    assert peso_rota("/fapi/v1/depth", {"limit": 50}) == 2
+    assert peso_rota("/fapi/v1/klines", {"limit": 1500}) == 10
+    assert peso_rota("/fapi/v1/ticker/price") == 2
+    assert peso_rota("/fapi/v1/ticker/price", {"symbol": "BTCUSDT"}) == 1
+    assert prioridade_rota("POST", "/fapi/v1/order") == ORDEM
+    assert prioridade_rota("GET", "/fapi/v1/fundingRate") == HISTORICO
+    assert prioridade_rota("GET", "/fapi/v2/account") == MARCACAO
+
+
+def test_historico_espera_e_ordens_usam_o_restante(monkeypatch):
+    # janela longa: o contador nao zera durante o teste
+    monkeypatch.setattr(agendador, "JANELA", 3600)
+    ag = AgendadorPeso(limite=100)
+    with ag.reservar(55, HISTORICO):
+        pass
+
+    # historico passaria de 60% do limite: fica na fila
+    atendida = threading.Event()
+
+    def historico():
+        with ag.reservar(10, HISTORICO):
+            atendida.set()
+
+    threading.Thread(target=historico, daemon=True).start()
+    time.sleep(0.2)
+    assert not atendida.is_set()
+    assert ag.orcamento()["fila"]["historico"] == 1
+
+    # a ordem nao espera atras do historico bloqueado
+    inicio = time.monotonic()
+    with ag.reservar(40, ORDEM):
+        pass
+    assert time.monotonic() - inicio < 0.1
+    assert ag.orcamento()["usado"] == 95
+    assert not atendida.is_set()
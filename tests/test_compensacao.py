@@ -0,0 +1,65 @@
+from compensacao import consolidar, exposicao_liquida, fracoes_executadas, quantidades, restante
+
+
+def _resultado(symbol, quantity, executado=None, erro=None):
+    resposta = None if erro else {"executedQty": str(quantity if executado is None else executado), "avgPrice": "1"}
+    return {"symbol": symbol, "side": "BUY", "quantity": quantity, "resposta": resposta, "erro": erro}
+
+
+def test_consolidar_soma_pernas_empilhadas_e_anula_opostas():
+    liquidas = consolidar([
+        [{"symbol": "A", "side": "SELL", "quantity": 1.5}, {"symbol": "B", "side": "BUY", "quantity": 2.0}],
+        [{"symbol": "A", "side": "SELL", "quantity": 0.5}, {"symbol": "C", "side": "BUY", "quantity": 1.0}],
+        [{"symbol": "C", "side": "SELL", "quantity": 1.0}, {"symbol": "B", "side": "SELL", "quantity": 0.5}],
+    ])
+    assert liquidas == [
+        {"symbol": "A", "side": "SELL", "quantity": 2.0},
+        {"symbol": "B", "side": "BUY", "quantity": 1.5},
+    ]
+
+
+def test_consolidar_sem_resto_de_ponto_flutuante():
+    pernas = [[{"symbol": "A", "side": "BUY", "quantity": 0.1}] for _ in range(3)]
+    pernas.append([{"symbol": "A", "side": "SELL", "quantity": 0.3}])
+    assert consolidar(pernas) == []
+
+
+def test_fracoes_executadas_por_ordem_liquida():
+    liquidas = [{"symbol": "A", "quantity": 2.0}, {"symbol": "B", "quantity": 1.0}, {"symbol": "C", "quantity": 4.0}]
+    resultados = [
+        _resultado("A", 1.0),
+        _resultado("A", 1.0, executado=0.5),
+        _resultado("B", 1.0, erro=RuntimeError("recusada")),
+        _resultado("C", 4.0),
+    ]
+    assert fracoes_executadas(liquidas, resultados) == {"A": 0.75, "B": 0.0, "C": 1.0}
+
+
+def test_restante_em_lotes_inteiros():
+    # step 0.001 no fake: o resto de cada perna e arredondado ao lote
+    assert restante(0.010, 0.0, "BTCUSDT") == 0.010
+    assert restante(0.010, 1.0, "BTCUSDT") == 0.0
+    assert restante(0.010, 0.3, "BTCUSDT") == 0.007
+    assert restante(0.003, 1 / 3, "BTCUSDT") == 0.002
+
+
+def test_quantidades_gravadas_prevalecem_sobre_o_volume():
+    op = {"symbol_perpetuo": "XRPUSDT", "symbol_futuro": "XRPUSDT_X", "volume_usd": 100.0,
+          "preco_entrada_perp": 3.0, "preco_entrada_futuro": 7.0}
+    assert quantidades(op) == (33.333, 14.285)
+    assert quantidades({**op, "qty_perpetuo": 12.0, "qty_futuro": 0.0}) == (12.0, 0.0)
+
+
+def test_exposicao_liquida_por_par():
+    base = {"volume_usd": 100.0, "preco_entrada_perp": 3.0, "preco_entrada_futuro": 7.0}
+    abertas = [
+        {**base, "id": 1, "symbol_perpetuo": "XRPUSDT", "symbol_futuro": "XRPUSDT_X"},
+        {**base, "id": 2, "symbol_perpetuo": "XRPUSDT", "symbol_futuro": "XRPUSDT_X", "qty_perpetuo": 10.0,
+         "qty_futuro": 8.0},
+        {**base, "id": 3, "symbol_perpetuo": "XRPUSDT", "symbol_futuro": "XRPUSDT_Y"},
+    ]
+    linhas = exposicao_liquida(abertas)
+    assert [(l["futuro"], l["operacoes"], l["qty_perpetuo"], l["qty_futuro"]) for l in linhas] == [
+        ("XRPUSDT_X", [1, 2], -43.333, 22.285),
+        ("XRPUSDT_Y", [3], -33.333, 14.285),
+    ]
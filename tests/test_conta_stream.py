@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from conta_stream import ContaStream
+from metadados import registro
+from operacoes_store import OperacoesStore
+from serie_saldo import GravadorSaldo
+
+
+@pytest.fixture
+def loja(tmp_path):
+    return OperacoesStore(str(tmp_path / "operacoes.db"), str(tmp_path / "operacoes.json"))
+
+
+def _saldo(evento_ms, carteira):
+    return {"e": "ACCOUNT_UPDATE", "E": evento_ms, "T": evento_ms,
+            "a": {"m": "ORDER", "B": [{"a": "USDT", "wb": str(carteira), "cw": str(carteira)}], "P": []}}
+
+
+def _ordem(order_id, symbol, execucao, status, preco_medio, executado, evento_ms=1):
+    return {"e": "ORDER_TRADE_UPDATE", "E": evento_ms, "T": evento_ms,
+            "o": {"i": order_id, "s": symbol, "S": "SELL", "x": execucao, "X": status,
+                  "ap": str(preco_medio), "z": str(executado), "T": evento_ms}}
+
+
+def test_eventos_anteriores_a_fotografia_sao_ignorados(client, loja):
+    conta = ContaStream(client, loja=loja)
+    conta.carregar()
+    total = conta.total()
+    fotografia = conta._fotografia_ms
+
+    conta.aplicar(_saldo(fotografia - 1, total + 50))
+    assert conta.total() == total
+    conta.aplicar(_saldo(fotografia + 1, total + 50))
+    assert conta.total() == total + 50
+
+
+def test_serie_de_saldo_nunca_volta_no_tempo(client, loja, tmp_path):
+    arquivo = str(tmp_path / "saldo.jsonl")
+    gravador = GravadorSaldo(arquivo)
+    conta = ContaStream(client, gravador, loja=loja)
+    conta.carregar()
+    total = conta.total()
+    fotografia = conta._fotografia_ms
+
+    conta.aplicar(_saldo(fotografia + 10, total + 1))
+    conta.aplicar(_saldo(fotografia + 5, total + 2))
+    gravador.fechar()
+    with open(arquivo) as f:
+        registros = [json.loads(linha) for linha in f]
+    assert [r["total"] for r in registros] == [total, total + 1, total + 2]
+    assert [r["timestamp"] for r in registros] == sorted(r["timestamp"] for r in registros)
+
+
+def test_execucao_conciliada_quando_todas_as_ordens_encerram(client, loja):
+    perp = "ETHUSDT"
+    fut = registro.contrato(perp, "CURRENT_QUARTER")
+    op_id = loja.inserir({
+        "data_entrada": "2026-01-01 00:00:00", "symbol_perpetuo": perp, "symbol_futuro": fut,
+        "preco_entrada_perp": 100.0, "preco_entrada_futuro": 101.0, "volume_usd": 1000.0, "status": "aberta",
+        "execucao_entrada": {"pernas": [{"symbol": perp, "order_id": 1}, {"symbol": fut, "order_id": 2}],
+                             "por_fatia": [{"pernas": [{"symbol": perp, "order_id": 3}]}]},
+    })
+    conta = ContaStream(client, loja=loja)
+
+    # IOC parcialmente executada e depois expirada; a perna do trimestral foi cancelada sem execucao
+    conta.aplicar(_ordem(1, perp, "TRADE", "PARTIALLY_FILLED", 99.5, 4.0))
+    conta.aplicar(_ordem(3, perp, "TRADE", "FILLED", 100.5, 6.0))
+    conta.aplicar(_ordem(2, fut, "CANCELED", "CANCELED", 0.0, 0.0))
+    assert "preco_real_entrada" not in loja.listar(ids={op_id})[0]
+
+    conta.aplicar(_ordem(1, perp, "EXPIRED", "EXPIRED", 99.5, 4.0, evento_ms=2))
+    op = loja.listar(ids={op_id})[0]
+    assert op["preco_real_entrada"] == {perp: pytest.approx(100.1)}
+    assert op["preco_entrada_perp"] == pytest.approx(100.1)
+    assert op["preco_entrada_futuro"] == 101.0
+    assert loja.preenchimentos_pendentes(0) == []
@@ -0,0 +1,60 @@
+import math
+import random
+
+import pytest
+
+from estatisticas_funding import ANO_MS, JANELAS, EstatisticasSimbolo
+
+PERIODO_MS = 8 * 3600000
+
+
+def _eventos(n, semente=7):
+    aleatorio = random.Random(semente)
+    return [(i * PERIODO_MS, aleatorio.uniform(-0.0005, 0.001)) for i in range(n)]
+
+
+def test_janelas_incrementais_iguais_ao_recalculo():
+    eventos = _eventos(200)
+    estat = EstatisticasSimbolo()
+    for tempo_ms, taxa in eventos:
+        estat.adicionar(tempo_ms, taxa)
+    resumo = estat.resumo()
+
+    ultimo = eventos[-1][0]
+    for nome, duracao in JANELAS.items():
+        # a janela termina no ultimo funding e exclui o evento exatamente `duracao` antes
+        taxas = [taxa for tempo_ms, taxa in eventos if tempo_ms > ultimo - duracao]
+        media = sum(taxas) / len(taxas)
+        desvio = math.sqrt(sum((t - media) ** 2 for t in taxas) / (len(taxas) - 1))
+        assert resumo[nome]["n"] == len(taxas)
+        assert resumo[nome]["soma"] == pytest.approx(sum(taxas), abs=1e-12)
+        assert resumo[nome]["desvio"] == pytest.approx(desvio, rel=1e-9)
+        composto = math.exp(sum(math.log1p(t) for t in taxas) * ANO_MS / duracao) - 1
+        assert resumo[nome]["apr_composto"] == pytest.approx(composto, rel=1e-9)
+
+
+def test_funding_diario_sao_os_tres_ultimos_periodos():
+    eventos = _eventos(10)
+    estat = EstatisticasSimbolo()
+    for tempo_ms, taxa in eventos:
+        estat.adicionar(tempo_ms, taxa)
+    assert estat.janelas["1d"].soma == pytest.approx(sum(taxa for _, taxa in eventos[-3:]))
+    assert estat.resumo()["intervalo_h"] == 8
+
+
+def test_eventos_repetidos_ou_fora_de_ordem_sao_ignorados():
+    estat = EstatisticasSimbolo()
+    assert estat.adicionar(2 * PERIODO_MS, 0.001)
+    assert not estat.adicionar(2 * PERIODO_MS, 0.001)
+    assert not estat.adicionar(PERIODO_MS, 0.002)
+    assert estat.janelas["1d"].soma == 0.001
+    assert estat.ewma == 0.001
+
+
+def test_ewma_converge_para_taxa_constante():
+    estat = EstatisticasSimbolo()
+    estat.adicionar(0, 0.0)
+    for i in range(1, 200):
+        estat.adicionar(i * PERIODO_MS, 0.0003)
+    assert estat.ewma == pytest.approx(0.0003, rel=1e-6)
+    assert estat.resumo()["ewma_dia"] == pytest.approx(0.0009, rel=1e-6)
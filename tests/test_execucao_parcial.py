@@ -0,0 +1,105 @@
+import pytest
+
+from execucao import ErroExecucao
+from metadados import calcular_qty, registro
+from operacoes import abrir_operacao, fechar_operacao, fechar_operacoes, get_next_quarter_symbol, rolar_operacao
+from operacoes_store import store
+from precos import get_snapshot
+
+VOLUME_FATIADO = 10000.0  # acima de EXEC_LIMIAR_FATIAS: 5 fatias TWAP
+VOLUME = 100.0  # uma ordem por perna
+
+
+def _par(perp):
+    return perp, registro.contrato(perp, "CURRENT_QUARTER")
+
+
+def _operacao(op_id):
+    return store.listar(ids={op_id})[0]
+
+
+def _ultima_aberta(perp):
+    return max(store.listar(status="aberta", symbol=perp), key=lambda op: op["id"])
+
+
+def test_entrada_e_saida_fatiadas_parciais_acompanham_a_posicao(client, cliente_falho, posicao):
+    perp, fut = _par("SOLUSDT")
+    antes_perp, antes_fut = posicao(perp), posicao(fut)
+
+    # 3 fatias do perpetuo e 2 do trimestral executadas antes da recusa
+    with pytest.raises(ErroExecucao):
+        abrir_operacao(cliente_falho(fut, aceitas=2), perp, fut, VOLUME_FATIADO, get_snapshot())
+    op = _ultima_aberta(perp)
+    assert op["execucao_entrada"]["parcial"]
+    assert op["qty_perpetuo"] == round(antes_perp - posicao(perp), 8)
+    assert op["qty_futuro"] == round(posicao(fut) - antes_fut, 8)
+    assert 0 < op["qty_futuro"] < op["qty_perpetuo"]
+
+    # saida interrompida: a operacao segue aberta com o que falta fechar
+    with pytest.raises(ErroExecucao):
+        fechar_operacao(cliente_falho(perp, aceitas=1), op, get_snapshot())
+    op = _operacao(op["id"])
+    assert op["status"] == "aberta"
+    assert op["saidas_parciais"]
+    assert op["qty_perpetuo"] == round(antes_perp - posicao(perp), 8)
+    assert op["qty_futuro"] == round(posicao(fut) - antes_fut, 8)
+
+    fechar_operacao(client, op, get_snapshot())
+    assert _operacao(op["id"])["status"] == "fechada"
+    assert (posicao(perp), posicao(fut)) == (antes_perp, antes_fut)
+
+
+def test_fechamento_em_lote_envia_uma_ordem_por_simbolo(client, fake, posicao):
+    perp, fut = _par("XRPUSDT")
+    antes = posicao(perp), posicao(fut)
+    ops = [abrir_operacao(client, perp, fut, VOLUME, get_snapshot()) for _ in range(3)]
+
+    ordens = len(fake.ordens)
+    fechadas, falhas = fechar_operacoes(client, ops, get_snapshot())
+    assert len(fake.ordens) - ordens == 2
+    assert not falhas
+    assert sorted(op["id"] for op in fechadas) == sorted(op["id"] for op in ops)
+    assert (posicao(perp), posicao(fut)) == antes
+
+
+def test_fechamento_em_lote_fecha_os_simbolos_executados(client, cliente_falho, posicao):
+    (perp_a, fut_a), (perp_b, fut_b) = _par("XRPUSDT"), _par("ADAUSDT")
+    antes_a = posicao(perp_a), posicao(fut_a)
+    antes_perp_b, antes_fut_b = posicao(perp_b), posicao(fut_b)
+    ops_a = [abrir_operacao(client, perp_a, fut_a, VOLUME, get_snapshot()) for _ in range(2)]
+    op_b = abrir_operacao(client, perp_b, fut_b, VOLUME, get_snapshot())
+    qty_fut_b = round(posicao(fut_b) - antes_fut_b, 8)
+
+    fechadas, falhas = fechar_operacoes(cliente_falho(fut_b), ops_a + [op_b], get_snapshot())
+    assert sorted(op["id"] for op in fechadas) == sorted(op["id"] for op in ops_a)
+    assert [op["id"] for op, _ in falhas] == [op_b["id"]]
+    assert (posicao(perp_a), posicao(fut_a)) == antes_a
+
+    # o perpetuo de B foi recomprado; so o trimestral continua na operacao
+    op_b = _operacao(op_b["id"])
+    assert op_b["status"] == "aberta"
+    assert (op_b["qty_perpetuo"], op_b["qty_futuro"]) == (0.0, qty_fut_b)
+    assert posicao(perp_b) == antes_perp_b
+
+
+def test_rolagem_parcial_registra_o_contrato_vendido(client, cliente_falho, posicao):
+    perp, fut = _par("BNBUSDT")
+    novo = get_next_quarter_symbol(perp)
+    antes_fut, antes_novo = posicao(fut), posicao(novo)
+    op = abrir_operacao(client, perp, fut, VOLUME, get_snapshot())
+
+    # o contrato atual e vendido e a compra do novo e recusada
+    with pytest.raises(ErroExecucao):
+        rolar_operacao(cliente_falho(novo), op, novo, get_snapshot())
+    op = _operacao(op["id"])
+    assert op["symbol_futuro"] == fut
+    assert op["qty_futuro"] == 0.0
+    assert op["rolagens_parciais"][-1]["qty_comprada"] == 0.0
+    assert (posicao(fut), posicao(novo)) == (antes_fut, antes_novo)
+
+    # nova tentativa: so falta comprar o contrato novo
+    rolada = rolar_operacao(client, op, novo, get_snapshot())
+    assert rolada["symbol_futuro"] == novo
+    assert rolada["qty_futuro"] is None
+    preco_novo = get_snapshot().par(perp, novo)[1]
+    assert round(posicao(novo) - antes_novo, 8) == calcular_qty(op["volume_usd"], preco_novo, novo)
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from metadados import registro
+from pnl_engine import calcular_pnl_operacoes
+from pnl_materializado import PnlMaterializado
+from operacoes_store import OperacoesStore
+from precos import get_snapshot
+
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+CAMPOS = ["n_funding", "pnl_funding", "pnl_basis", "pnl_rolagem", "taxa_abertura", "taxa_rolagem", "pnl_total"]
+
+
+def _data(dias_atras):
+    return (datetime.now(timezone.utc) - timedelta(days=dias_atras)).strftime(FORMATO_DATA)
+
+
+@pytest.fixture
+def loja(tmp_path):
+    loja = OperacoesStore(str(tmp_path / "operacoes.db"), str(tmp_path / "operacoes.json"))
+    base = {"volume_usd": 1000.0, "preco_entrada_perp": 100.0, "preco_entrada_futuro": 102.0}
+    for perp in ("BTCUSDT", "ETHUSDT"):
+        fut = registro.contrato(perp, "CURRENT_QUARTER")
+        loja.inserir({**base, "symbol_perpetuo": perp, "symbol_futuro": fut, "status": "fechada",
+                      "data_entrada": _data(10), "data_saida": _data(2),
+                      "preco_saida_perp": 101.0, "preco_saida_futuro": 102.5})
+        loja.inserir({**base, "symbol_perpetuo": perp, "symbol_futuro": fut, "status": "fechada",
+                      "data_entrada": _data(20), "data_saida": _data(3),
+                      "preco_saida_perp": 99.0, "preco_saida_futuro": 101.0,
+                      "symbol_futuro_anterior": fut, "preco_entrada_futuro_anterior": 100.0,
+                      "preco_saida_futuro_anterior": 103.0, "taxa_rolagem": 0.8})
+        loja.inserir({**base, "symbol_perpetuo": perp, "symbol_futuro": fut, "status": "aberta",
+                      "data_entrada": _data(5)})
+    return loja
+
+
+def test_materializado_igual_ao_motor(loja, tmp_path):
+    snapshot = get_snapshot()
+    materializado = PnlMaterializado(str(tmp_path / "pnl.db"), operacoes=loja)
+    materializado.atualizar()
+    df = materializado.ler(snapshot).set_index("id")
+    esperado = calcular_pnl_operacoes(loja.listar(), snapshot).set_index("id")
+
+    fechadas = esperado.index[esperado["status"] == "fechada"]
+    assert len(fechadas) == 4
+    assert (esperado.loc[fechadas, "n_funding"] > 0).all()
+    for campo in CAMPOS:
+        assert df.loc[fechadas, campo].to_numpy() == pytest.approx(esperado.loc[fechadas, campo].to_numpy())
+    # abertas: mesma marcacao pelo snapshot
+    abertas = esperado.index[esperado["status"] == "aberta"]
+    assert df.loc[abertas, "pnl_basis"].to_numpy() == pytest.approx(esperado.loc[abertas, "pnl_basis"].to_numpy())
+
+
+def test_materializado_reprocessa_so_operacoes_alteradas(loja, tmp_path):
+    materializado = PnlMaterializado(str(tmp_path / "pnl.db"), operacoes=loja)
+    assert materializado.atualizar()[0] == 6
+    assert materializado.atualizar()[0] == 0
+
+    aberta = loja.listar(status="aberta", symbol="BTCUSDT")[0]
+    loja.atualizar(aberta["id"], {"status": "fechada", "data_saida": _data(1),
+                                  "preco_saida_perp": 100.0, "preco_saida_futuro": 103.0})
+    assert materializado.atualizar()[0] == 1
+    linha = materializado.ler(get_snapshot()).set_index("id").loc[aberta["id"]]
+    assert linha["status"] == "fechada"
+    assert linha["pnl_basis"] == pytest.approx((103.0 - 102.0) * 10)
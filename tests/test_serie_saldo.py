@@ -0,0 +1,78 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import serie_saldo
+from serie_saldo import GravadorSaldo, arquivo_rollup, atualizar_rollups, consultar, limites, migrar_legado
+
+INICIO = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _gravar(arquivo, segundos, valor=lambda i: float(i)):
+    gravador = GravadorSaldo(arquivo)
+    for i, s in enumerate(segundos):
+        gravador.gravar({"timestamp": (INICIO + timedelta(seconds=s)).isoformat(), "total": valor(i)})
+    gravador.fechar()
+
+
+def _rollup(arquivo, rotulo):
+    caminho = arquivo_rollup(arquivo, rotulo)
+    if not os.path.exists(caminho):
+        return []
+    with open(caminho) as f:
+        return [json.loads(linha) for linha in f]
+
+
+def test_rollup_so_grava_buckets_fechados(tmp_path):
+    arquivo = str(tmp_path / "saldo.jsonl")
+    _gravar(arquivo, [0, 30, 59])
+    assert _rollup(arquivo, "1m") == []
+
+    # a primeira amostra do minuto seguinte fecha o bucket anterior
+    _gravar(arquivo, [60])
+    t0 = int(INICIO.timestamp())
+    assert _rollup(arquivo, "1m") == [{"t": t0, "min": 0.0, "max": 2.0, "ultimo": 2.0, "n": 3}]
+    assert _rollup(arquivo, "1h") == []
+
+
+def test_rollup_incremental_igual_ao_recalculado(tmp_path):
+    arquivo = str(tmp_path / "saldo.jsonl")
+    segundos = list(range(0, 3 * 86400, 37))
+    _gravar(arquivo, segundos, valor=lambda i: float((i * 7919) % 1000))
+    incremental = {rotulo: _rollup(arquivo, rotulo) for rotulo in serie_saldo.RESOLUCOES}
+    assert all(incremental.values())
+
+    for rotulo in serie_saldo.RESOLUCOES:
+        os.remove(arquivo_rollup(arquivo, rotulo))
+    atualizar_rollups(arquivo)
+    assert {rotulo: _rollup(arquivo, rotulo) for rotulo in serie_saldo.RESOLUCOES} == incremental
+
+
+def test_consulta_reduzida_preserva_extremos(tmp_path):
+    arquivo = str(tmp_path / "saldo.jsonl")
+    valores = [1000.0 + (i % 50) for i in range(20000)]
+    valores[12345] = 5000.0
+    valores[777] = 10.0
+    _gravar(arquivo, [i * 10 for i in range(len(valores))], valor=lambda i: valores[i])
+
+    inicio, fim = limites(arquivo)
+    serie, resolucao = consultar(inicio + 3600, fim, pontos=200, arquivo=arquivo)
+    assert resolucao != "bruto"
+    assert len(serie) <= 2 * 200
+    totais = [total for _, total in serie]
+    assert max(totais) == 5000.0
+    assert min(totais) == min(valores[360:])
+    assert all(ts >= inicio + 3600 for ts, _ in serie)
+
+
+def test_leitura_nao_migra_o_legado(tmp_path):
+    arquivo = str(tmp_path / "saldo.jsonl")
+    legado = str(tmp_path / "saldo.json")
+    with open(legado, "w") as f:
+        json.dump([{"timestamp": INICIO.isoformat(), "total": 1.0}], f)
+    assert limites(arquivo) is None
+    assert consultar(0, 2e9, arquivo=arquivo) == ([], "bruto")
+    assert not os.path.exists(arquivo)
+
+    assert migrar_legado(arquivo, legado) == 1
+    assert limites(arquivo) == (INICIO.timestamp(), INICIO.timestamp())
@@ -0,0 +1,220 @@
+import argparse
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+from agendador import orcamento
+from binance_rest import criar_client
+from metricas import iniciar_servidor
+from metadados import registro
+from precos import get_snapshot
+from operacoes import abrir_operacao, fechar_operacao, fechar_operacoes, rolar_operacao, rolar_operacoes, get_next_quarter_symbol
+from operacoes_store import carregar_operacoes, publicar_estado, ler_estado, store
+from rolagem import JANELA_ROLAGEM, DIAS_LIMITE_ROLAGEM, CUSTO_MAX_ROLAGEM, planejar_rolagens, rolagens_do_plano
+
+# Daemon de trading independente do Streamlit. Avalia o gatilho de entrada
+# numa cadencia fixa, executa entradas, saidas e rolagens e publica o estado
+# no banco de operacoes. Os apps gravam a configuracao (estado "config"),
+# leem o estado publicado e enviam comandos (abrir, fechar, fechar_lote, rolar, rolar_lote)
+# pela fila.
+
+CADENCIA_PADRAO = int(os.getenv("DAEMON_CADENCIA", 60))  # segundos entre avaliacoes
+INTERVALO_COMANDOS = 1  # segundos entre leituras da fila de comandos
+
+CONFIG_PADRAO = {
+    "modo_auto": False,
+    "volume": 100.0,
+    "simbolos": ["BTCUSDT", "ETHUSDT"],
+    "max_abertas_por_simbolo": 1,
+    "limiar_saida": 0.0,  # fecha quando o funding diario fica abaixo deste valor
+    "dias_rolagem": DIAS_LIMITE_ROLAGEM,  # rola quando faltam menos dias que isso para o vencimento
+    "janela_rolagem": JANELA_ROLAGEM,  # dias antes do vencimento em que a rolagem pode ser antecipada
+    "custo_max_rolagem": CUSTO_MAX_ROLAGEM,  # custo anualizado do spread que antecipa a rolagem
+}
+
+log = logging.getLogger("trader_daemon")
+
+
+def ler_config():
+    config, _ = ler_estado("config", {})
+    return {**CONFIG_PADRAO, **config}
+
+
+def salvar_config(**campos):
+    publicar_estado("config", {**ler_config(), **campos})
+
+
+def plano_rolagem(abertas, snapshot, config=None):
+    config = config or ler_config()
+    return planejar_rolagens(abertas, snapshot, config["janela_rolagem"], config["dias_rolagem"],
+                             config["custo_max_rolagem"])
+
+
+def daemon_ativo(tolerancia=3):
+    # True se o daemon publicou heartbeat dentro de `tolerancia` cadencias
+    heartbeat, atualizado_em = ler_estado("heartbeat")
+    if not heartbeat or atualizado_em is None:
+        return False
+    return time.time() - atualizado_em < tolerancia * heartbeat.get("cadencia", CADENCIA_PADRAO)
+
+
+class TraderDaemon:
+    def __init__(self, client, cadencia=CADENCIA_PADRAO):
+        self.client = client
+        self.cadencia = cadencia
+        self.ultima_avaliacao = 0.0
+
+    # Comandos
+
+    def _operacao(self, op_id):
+        for op in carregar_operacoes(status="aberta"):
+            if op["id"] == op_id:
+                return op
+        raise KeyError(f"Operação aberta {op_id} não encontrada")
+
+    def executar_comando(self, comando, parametros):
+        snapshot = get_snapshot(idade_maxima=0)
+        if comando == "abrir":
+            perp = parametros["symbol_perpetuo"]
+            futuro = parametros.get("symbol_futuro") or registro.contrato(perp, "CURRENT_QUARTER")
+            op = abrir_operacao(self.client, perp, futuro, parametros.get("volume", ler_config()["volume"]), snapshot)
+            return {"id": op["id"]}
+        if comando == "fechar":
+            fechar_operacao(self.client, self._operacao(parametros["id"]), snapshot)
+            return "ok"
+        if comando == "fechar_lote":
+            # uma ordem por simbolo para todas as operacoes pedidas (ids ausentes: todas as abertas)
+            abertas = carregar_operacoes(status="aberta")
+            ids = set(parametros["ids"]) if parametros.get("ids") is not None else {op["id"] for op in abertas}
+            fechadas, falhas = fechar_operacoes(self.client, [op for op in abertas if op["id"] in ids], snapshot)
+            return {"fechadas": [op["id"] for op in fechadas], "falhas": {o["id"]: str(e) for o, e in falhas}}
+        if comando == "rolar":
+            op = self._operacao(parametros["id"])
+            novo = parametros.get("symbol_futuro") or get_next_quarter_symbol(op["symbol_perpetuo"])
+            rolar_operacao(self.client, op, novo, snapshot)
+            return {"symbol_futuro": novo}
+        if comando == "rolar_lote":
+            # ids ausentes: todas as operacoes que o plano atual manda rolar
+            abertas = carregar_operacoes(status="aberta")
+            if parametros.get("ids") is None:
+                rolagens = rolagens_do_plano(plano_rolagem(abertas, snapshot), abertas)
+            else:
+                # operacoes que ja estao no proximo trimestral ficam de fora, como no plano
+                ids = set(parametros["ids"])
+                rolagens = [(op, get_next_quarter_symbol(op["symbol_perpetuo"])) for op in abertas if op["id"] in ids]
+                rolagens = [(op, novo) for op, novo in rolagens if novo and novo != op["symbol_futuro"]]
+            roladas, falhas = rolar_operacoes(self.client, rolagens, snapshot)
+            return {"roladas": [op["id"] for op in roladas], "falhas": {o["id"]: str(e) for o, e in falhas}}
+        raise ValueError(f"Comando desconhecido: {comando}")
+
+    def processar_comandos(self):
+        for cmd in store.comandos_pendentes():
+            try:
+                resultado = {"ok": True, "resultado": self.executar_comando(cmd["comando"], cmd["parametros"])}
+            except Exception as e:
+                log.exception("Erro no comando %s", cmd)
+                resultado = {"ok": False, "erro": str(e)}
+            store.concluir_comando(cmd["id"], resultado)
+
+    # Avaliacao do mercado
+
+    def avaliar(self):
+        # o scanner (pandas) so e importado aqui: as paginas importam este modulo
+        # apenas para a configuracao, o heartbeat e o plano de rolagem
+        from scanner import escanear
+
+        config = ler_config()
+        snapshot = get_snapshot(idade_maxima=0)
+        avaliacao = escanear(snapshot, ("CURRENT_QUARTER",), perps=set(config["simbolos"]))
+        publicar_estado("avaliacao", avaliacao.to_dict("records"))
+
+        abertas = carregar_operacoes(status="aberta")
+        plano = plano_rolagem(abertas, snapshot, config)
+        publicar_estado("plano_rolagem", plano)
+
+        acoes = []
+        if config["modo_auto"]:
+            acoes += self._rolar_vencendo(abertas, plano, snapshot)
+            abertas = carregar_operacoes(status="aberta")
+            acoes += self._fechar_sem_funding(abertas, avaliacao, config, snapshot)
+            acoes += self._entrar(carregar_operacoes(status="aberta"), avaliacao, config, snapshot)
+        if acoes:
+            publicar_estado("ultimas_acoes", acoes)
+        self.ultima_avaliacao = time.time()
+
+    def _rolar_vencendo(self, abertas, plano, snapshot):
+        rolagens = rolagens_do_plano(plano, abertas)
+        if not rolagens:
+            return []
+        try:
+            roladas, falhas = rolar_operacoes(self.client, rolagens, snapshot)
+        except Exception as e:
+            log.exception("Erro ao gravar o lote de rolagens")
+            return [{"acao": "rolar", "id": op["id"], "erro": str(e)} for op, _ in rolagens]
+        for op, erro in falhas:
+            log.error("Erro ao rolar operação %s: %s", op["id"], erro)
+        return ([{"acao": "rolar", "id": op["id"], "symbol_futuro": op["symbol_futuro"]} for op in roladas]
+                + [{"acao": "rolar", "id": op["id"], "erro": str(erro)} for op, erro in falhas])
+
+    def _fechar_sem_funding(self, abertas, avaliacao, config, snapshot):
+        funding = dict(zip(avaliacao["perpetuo"], avaliacao["funding_diario"]))
+        saida = [op for op in abertas
+                 if op["symbol_perpetuo"] in funding and funding[op["symbol_perpetuo"]] < config["limiar_saida"]]
+        if not saida:
+            return []
+        try:
+            fechadas, falhas = fechar_operacoes(self.client, saida, snapshot)
+        except Exception as e:
+            log.exception("Erro ao gravar o lote de fechamentos")
+            return [{"acao": "fechar", "id": op["id"], "erro": str(e)} for op in saida]
+        for op, erro in falhas:
+            log.error("Erro ao fechar operação %s: %s", op["id"], erro)
+        return ([{"acao": "fechar", "id": op["id"]} for op in fechadas]
+                + [{"acao": "fechar", "id": op["id"], "erro": str(erro)} for op, erro in falhas])
+
+    def _entrar(self, abertas, avaliacao, config, snapshot):
+        acoes = []
+        for linha in avaliacao[avaliacao["gatilho"]].itertuples():
+            if sum(op["symbol_perpetuo"] == linha.perpetuo for op in abertas) >= config["max_abertas_por_simbolo"]:
+                continue
+            try:
+                op = abrir_operacao(self.client, linha.perpetuo, linha.futuro, config["volume"], snapshot)
+                acoes.append({"acao": "abrir", "id": op["id"], "symbol_perpetuo": linha.perpetuo})
+            except Exception as e:
+                log.exception("Erro ao abrir operação em %s", linha.perpetuo)
+                acoes.append({"acao": "abrir", "symbol_perpetuo": linha.perpetuo, "erro": str(e)})
+        return acoes
+
+    # Loop principal
+
+    def rodar(self):
+        log.info("Daemon iniciado (cadência %ss)", self.cadencia)
+        while True:
+            self.processar_comandos()
+            if time.time() - self.ultima_avaliacao >= self.cadencia:
+                try:
+                    self.avaliar()
+                except Exception:
+                    log.exception("Erro na avaliação do mercado")
+                    self.ultima_avaliacao = time.time()
+            publicar_estado("heartbeat", {
+                "pid": os.getpid(),
+                "cadencia": self.cadencia,
+                "ultima_avaliacao": self.ultima_avaliacao,
+                "orcamento_api": orcamento(),
+            })
+            time.sleep(INTERVALO_COMANDOS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daemon de trading BasisHunter")
+    parser.add_argument("--cadencia", type=int, default=CADENCIA_PADRAO, help="segundos entre avaliações")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    load_dotenv()
+    iniciar_servidor()
+    client = criar_client(os.getenv("BINANCE_API_KEY"), os.getenv("BINANCE_API_SECRET"))
+    TraderDaemon(client, args.cadencia).rodar()